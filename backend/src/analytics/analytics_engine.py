@@ -5,6 +5,9 @@ from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Any, Optional
 from ..database.db_manager import db
 from ..core.store_scope import current_store_id
+from ..core.histogram import merge_all
+from ..core import trajectory
+from ..core.zone_flows import ZoneFlows, sum_blobs as sum_flow_blobs
 from .spike_detector import SpikeDetector
 
 class EnhancedAnalyticsEngine:
@@ -28,7 +31,8 @@ class EnhancedAnalyticsEngine:
                 SELECT hour_start, SUM(footfall) as total_footfall, COUNT(DISTINCT camera_id) as cameras,
                        AVG(dwell_avg) as avg_dwell, AVG(queue_wait_avg) as avg_queue,
                        SUM(interactions) as total_interactions, SUM(unique_visitors) as total_unique,
-                       SUM(entrance_count) as total_entrance, SUM(exit_count) as total_exit
+                       SUM(entrance_count) as total_entrance, SUM(exit_count) as total_exit,
+                       SUM(dwell_sum), SUM(dwell_count), SUM(queue_wait_sum), SUM(queue_wait_count)
                 FROM hourly_metrics
                 WHERE store_id=? AND hour_start BETWEEN ? AND ?
                 GROUP BY hour_start
@@ -40,6 +44,10 @@ class EnhancedAnalyticsEngine:
             if not hourly_data:
                 return self._create_empty_metrics(target_date)
             
+            # Whole-visit dwell and queue-wait histograms of all cameras, merged
+            dwell_hist = merge_all(self._histogram_blobs(c, "dwell", start, end))
+            queue_hist = merge_all(self._histogram_blobs(c, "queue_wait", start, end))
+            
             # Calculate aggregated metrics
             total_footfall = sum(row[1] for row in hourly_data if row[1])
             total_unique_visitors = sum(row[6] for row in hourly_data if row[6])
@@ -54,6 +62,22 @@ class EnhancedAnalyticsEngine:
             dwell_avg = float(np.mean(dwell_values)) if dwell_values else 0.0
             dwell_p95 = float(np.percentile(dwell_values, 95)) if dwell_values else 0.0
             queue_avg = float(np.mean(queue_values)) if queue_values else 0.0
+            queue_p95 = float(np.percentile(queue_values, 95)) if queue_values else 0.0
+            
+            # Prefer visit-weighted averages and merged-histogram percentiles; the hourly
+            # averages above only remain for hours recorded before the sums and histograms
+            dwell_sum = sum(row[9] or 0 for row in hourly_data)
+            dwell_count = sum(row[10] or 0 for row in hourly_data)
+            queue_sum = sum(row[11] or 0 for row in hourly_data)
+            queue_count = sum(row[12] or 0 for row in hourly_data)
+            if dwell_count:
+                dwell_avg = dwell_sum / dwell_count
+            if queue_count:
+                queue_avg = queue_sum / queue_count
+            if dwell_hist.count:
+                dwell_p95 = dwell_hist.quantile(0.95)
+            if queue_hist.count:
+                queue_p95 = queue_hist.quantile(0.95)
             
             # Find peak hour
             peak_hour = None
@@ -73,32 +97,34 @@ class EnhancedAnalyticsEngine:
             c.execute("""
                 INSERT INTO daily_store_metrics 
                 (store_id, date, total_footfall, unique_visitors, dwell_avg, dwell_p95,
-                 queue_wait_avg, interactions, peak_hour, peak_footfall, conversion_rate, avg_visit_duration)
-                VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+                 queue_wait_avg, queue_wait_p95, interactions, peak_hour, peak_footfall, conversion_rate,
+                 avg_visit_duration)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
                 ON CONFLICT(store_id,date) DO UPDATE SET 
                     total_footfall=excluded.total_footfall,
                     unique_visitors=excluded.unique_visitors,
                     dwell_avg=excluded.dwell_avg,
                     dwell_p95=excluded.dwell_p95,
                     queue_wait_avg=excluded.queue_wait_avg,
+                    queue_wait_p95=excluded.queue_wait_p95,
                     interactions=excluded.interactions,
                     peak_hour=excluded.peak_hour,
                     peak_footfall=excluded.peak_footfall,
                     conversion_rate=excluded.conversion_rate,
                     avg_visit_duration=excluded.avg_visit_duration
             """, (self.store_id, target_date, total_footfall, total_unique_visitors,
-                  dwell_avg, dwell_p95, queue_avg, total_interactions,
+                  dwell_avg, dwell_p95, queue_avg, queue_p95, total_interactions,
                   peak_hour, peak_footfall, conversion_rate, avg_visit_duration))
             
             conn.commit()
-            
-            # Detect and log anomalies
-            self._detect_daily_anomalies(target_date, {
-                'footfall': total_footfall,
-                'interactions': total_interactions,
-                'dwell_avg': dwell_avg,
-                'conversion_rate': conversion_rate
-            })
+        
+        # Detect and log anomalies (takes the db lock itself)
+        self._detect_daily_anomalies(target_date, {
+            'footfall': total_footfall,
+            'interactions': total_interactions,
+            'dwell_avg': dwell_avg,
+            'conversion_rate': conversion_rate
+        })
         
         return {
             "store_id": self.store_id,
@@ -108,6 +134,7 @@ class EnhancedAnalyticsEngine:
             "dwell_avg": dwell_avg,
             "dwell_p95": dwell_p95,
             "queue_wait_avg": queue_avg,
+            "queue_wait_p95": queue_p95,
             "interactions": total_interactions,
             "peak_hour": peak_hour,
             "peak_footfall": peak_footfall,
@@ -115,6 +142,72 @@ class EnhancedAnalyticsEngine:
             "avg_visit_duration": avg_visit_duration
         }
     
+    def _histogram_blobs(self, c, metric: str, start: str, end: str,
+                         camera_id: Optional[int] = None, zone_id: str = "") -> List[bytes]:
+        sql = """SELECT hist FROM duration_histograms
+                 WHERE store_id=? AND metric=? AND hour_start BETWEEN ? AND ? AND zone_id=?"""
+        params = [self.store_id, metric, start, end, zone_id]
+        if camera_id is not None:
+            sql += " AND camera_id=?"
+            params.append(camera_id)
+        c.execute(sql, params)
+        return [r[0] for r in c.fetchall()]
+    
+    def get_duration_distribution(self, start: str, end: str, metric: str = "dwell",
+                                  camera_id: Optional[int] = None, zone_id: str = "") -> Dict[str, Any]:
+        """Percentiles of dwell or queue wait over any range, camera and zone ('' = whole visit)
+        by merging the hourly histograms"""
+        with db.transaction() as conn:
+            blobs = self._histogram_blobs(conn.cursor(), metric, start, end, camera_id, zone_id)
+        hist = merge_all(blobs)
+        return {
+            "metric": metric, "start": start, "end": end,
+            "camera_id": camera_id, "zone_id": zone_id or None,
+            **hist.summary((0.5, 0.75, 0.9, 0.95, 0.99))
+        }
+    
+    def _zone_flows(self, start: str, end: str, camera_id: Optional[int] = None) -> ZoneFlows:
+        sql = "SELECT tracks, flows FROM zone_flows WHERE store_id=? AND hour_start BETWEEN ? AND ?"
+        params = [self.store_id, start, end]
+        if camera_id is not None:
+            sql += " AND camera_id=?"
+            params.append(camera_id)
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            rows = c.fetchall()
+        flows = sum_flow_blobs(r[1] for r in rows)
+        flows.tracks = sum(r[0] or 0 for r in rows)
+        return flows
+    
+    def get_zone_flows(self, start: str, end: str, camera_id: Optional[int] = None,
+                       top: int = 20) -> Dict[str, Any]:
+        """Zone transition and co-visit matrices summed over the hourly rows of a range.
+        
+        Zones of different cameras with the same name are counted as one zone.
+        """
+        flows = self._zone_flows(start, end, camera_id)
+        t = flows.transitions
+        order = np.argsort(t, axis=None)[::-1][:top]
+        top_transitions = [{"from": flows.zones[i], "to": flows.zones[j], "count": int(t[i, j])}
+                           for i, j in zip(*np.unravel_index(order, t.shape)) if t[i, j] > 0]
+        return {
+            "start": start, "end": end, "camera_id": camera_id,
+            "tracks": flows.tracks,
+            "zones": flows.zones,
+            "visits": np.diagonal(flows.covisits).tolist(),
+            "transitions": t.tolist(),
+            "covisits": flows.symmetric_covisits().tolist(),
+            "top_transitions": top_transitions
+        }
+    
+    def get_zone_funnel(self, start: str, end: str, steps: List[str],
+                        camera_id: Optional[int] = None) -> Dict[str, Any]:
+        """Tracks reaching each zone of an ordered funnel, e.g. entrance -> shelf -> checkout"""
+        flows = self._zone_flows(start, end, camera_id)
+        return {"start": start, "end": end, "camera_id": camera_id, "steps": flows.funnel(steps),
+                "exact": len(steps) <= 2}
+    
     def _create_empty_metrics(self, target_date: str) -> Dict[str, Any]:
         """Create empty metrics for days with no data"""
         return {
@@ -125,6 +218,7 @@ class EnhancedAnalyticsEngine:
             "dwell_avg": 0.0,
             "dwell_p95": 0.0,
             "queue_wait_avg": 0.0,
+            "queue_wait_p95": 0.0,
             "interactions": 0,
             "peak_hour": None,
             "peak_footfall": 0,
@@ -306,13 +400,310 @@ class EnhancedAnalyticsEngine:
                     "peak_hourly": max(counts),
                     "utilization_rate": (len([c for c in counts if c > 0]) / max(total_hours, 1)) * 100
                 }
+        
+        # Dwell from presence intervals
+        dwell_stats = self.get_zone_dwell_stats(camera_id, start_date.isoformat(), end_date.isoformat())
+        for zone_name, dwell in dwell_stats.items():
+            zone_stats.setdefault(zone_name, {}).update({
+                "dwell_visits": dwell["visits"],
+                "avg_dwell": dwell["dwell_avg"],
+                "dwell_p95": dwell["dwell_p95"]
+            })
+        
+        return {
+            "camera_id": camera_id,
+            "analysis_period": {"start": start_date.strftime("%Y-%m-%d"), "end": end_date.strftime("%Y-%m-%d")},
+            "total_hours_analyzed": total_hours,
+            "zone_performance": zone_stats
+        }
+    
+    def _presence_intervals(self, camera_id: int, start: str, end: str) -> List[tuple]:
+        """(zone, start_dt, end_dt) of presence intervals overlapping [start, end]"""
+        # start_ts/end_ts are UTC ISO strings, so the bounds must be UTC to compare as text
+        start_dt = _parse_ts(start).astimezone(timezone.utc)
+        end_dt = _parse_ts(end).astimezone(timezone.utc)
+        with db.transaction() as conn:
+            c = conn.cursor()
+            # A single stay never lasts a day, which bounds the index range scan
+            c.execute("""
+                SELECT zone_id, start_ts, end_ts
+                FROM zone_presence
+                WHERE store_id = ? AND camera_id = ? AND start_ts BETWEEN ? AND ? AND end_ts >= ?
+            """, (self.store_id, camera_id, (start_dt - timedelta(days=1)).isoformat(),
+                  end_dt.isoformat(), start_dt.isoformat()))
+            rows = c.fetchall()
+        
+        return [(zone, _parse_ts(s), _parse_ts(e)) for zone, s, e in rows]
+    
+    def _minute_rows(self, camera_id: Optional[int], start: str, end: str,
+                     zone_id: Optional[str] = None) -> List[tuple]:
+        """minute_metrics rows (minute, zone, camera, MINUTE_FIELDS..., dwell_hist) in [start, end]"""
+        sql = f"""SELECT minute_start, zone_id, camera_id, {", ".join(MINUTE_FIELDS)}, dwell_hist
+                  FROM minute_metrics WHERE store_id=? AND minute_start BETWEEN ? AND ?"""
+        params = [self.store_id, _minute_bound(start), _minute_bound(end)]
+        if camera_id is not None:
+            sql += " AND camera_id=?"
+            params.append(camera_id)
+        if zone_id is not None:
+            sql += " AND zone_id=?"
+            params.append(zone_id)
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute(sql + " ORDER BY minute_start", params)
+            return c.fetchall()
+    
+    def get_minute_series(self, start: str, end: str, camera_id: Optional[int] = None,
+                          zone_id: str = "") -> Dict[str, Any]:
+        """Per-minute counters from edge rollups, summed over cameras unless one is given"""
+        minutes = {}
+        for row in self._minute_rows(camera_id, start, end, zone_id):
+            m = minutes.setdefault(row[0], {name: 0 for name in MINUTE_FIELDS})
+            for name, value in zip(MINUTE_FIELDS, row[3:-1]):
+                if name == "occupancy_max":
+                    m[name] = max(m[name], value or 0)
+                else:
+                    m[name] += value or 0
+        series = []
+        for minute, m in sorted(minutes.items()):
+            series.append({
+                "minute": minute,
+                "entries": m["entries"], "exits": m["exits"],
+                "occupancy_avg": m["occupancy_sum"] / m["occupancy_samples"] if m["occupancy_samples"] else 0.0,
+                "occupancy_max": m["occupancy_max"], "interactions": m["interactions"],
+                "queue_joins": m["queue_joins"], "queue_leaves": m["queue_leaves"],
+                "queue_wait_avg": m["queue_wait_sum"] / m["queue_wait_count"] if m["queue_wait_count"] else 0.0,
+                "dwell_count": m["dwell_count"],
+                "dwell_avg": m["dwell_sum"] / m["dwell_count"] if m["dwell_count"] else 0.0
+            })
+        return {"start": start, "end": end, "camera_id": camera_id, "zone_id": zone_id or None, "minutes": series}
+    
+    def get_zone_dwell_stats(self, camera_id: int, start: str, end: str) -> Dict[str, Dict[str, float]]:
+        """Per-zone visits and dwell (seconds) in [start, end]: from minute rollups when the
+        camera ships them, otherwise from presence intervals starting in the range"""
+        rollups = [row for row in self._minute_rows(camera_id, start, end) if row[1]]
+        if rollups:
+            hists, sums = {}, {}
+            for row in rollups:
+                if row[-1]:
+                    hists.setdefault(row[1], []).append(row[-1])
+                    sums[row[1]] = sums.get(row[1], 0.0) + (row[3 + MINUTE_FIELDS.index("dwell_sum")] or 0.0)
+            out = {}
+            for zone, blobs in hists.items():
+                hist = merge_all(blobs)
+                out[zone] = {
+                    "visits": hist.count,
+                    "dwell_avg": sums[zone] / hist.count if hist.count else 0.0,
+                    "dwell_p95": hist.quantile(0.95),
+                    "total_dwell": sums[zone]
+                }
+            return out
+        
+        start_dt, end_dt = _parse_ts(start), _parse_ts(end)
+        durations = {}
+        for zone, s, e in self._presence_intervals(camera_id, start, end):
+            if start_dt <= s <= end_dt:
+                durations.setdefault(zone, []).append((e - s).total_seconds())
+        
+        return {
+            zone: {
+                "visits": len(values),
+                "dwell_avg": float(np.mean(values)),
+                "dwell_p95": float(np.percentile(values, 95)),
+                "total_dwell": float(np.sum(values))
+            }
+            for zone, values in durations.items()
+        }
+    
+    def get_zone_occupancy(self, camera_id: int, start: str, end: str) -> Dict[str, Any]:
+        """Hourly average and peak concurrent occupancy per zone, from minute rollups when
+        the camera ships them and from presence intervals otherwise"""
+        rollups = [row for row in self._minute_rows(camera_id, start, end) if row[1]]
+        if rollups:
+            return {"camera_id": camera_id, "start": start, "end": end,
+                    "zones": _occupancy_from_minutes(rollups)}
+        
+        start_dt, end_dt = _parse_ts(start), _parse_ts(end)
+        hourly = {}   # zone -> hour -> person-seconds
+        edges = {}    # zone -> [(ts, +1/-1)]
+        
+        for zone, s, e in self._presence_intervals(camera_id, start, end):
+            s, e = max(s, start_dt), min(e, end_dt)
+            if e < s:
+                continue
+            edges.setdefault(zone, []).extend([(s, 1), (e, -1)])
             
-            return {
-                "camera_id": camera_id,
-                "analysis_period": {"start": start_date.strftime("%Y-%m-%d"), "end": end_date.strftime("%Y-%m-%d")},
-                "total_hours_analyzed": total_hours,
-                "zone_performance": zone_stats
+            # Spread the overlap over hour buckets
+            cursor = s
+            while cursor < e:
+                hour = cursor.replace(minute=0, second=0, microsecond=0)
+                step_end = min(e, hour + timedelta(hours=1))
+                key = hour.strftime("%Y-%m-%dT%H:00:00")
+                zone_hours = hourly.setdefault(zone, {})
+                zone_hours[key] = zone_hours.get(key, 0.0) + (step_end - cursor).total_seconds()
+                cursor = step_end
+        
+        occupancy = {}
+        for zone, zone_edges in edges.items():
+            # Sweep line; exits sort before entries at the same instant
+            peak, peak_at, current = 0, None, 0
+            for ts, delta in sorted(zone_edges, key=lambda x: (x[0], x[1])):
+                current += delta
+                if current > peak:
+                    peak, peak_at = current, ts.isoformat()
+            occupancy[zone] = {
+                "hourly_avg_occupancy": {h: secs / 3600.0 for h, secs in sorted(hourly.get(zone, {}).items())},
+                "peak_occupancy": peak,
+                "peak_at": peak_at
             }
+        
+        return {"camera_id": camera_id, "start": start, "end": end, "zones": occupancy}
+    
+    def get_store_occupancy(self, target_date: str = None) -> Dict[str, Any]:
+        """People in the store as cumulative tripwire entrances minus exits since midnight.
+        
+        Only cameras with tripwire zones count; their entrance/exit counters come from
+        directed line crossings, so in and out balance over a day.
+        """
+        if not target_date:
+            target_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("""
+                SELECT hour_start, SUM(entrance_count), SUM(exit_count)
+                FROM hourly_metrics
+                WHERE store_id=? AND hour_start BETWEEN ? AND ?
+                  AND camera_id IN (SELECT DISTINCT camera_id FROM zones WHERE store_id=? AND ztype='tripwire')
+                GROUP BY hour_start
+                ORDER BY hour_start
+            """, (self.store_id, f"{target_date}T00:00:00", f"{target_date}T23:59:59", self.store_id))
+            rows = c.fetchall()
+        
+        entered = exited = 0
+        hourly = []
+        for hour, ins, outs in rows:
+            entered += ins or 0
+            exited += outs or 0
+            hourly.append({"hour": hour, "in": ins or 0, "out": outs or 0, "occupancy": max(entered - exited, 0)})
+        return {
+            "date": target_date,
+            "entered": entered,
+            "exited": exited,
+            "occupancy": max(entered - exited, 0),
+            "hourly": hourly
+        }
+    
+    def get_store_visitors(self, target_date: str = None) -> Dict[str, Any]:
+        """Unique visitors across all cameras from re-identified tracks (ENABLE_REID).
+        
+        Tracks matched to the same store-level person_uuid count once; tracks without an
+        embedding or not yet matched are reported separately instead of being guessed.
+        """
+        if not target_date:
+            target_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("""
+                SELECT COUNT(DISTINCT person_uuid), COUNT(person_uuid), COUNT(*),
+                       COUNT(DISTINCT camera_id)
+                FROM track_sessions
+                WHERE store_id=? AND entry_time BETWEEN ? AND ?
+            """, (self.store_id, f"{target_date}T00:00:00", f"{target_date}T23:59:59"))
+            people, matched, tracks, cameras = c.fetchone()
+            c.execute("""
+                SELECT n, COUNT(*) FROM
+                  (SELECT person_uuid, COUNT(DISTINCT camera_id) n FROM track_sessions
+                   WHERE store_id=? AND entry_time BETWEEN ? AND ? AND person_uuid IS NOT NULL
+                   GROUP BY person_uuid)
+                GROUP BY n ORDER BY n
+            """, (self.store_id, f"{target_date}T00:00:00", f"{target_date}T23:59:59"))
+            spread = {str(n): k for n, k in c.fetchall()}
+        return {
+            "date": target_date,
+            "unique_visitors": people,
+            "matched_tracks": matched,
+            "unmatched_tracks": tracks - matched,
+            "cameras": cameras,
+            "visitors_by_camera_count": spread
+        }
+    
+    def get_track_paths(self, start: str, end: str, camera_id: Optional[int] = None,
+                        limit: int = 1000) -> Dict[str, Any]:
+        """Decoded trajectories of visits overlapping [start, end]; t is seconds from entry.
+        
+        Track ids are strings: they are 63-bit and would lose precision as JSON numbers.
+        """
+        tracks = []
+        for cam, track_id, entry, exit_, blob in _path_sessions(self.store_id, start, end, camera_id, limit):
+            w, h = trajectory.frame_size(blob)
+            tracks.append({
+                "camera_id": cam, "track_id": str(track_id), "entry_time": entry, "exit_time": exit_,
+                "frame": {"width": w, "height": h},
+                "points": np.round(trajectory.decode(blob), 1).tolist()
+            })
+        return {"start": start, "end": end, "camera_id": camera_id, "tracks": tracks}
+    
+    def get_path_arrays(self, start: str, end: str, camera_id: Optional[int] = None,
+                        limit: int = 100000) -> Dict[str, Any]:
+        """All trajectories of a window as numpy arrays for path analytics.
+        
+        Path k (sessions[k]) is points[offsets[k]:offsets[k + 1]], an (n, 3) array of
+        (seconds from entry, x, y).
+        """
+        rows = _path_sessions(self.store_id, start, end, camera_id, limit)
+        points, offsets = trajectory.decode_many(r[4] for r in rows)
+        return {"sessions": [r[:4] for r in rows], "points": points, "offsets": offsets}
+
+MINUTE_FIELDS = ["entries", "exits", "occupancy_samples", "occupancy_sum", "occupancy_max",
+                 "interactions", "queue_joins", "queue_leaves", "queue_wait_sum", "queue_wait_count",
+                 "dwell_count", "dwell_sum"]
+
+def _path_sessions(store_id: str, start: str, end: str, camera_id: Optional[int], limit: int) -> List[tuple]:
+    """(camera_id, track_id, entry_time, exit_time, path) of sessions overlapping [start, end]"""
+    start_dt, end_dt = _parse_ts(start), _parse_ts(end)
+    # A single visit never lasts a day, which bounds the index range scan
+    sql = """SELECT camera_id, track_id, entry_time, exit_time, path FROM track_sessions
+             WHERE store_id=? AND entry_time BETWEEN ? AND ? AND exit_time >= ? AND path IS NOT NULL"""
+    params = [store_id, _naive_bound((start_dt - timedelta(days=1)).isoformat()), _naive_bound(end), _naive_bound(start)]
+    if camera_id is not None:
+        sql += " AND camera_id=?"
+        params.append(camera_id)
+    sql += " ORDER BY entry_time LIMIT ?"
+    params.append(limit)
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute(sql, params)
+        return c.fetchall()
+
+def _minute_bound(ts: str) -> str:
+    """ISO timestamp in the naive UTC form of minute_metrics.minute_start"""
+    return _parse_ts(ts).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+def _occupancy_from_minutes(rows: List[tuple]) -> Dict[str, Any]:
+    samples_at = 3 + MINUTE_FIELDS.index("occupancy_samples")
+    sum_at = 3 + MINUTE_FIELDS.index("occupancy_sum")
+    max_at = 3 + MINUTE_FIELDS.index("occupancy_max")
+    hourly = {}  # zone -> hour -> [occupancy sum, samples]
+    occupancy = {}
+    for row in rows:
+        minute, zone = row[0], row[1]
+        acc = hourly.setdefault(zone, {}).setdefault(minute[:13] + ":00:00", [0, 0])
+        acc[0] += row[sum_at] or 0
+        acc[1] += row[samples_at] or 0
+        z = occupancy.setdefault(zone, {"peak_occupancy": 0, "peak_at": None})
+        if (row[max_at] or 0) > z["peak_occupancy"]:
+            z["peak_occupancy"], z["peak_at"] = row[max_at], minute
+    for zone, z in occupancy.items():
+        z["hourly_avg_occupancy"] = {h: total / n if n else 0.0 for h, (total, n) in sorted(hourly[zone].items())}
+    return occupancy
+
+def _naive_bound(ts: str) -> str:
+    """ISO timestamp in the naive form of track_sessions.entry_time/exit_time"""
+    return _parse_ts(ts).astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+def _parse_ts(ts: str) -> datetime:
+    """ISO timestamp as an aware datetime; naive values are taken as UTC"""
+    dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
 
 # Maintain backward compatibility
 def recompute_daily_store_metrics(target_date: str = None):
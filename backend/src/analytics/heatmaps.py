@@ -0,0 +1,129 @@
+"""
+Floor heatmaps from the hourly occupancy grids written by processors.
+
+A heatmap sums a camera's grids over a range and is drawn over the camera's zone
+screenshot. Rendered PNGs are cached on disk under a key of range, zone version
+(screenshot and zone polygons) and data version (row count and total seconds of the
+grids), so a repeated request is a file lookup and new data or edited zones miss.
+
+Store-level floor occupancy comes from the per-camera floor grids instead. Where
+cameras overlap, a person is seen by each of them, so per cell the camera with the
+most person-seconds is taken rather than the sum.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..database.db_manager import db
+from ..core.heatmap import HeatmapGrid, sum_blobs
+from ..core.store_scope import current_store_id
+
+HEATMAP_CACHE_FILES = int(os.getenv("HEATMAP_CACHE_FILES", "256"))
+
+# blue -> cyan -> green -> yellow -> red
+_ANCHORS = np.array([[0, 0, 255], [0, 255, 255], [0, 255, 0], [255, 255, 0], [255, 0, 0]], dtype=np.float32)
+_COLORMAP = np.stack([np.interp(np.linspace(0, 4, 256), np.arange(5), _ANCHORS[:, ch]) for ch in range(3)],
+                     axis=1).astype(np.uint8)
+
+def range_bounds(start: str, end: str) -> Tuple[str, str]:
+    """hour_start bounds of a range; a date-only end covers that whole day"""
+    if len(end) == 10:
+        end += "T23:59:59"
+    return start, end
+
+def floor_occupancy(start: str, end: str) -> Optional[Dict[str, Any]]:
+    """Person-seconds per floor-plan cell over [start, end], overlapping cameras merged;
+    None without a floor plan"""
+    sid = current_store_id()
+    start, end = range_bounds(start, end)
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT width, height, cell_size FROM floor_plans WHERE store_id=?", (sid,))
+        plan = c.fetchone()
+        if not plan:
+            return None
+        c.execute("""SELECT camera_id, grid FROM floor_heatmap_grids
+                     WHERE store_id=? AND hour_start BETWEEN ? AND ? ORDER BY camera_id""", (sid, start, end))
+        rows = c.fetchall()
+    width, height, cell_size = plan
+    shape = (int(np.ceil(height / cell_size)), int(np.ceil(width / cell_size)))
+    per_camera: Dict[int, np.ndarray] = {}
+    for camera_id, blob in rows:
+        grid = HeatmapGrid.from_bytes(blob).grid
+        if grid.shape != shape:  # written before the floor plan was re-gridded
+            continue
+        per_camera[camera_id] = per_camera.get(camera_id, 0) + grid
+    merged = np.max(np.stack(list(per_camera.values())), axis=0) if per_camera else np.zeros(shape, np.float32)
+    coverage = sum((g > 0).astype(np.int32) for g in per_camera.values()) if per_camera else np.zeros(shape, np.int32)
+    return {"start": start, "end": end, "width": width, "height": height, "cell_size": cell_size,
+            "rows": shape[0], "cols": shape[1], "cameras": sorted(per_camera),
+            "seconds": np.round(merged, 1).tolist(), "cameras_per_cell": np.asarray(coverage).tolist()}
+
+def _zone_version(c, sid: str, camera_id: int) -> Tuple[str, Optional[tuple]]:
+    c.execute("SELECT file_path,img_width,img_height FROM zone_screenshots WHERE store_id=? AND camera_id=?",
+              (sid, camera_id))
+    shot = c.fetchone()
+    c.execute("SELECT id,name,ztype,polygon_json FROM zones WHERE store_id=? AND camera_id=? ORDER BY id",
+              (sid, camera_id))
+    zones = c.fetchall()
+    mtime = os.path.getmtime(shot[0]) if shot and os.path.exists(shot[0]) else 0
+    digest = hashlib.sha1(json.dumps([shot, mtime, zones]).encode()).hexdigest()[:16]
+    return digest, (shot, zones)
+
+def _colorize(grid: np.ndarray) -> np.ndarray:
+    """RGBA image of a grid; empty cells are transparent"""
+    rgba = np.zeros(grid.shape + (4,), dtype=np.uint8)
+    positive = grid[grid > 0]
+    if not positive.size:
+        return rgba
+    norm = np.clip(grid / np.percentile(positive, 99), 0.0, 1.0)
+    rgba[..., :3] = _COLORMAP[(norm * 255).astype(np.int32)]
+    rgba[..., 3] = np.where(grid > 0, 60 + np.sqrt(norm) * 130, 0).astype(np.uint8)
+    return rgba
+
+def _prune_cache(cache_dir: Path):
+    files = sorted(cache_dir.glob("*.png"), key=lambda p: p.stat().st_mtime)
+    for old in files[:max(0, len(files) - HEATMAP_CACHE_FILES)]:
+        old.unlink(missing_ok=True)
+
+def render_heatmap(camera_id: int, start: str, end: str, cache_dir: Path) -> Path:
+    """PNG of the camera's heatmap over [start, end]; raises LookupError without a screenshot"""
+    from PIL import Image, ImageDraw
+    sid = current_store_id()
+    start, end = range_bounds(start, end)
+    with db.transaction() as conn:
+        c = conn.cursor()
+        zone_version, (shot, zones) = _zone_version(c, sid, camera_id)
+        if not shot:
+            raise LookupError("Upload screenshot first")
+        c.execute("""SELECT COUNT(*), COALESCE(SUM(seconds),0) FROM heatmap_grids
+                     WHERE store_id=? AND camera_id=? AND hour_start BETWEEN ? AND ?""", (sid, camera_id, start, end))
+        rows, seconds = c.fetchone()
+        key = hashlib.sha1(f"{sid}|{camera_id}|{start}|{end}|{zone_version}|{rows}|{seconds:.3f}".encode()).hexdigest()
+        out = cache_dir / f"{key}.png"
+        if out.exists():
+            return out
+        c.execute("""SELECT grid FROM heatmap_grids
+                     WHERE store_id=? AND camera_id=? AND hour_start BETWEEN ? AND ?""", (sid, camera_id, start, end))
+        grid = sum_blobs(r[0] for r in c.fetchall()).grid
+
+    img = Image.open(shot[0]).convert("RGBA")
+    overlay = Image.fromarray(_colorize(grid), "RGBA").resize(img.size, Image.BILINEAR)
+    img = Image.alpha_composite(img, overlay)
+    draw = ImageDraw.Draw(img, "RGBA")
+    for _, name, zt, poly_json in zones:
+        poly = json.loads(poly_json)
+        draw.polygon([(p[0], p[1]) for p in poly], outline=(255, 255, 255, 200))
+        draw.text((poly[0][0] + 3, poly[0][1] + 3), name, fill=(255, 255, 255, 255))
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".tmp")
+    img.convert("RGB").save(tmp, "PNG")
+    os.replace(tmp, out)
+    _prune_cache(cache_dir)
+    return out
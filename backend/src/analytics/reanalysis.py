@@ -0,0 +1,163 @@
+"""
+Offline re-analysis of recorded detections (see camera/detection_log.py).
+
+Replays a camera's detection log through the same zone/event pipeline as run_camera,
+using the camera's current zones or a supplied zone set, and regenerates zone_events,
+zone_presence, unique_daily and the hourly tables for past days, then recomputes the
+store's daily_store_metrics. Days are spread across a process pool; each worker writes
+straight to the database, whatever WRITER_SPOOL_DIR or INGEST_URL say.
+
+    python -m src.analytics.reanalysis --camera-id 1 --start 2025-09-01 --end 2025-09-07
+"""
+
+import os
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+
+from ..database.db_manager import db
+from ..core.store_scope import current_store_id
+from ..core.zone_manager import EnhancedZoneManager, polygon_area, polygon_centroid
+from .analytics_engine import recompute_daily_store_metrics
+from ..camera.processor import EnhancedCentroidTracker, ZoneEventPipeline, local_writer
+from ..camera.detection_log import iter_frames, list_days
+
+logger = logging.getLogger(__name__)
+
+class ReplayTracker(EnhancedCentroidTracker):
+    """Tracker that trusts recorded track ids and runs on the recording's clock"""
+
+    def __init__(self, camera_id):
+        self.now = 0.0
+        super().__init__(camera_id, clock=lambda: self.now)
+        self.live = None  # replay never touches live state
+
+    def update(self, tracks):
+        now = self.clock()
+        for tid, cx, cy, w, h in tracks:
+            if tid in self.tracks:
+                self.tracks[tid].update({'cx': cx, 'cy': cy, 'last_ts': now})
+            else:
+                self.tracks[tid] = self._new_track(cx, cy, now)
+
+        for tid in [t for t, d in self.tracks.items() if now - d['last_ts'] > self.track_timeout]:
+            del self.tracks[tid]
+        return tracks
+
+    def _finalize_track(self, track_id, track_data):
+        # track_sessions are not regenerated by re-analysis
+        pass
+
+def load_zone_set(camera_id: int, zones_path: Optional[str] = None) -> EnhancedZoneManager:
+    """Zone manager for the camera, optionally overridden by a JSON zone set.
+
+    The file holds {"img_width", "img_height", "zones": [{"name", "ztype", "polygon", "priority"}]}
+    with polygons in screenshot coordinates, like the zones table.
+    """
+    zm = EnhancedZoneManager(camera_id)
+    if not zones_path:
+        return zm
+
+    with open(zones_path) as f:
+        spec = json.load(f)
+    zm.img_w, zm.img_h = spec["img_width"], spec["img_height"]
+    zm.zones = []
+    zm.zone_priorities = {}
+    for i, z in enumerate(spec["zones"], 1):
+        poly = z["polygon"]
+        zm.zones.append({
+            "id": z.get("id", i),
+            "name": z["name"],
+            "ztype": z["ztype"],
+            "poly_scr": poly,
+            "color": z.get("color", "#00ff00"),
+            "priority": z.get("priority", 1),
+            "area": polygon_area(poly),
+            "centroid": polygon_centroid(poly)
+        })
+        zm.zone_priorities[z["name"]] = z.get("priority", 1)
+    return zm
+
+def _clear_day(camera_id: int, ymd: str):
+    sid = current_store_id()
+    next_day = (datetime.strptime(ymd, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM zone_events WHERE store_id=? AND camera_id=? AND ts >= ? AND ts < ?",
+                  (sid, camera_id, ymd, next_day))
+        c.execute("DELETE FROM zone_presence WHERE store_id=? AND camera_id=? AND start_ts >= ? AND start_ts < ?",
+                  (sid, camera_id, ymd, next_day))
+        c.execute("DELETE FROM hourly_metrics WHERE store_id=? AND camera_id=? AND hour_start >= ? AND hour_start < ?",
+                  (sid, camera_id, ymd, next_day))
+        c.execute("DELETE FROM unique_daily WHERE store_id=? AND camera_id=? AND ymd=?", (sid, camera_id, ymd))
+        for table in ("duration_histograms", "heatmap_grids", "floor_heatmap_grids", "zone_flows"):
+            c.execute(f"DELETE FROM {table} WHERE store_id=? AND camera_id=? AND hour_start >= ? AND hour_start < ?",
+                      (sid, camera_id, ymd, next_day))
+        conn.commit()
+
+def reanalyze_day(camera_id: int, ymd: str, log_dir: str, zones_path: Optional[str] = None) -> Dict[str, Any]:
+    """Regenerate one camera-day from its detection log and refresh the day's store metrics"""
+    zm = load_zone_set(camera_id, zones_path)
+    _clear_day(camera_id, ymd)
+
+    tracker = ReplayTracker(camera_id)
+    frames = 0
+    now = None
+    with local_writer() as writer:
+        pipeline = ZoneEventPipeline(camera_id, tracker=tracker, zm=zm, edge=False, anomalies=False, rules=False)
+        for ts, W, H, tracks in iter_frames(log_dir, camera_id, ymd):
+            tracker.now = ts
+            now = datetime.fromtimestamp(ts, timezone.utc)
+            pipeline.roll_hour(now)
+            pipeline.process(now, W, H, tracks)
+            frames += 1
+
+        if now is not None:
+            pipeline.close(now)
+        writer.flush()
+    recompute_daily_store_metrics(ymd)
+
+    return {"camera_id": camera_id, "date": ymd, "frames": frames}
+
+def reanalyze(camera_id: int, log_dir: str, days: List[str], zones_path: Optional[str] = None,
+              workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Re-analyze several days in parallel, one process per day"""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(reanalyze_day, camera_id, d, log_dir, zones_path): d for d in days}
+        for fut in as_completed(futures):
+            try:
+                results.append(fut.result())
+                logger.info(f"Re-analyzed camera {camera_id} on {futures[fut]}")
+            except Exception as e:
+                logger.error(f"Re-analysis failed for camera {camera_id} on {futures[fut]}: {e}")
+    return sorted(results, key=lambda r: r["date"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-analyze recorded detections with a new zone set")
+    parser.add_argument("--camera-id", type=int, required=True, help="Camera ID")
+    parser.add_argument("--log-dir", default=os.getenv("DETECTION_LOG_DIR", ""), help="Detection log directory")
+    parser.add_argument("--start", help="First day (YYYY-MM-DD), defaults to the oldest recorded day")
+    parser.add_argument("--end", help="Last day (YYYY-MM-DD), defaults to the newest recorded day")
+    parser.add_argument("--zones", help="JSON zone set to use instead of the camera's current zones")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.log_dir:
+        parser.error("--log-dir or DETECTION_LOG_DIR is required")
+
+    days = [d for d in list_days(args.log_dir, args.camera_id)
+            if (not args.start or d >= args.start) and (not args.end or d <= args.end)]
+    if not days:
+        logger.info("No recorded detections in range")
+        return
+
+    for r in reanalyze(args.camera_id, args.log_dir, days, args.zones, args.workers):
+        logger.info(f"{r['date']}: {r['frames']} frames replayed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Store-level person identity from processor track embeddings (ENABLE_REID=1).
+
+Processors write one track_embeddings row per finished track. The matcher polls for
+rows without a person_uuid, matches each against its store's in-memory
+EmbeddingIndex and writes the resulting person_uuid to the embedding row and to the
+track's track_sessions, zone_events and zone_presence rows (track ids are unique
+across restarts, so no time bound is needed to find them), and adds it to the
+store-wide unique-visitor HyperLogLogs (camera/unique_hll.py, camera 0) when Redis
+is configured. On start the indexes are seeded with the already matched tracks of
+the last REID_WINDOW_SECS, so a restart does not split people.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from ..core.reid import EmbeddingIndex, REID_WINDOW_SECS, from_bytes
+from ..database.db_manager import db
+from ..camera.unique_hll import STORE_CAMERA, hll_ops
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REID_MATCH_SECS = float(os.getenv("REID_MATCH_SECS", "5"))
+_BATCH = 1000
+_MAX_PENDING_HLL = 400000  # unsent store-wide PFADD/EXPIRE commands kept across a Redis outage
+
+class ReidMatcher:
+    def __init__(self, window: float = REID_WINDOW_SECS):
+        self.window = window
+        self.indexes: Dict[str, EmbeddingIndex] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._seeded = False
+        self._redis = None
+        self._pending_hll: List[tuple] = []
+
+    def _index(self, store_id: str) -> EmbeddingIndex:
+        idx = self.indexes.get(store_id)
+        if idx is None:
+            idx = self.indexes[store_id] = EmbeddingIndex(self.window)
+        return idx
+
+    def seed(self):
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT e.store_id, e.camera_id, e.entry_ts, e.exit_ts, e.embedding, e.person_uuid
+                         FROM track_embeddings e
+                         JOIN (SELECT store_id, MAX(exit_ts) newest FROM track_embeddings
+                               WHERE person_uuid IS NOT NULL GROUP BY store_id) m ON m.store_id = e.store_id
+                         WHERE e.person_uuid IS NOT NULL AND e.exit_ts >= m.newest - ?
+                         ORDER BY e.exit_ts""", (self.window,))
+            rows = c.fetchall()
+        for sid, cam, entry, exit_, blob, person_uuid in rows:
+            self._index(sid).add(from_bytes(blob), cam, entry, exit_, person_uuid)
+        self._seeded = True
+
+    def run_once(self) -> int:
+        """Match pending embeddings; returns how many were assigned"""
+        if not self._seeded:
+            self.seed()
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT id, store_id, camera_id, track_id, entry_time, entry_ts, exit_ts, embedding
+                         FROM track_embeddings WHERE person_uuid IS NULL ORDER BY exit_ts, id LIMIT ?""", (_BATCH,))
+            rows = c.fetchall()
+        if not rows:
+            return 0
+
+        assigned: List[tuple] = []
+        sessions: List[tuple] = []
+        tracks: List[tuple] = []
+        hll: List[tuple] = []
+        for row_id, sid, cam, track_id, entry_time, entry, exit_, blob in rows:
+            person_uuid, _ = self._index(sid).match(from_bytes(blob), cam, entry, exit_)
+            assigned.append((person_uuid, row_id))
+            sessions.append((person_uuid, sid, cam, track_id, entry_time))
+            tracks.append((person_uuid, sid, cam, track_id))
+            # Every hour of the visit, as processors do for camera-level registers
+            for hour in range(int(entry // 3600), int(exit_ // 3600) + 1):
+                hll += hll_ops(sid, STORE_CAMERA, person_uuid, time.strftime("%Y-%m-%dT%H", time.gmtime(hour * 3600)))
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.executemany("UPDATE track_embeddings SET person_uuid=? WHERE id=?", assigned)
+            c.executemany("""UPDATE track_sessions SET person_uuid=?
+                             WHERE store_id=? AND camera_id=? AND track_id=? AND entry_time=?""", sessions)
+            c.executemany("""UPDATE zone_events SET person_uuid=?
+                             WHERE store_id=? AND camera_id=? AND person_id=?""", tracks)
+            c.executemany("""UPDATE zone_presence SET person_uuid=?
+                             WHERE store_id=? AND camera_id=? AND person_id=?""", tracks)
+            conn.commit()
+        if REDIS_URL:
+            self._publish(hll)
+        return len(rows)
+
+    def _publish(self, ops: List[tuple]):
+        """Send the store-wide PFADDs; on failure they are retried with the next batch,
+        since the matched tracks are not read again"""
+        import redis
+        ops = self._pending_hll + ops
+        try:
+            if self._redis is None:
+                self._redis = redis.from_url(REDIS_URL)
+            pipe = self._redis.pipeline(transaction=False)
+            for method, *args in ops:
+                getattr(pipe, method)(*args)
+            pipe.execute()
+            self._pending_hll = []
+        except redis.RedisError as e:
+            logger.error(f"Re-ID unique-visitor update failed, {len(ops)} commands kept for retry: {e}")
+            self._pending_hll = ops[-_MAX_PENDING_HLL:]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.run_once() == _BATCH:
+                    pass
+            except Exception as e:
+                logger.error(f"Re-ID matcher error: {e}")
+            self._stop.wait(REID_MATCH_SECS)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="reid-matcher")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+matcher = ReidMatcher()
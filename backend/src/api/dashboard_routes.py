@@ -250,21 +250,15 @@ async def get_realtime_metrics(
                 Camera.enabled == True
             ).all()
 
+            # Live occupancy of every camera in one round trip
+            from ..camera.live_state import read_occupancy
+            counts = read_occupancy(redis_client, [camera.id for camera in cameras])
             for camera in cameras:
-                try:
-                    live_count = redis_client.get(f"live_count:{camera.id}")
-                    count_value = int(live_count.decode() if live_count else 0)
-                    live_metrics[str(camera.id)] = {
-                        "camera_name": camera.name,
-                        "live_count": count_value,
-                        "last_updated": datetime.now(timezone.utc).isoformat()
-                    }
-                except:
-                    live_metrics[str(camera.id)] = {
-                        "camera_name": camera.name,
-                        "live_count": 0,
-                        "last_updated": datetime.now(timezone.utc).isoformat()
-                    }
+                live_metrics[str(camera.id)] = {
+                    "camera_name": camera.name,
+                    "live_count": counts.get(camera.id, 0),
+                    "last_updated": datetime.now(timezone.utc).isoformat()
+                }
 
             return {
                 "timestamp": datetime.now(timezone.utc).isoformat(),
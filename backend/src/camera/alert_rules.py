@@ -0,0 +1,250 @@
+"""
+Threshold alert rules evaluated inside the processor.
+
+Rules are rows of alert_rules (per store, optionally limited to a camera and/or a
+zone), e.g. queue_length > 5 for 120 s. Each frame the pipeline hands the engine
+its current values:
+
+  occupancy        people tracked by the camera
+  zone_occupancy   people in a zone
+  queue_length     people in a queue zone
+  queue_wait       expected wait of a queue zone (camera/queue_state.py), seconds
+  fps              processed frames per second (0 while the stream is down)
+
+A rule in mode 'for' fires once its condition has held continuously for for_secs;
+in mode 'avg' once the mean over the last for_secs breaches the threshold (one-second
+buckets in a ring, so an update is O(1)). It resolves only after the value is back
+past clear_threshold (hysteresis; defaults to the threshold) for clear_secs. One
+alert is open per (rule, camera, zone) at a time. Each firing has a unique dedup key
+(rule, camera, zone, firing time), so replayed writes collapse into one row, and
+alerts still open when a processor restarts are picked up again instead of fired
+twice.
+
+Firing inserts and resolving updates alerts rows through the batched writer (one
+upsert statement for both, see statements.py); both are also published as JSON on the Redis channel alerts:{store_id}.
+"""
+
+import os
+import json
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from ..core.store_scope import current_store_id
+from ..database.db_manager import db
+from ..database.statements import ALERT_UPSERT
+
+logger = logging.getLogger(__name__)
+
+ALERT_RULES_RELOAD_SECS = float(os.getenv("ALERT_RULES_RELOAD_SECS", "60"))
+
+METRICS = ("occupancy", "zone_occupancy", "queue_length", "queue_wait", "fps")
+ZONE_METRICS = ("zone_occupancy", "queue_length", "queue_wait")
+
+def alerts_channel(store_id) -> str:
+    return f"alerts:{store_id}"
+
+class Rule:
+    __slots__ = ("id", "name", "metric", "camera_id", "zone", "op", "threshold", "clear_threshold",
+                 "for_secs", "clear_secs", "mode", "severity")
+
+    def __init__(self, id, name, metric, camera_id, zone, op, threshold, clear_threshold,
+                 for_secs, clear_secs, mode, severity):
+        self.id = id
+        self.name = name
+        self.metric = metric
+        self.camera_id = camera_id
+        self.zone = zone or None
+        self.op = op
+        self.threshold = float(threshold)
+        self.clear_threshold = float(threshold if clear_threshold is None else clear_threshold)
+        self.for_secs = float(for_secs or 0)
+        self.clear_secs = float(self.for_secs if clear_secs is None else clear_secs)
+        self.mode = mode or "for"
+        self.severity = severity or "warning"
+
+    def breached(self, value: float) -> bool:
+        return value > self.threshold if self.op == ">" else value < self.threshold
+
+    def cleared(self, value: float) -> bool:
+        return value <= self.clear_threshold if self.op == ">" else value >= self.clear_threshold
+
+class WindowMean:
+    """Mean of the samples of the last `seconds` in one-second buckets"""
+
+    __slots__ = ("sums", "counts", "second", "total", "n")
+
+    def __init__(self, seconds: float):
+        size = max(1, int(seconds))
+        self.sums = [0.0] * size
+        self.counts = [0] * size
+        self.second: Optional[int] = None
+        self.total = 0.0
+        self.n = 0
+
+    def add(self, ts: float, value: float) -> float:
+        sec = int(ts)
+        size = len(self.sums)
+        if self.second is None or sec - self.second >= size:
+            self.sums = [0.0] * size
+            self.counts = [0] * size
+            self.total, self.n = 0.0, 0
+        else:
+            for s in range(self.second + 1, sec + 1):
+                i = s % size
+                self.total -= self.sums[i]
+                self.n -= self.counts[i]
+                self.sums[i], self.counts[i] = 0.0, 0
+        if self.second is None or sec > self.second:
+            self.second = sec
+        i = self.second % size
+        self.sums[i] += value
+        self.counts[i] += 1
+        self.total += value
+        self.n += 1
+        return self.total / self.n
+
+class _State:
+    __slots__ = ("since", "clear_since", "active", "window", "value", "key", "fired_at", "message")
+
+    def __init__(self, rule: Rule):
+        self.since: Optional[float] = None  # condition true since
+        self.clear_since: Optional[float] = None
+        self.active = False
+        self.window = WindowMean(rule.for_secs) if rule.mode == "avg" else None
+        self.value = 0.0
+        self.key: Optional[str] = None  # dedup key of the open alert
+        self.fired_at: Optional[str] = None
+        self.message = ""
+
+def dedup_key(rule_id, camera_id, zone: str, ts: float) -> str:
+    return f"{rule_id}:{camera_id}:{zone}:{int(ts * 1000)}"
+
+def parse_dedup_key(key: str) -> Tuple[int, str]:
+    """(rule_id, zone) of a dedup key"""
+    rule_id, _, rest = key.split(":", 2)
+    return int(rule_id), rest.rsplit(":", 1)[0]
+
+class RuleEngine:
+    """Alert rules of one camera and the state of each (rule, zone)"""
+
+    def __init__(self, camera_id, submit, publish=None, clock=time.time):
+        self.camera_id = camera_id
+        self.submit = submit  # writer.submit
+        self.publish = publish  # callable taking Redis ops, e.g. LiveStatePublisher.publish
+        self.clock = clock
+        self.rules: List[Rule] = []
+        self.states: Dict[Tuple[int, str], _State] = {}
+        self._loaded_at: Optional[float] = None
+        self.reload()
+
+    def reload(self):
+        """Load the camera's rules; open alerts of this camera count as already firing"""
+        sid = current_store_id()
+        try:
+            with db.transaction() as conn:
+                c = conn.cursor()
+                c.execute("""SELECT id, name, metric, camera_id, zone_id, op, threshold, clear_threshold,
+                                    for_secs, clear_secs, mode, severity
+                             FROM alert_rules WHERE store_id=? AND enabled=1 AND (camera_id IS NULL OR camera_id=?)""",
+                          (sid, self.camera_id))
+                rules = [Rule(*r) for r in c.fetchall()]
+                c.execute("""SELECT dedup_key, created_at, message FROM alerts
+                             WHERE store_id=? AND camera_id=? AND resolved=0 AND dedup_key IS NOT NULL""",
+                          (sid, self.camera_id))
+                open_rows = c.fetchall()
+        except Exception as e:
+            logger.error(f"Alert rules unavailable for camera {self.camera_id}: {e}")
+            rules, open_rows = self.rules, []
+        self._loaded_at = self.clock()
+        by_id = {r.id: r for r in rules}
+        # Keep the state of unchanged rules across reloads
+        self.states = {k: s for k, s in self.states.items() if k[0] in by_id}
+        for key, fired_at, message in open_rows:
+            rule_id, zone = parse_dedup_key(key)
+            rule = by_id.get(rule_id)
+            if rule and (rule_id, zone) not in self.states:
+                state = self.states[(rule_id, zone)] = _State(rule)
+                state.active = True
+                state.key, state.fired_at, state.message = key, fired_at, message
+        self.rules = [r for r in rules if r.metric in METRICS]
+
+    def maybe_reload(self, now: float):
+        if self._loaded_at is None or now - self._loaded_at >= ALERT_RULES_RELOAD_SECS:
+            self.reload()
+
+    def evaluate(self, ts: float, values: Dict[Tuple[str, str], float]):
+        """Feed this frame's values, keyed by (metric, zone) with zone '' for camera metrics"""
+        for rule in self.rules:
+            if rule.metric in ZONE_METRICS:
+                if rule.zone is not None:
+                    keys = [(rule.metric, rule.zone)] if (rule.metric, rule.zone) in values else []
+                else:
+                    keys = [k for k in values if k[0] == rule.metric]
+            else:
+                keys = [(rule.metric, "")] if (rule.metric, "") in values else []
+            for key in keys:
+                self._step(rule, key[1], ts, values[key])
+
+    def _step(self, rule: Rule, zone: str, ts: float, value: float):
+        state = self.states.get((rule.id, zone))
+        if state is None:
+            state = self.states[(rule.id, zone)] = _State(rule)
+        if state.window is not None:
+            value = state.window.add(ts, value)
+        state.value = value
+        if not state.active:
+            if rule.breached(value):
+                if state.since is None:
+                    state.since = ts
+                if ts - state.since >= rule.for_secs:
+                    state.active = True
+                    state.clear_since = None
+                    self._fire(rule, zone, ts, value, state)
+            else:
+                state.since = None
+        else:
+            if rule.cleared(value):
+                if state.clear_since is None:
+                    state.clear_since = ts
+                if ts - state.clear_since >= rule.clear_secs:
+                    state.active = False
+                    state.since = None
+                    self._resolve(rule, zone, ts, value, state)
+            else:
+                state.clear_since = None
+
+    def _message(self, rule: Rule, zone: str, value: float) -> str:
+        where = f"{zone} on camera {self.camera_id}" if zone else f"camera {self.camera_id}"
+        span = f" for {rule.for_secs:g}s" if rule.for_secs else ""
+        how = "average " if rule.mode == "avg" else ""
+        return f"{rule.name}: {how}{rule.metric} {value:.1f} {rule.op} {rule.threshold:g}{span} at {where}"
+
+    def _fire(self, rule: Rule, zone: str, ts: float, value: float, state: _State):
+        sid = current_store_id()
+        at = state.fired_at = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+        message = state.message = self._message(rule, zone, value)
+        key = state.key = dedup_key(rule.id, self.camera_id, zone, ts)
+        self.submit(ALERT_UPSERT, (sid, self.camera_id, rule.id, zone, rule.metric, rule.severity,
+                                   message, value, key, at, 0, None))
+        self._announce({"state": "firing", "rule_id": rule.id, "camera_id": self.camera_id, "zone": zone,
+                        "alert_type": rule.metric, "severity": rule.severity, "message": message,
+                        "value": value, "ts": at}, sid)
+
+    def _resolve(self, rule: Rule, zone: str, ts: float, value: float, state: _State):
+        sid = current_store_id()
+        at = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+        key = state.key or dedup_key(rule.id, self.camera_id, zone, ts)
+        self.submit(ALERT_UPSERT, (sid, self.camera_id, rule.id, zone, rule.metric, rule.severity,
+                                   state.message or self._message(rule, zone, value), value, key,
+                                   state.fired_at or at, 1, at))
+        state.key = None
+        self._announce({"state": "resolved", "rule_id": rule.id, "camera_id": self.camera_id, "zone": zone,
+                        "alert_type": rule.metric, "value": value, "ts": at}, sid)
+
+    def _announce(self, payload: dict, sid: str):
+        logger.info(f"Alert {payload['state']} on camera {self.camera_id}: rule {payload['rule_id']} {payload['zone']}",
+                    extra={"rule_id": payload["rule_id"], "zone": payload["zone"], "value": payload["value"]})
+        if self.publish:
+            self.publish([("publish", alerts_channel(sid), json.dumps(payload))])
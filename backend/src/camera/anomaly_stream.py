@@ -0,0 +1,268 @@
+"""
+Streaming anomaly detection in the processor.
+
+For every series (zone or '' for the whole camera, metric) the detector keeps an
+exponentially weighted mean and variance per hour of the week (168 slots, UTC):
+
+  footfall    entries per minute (camera: footfall, zone: zone entries)
+  occupancy   mean people per processed frame over the minute
+  dwell       mean dwell of the stays that ended in the minute (minutes without any
+              are skipped)
+
+When a minute ends, each series' value is compared with its slot: |z| >=
+ANOMALY_Z_THRESHOLD, once the slot has ANOMALY_MIN_SAMPLES samples, logs an
+anomalies row in the format of SpikeDetector.log_anomaly through the batched writer
+(severity from |z| relative to the threshold), at most once per
+ANOMALY_COOLDOWN_SECS and series. The slot is then updated with the value clipped
+to the threshold, so one anomaly does not drag the baseline with it.
+
+The state is written to anomaly_state every ANOMALY_PERSIST_SECS and loaded on
+start; a camera without saved state is seeded from the last ANOMALY_SEED_DAYS of
+minute_metrics (edge mode) or hourly_metrics.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import msgpack
+import numpy as np
+
+from ..core.store_scope import current_store_id
+from ..database.db_manager import db
+from ..database.statements import ANOMALY_INSERT, ANOMALY_STATE_UPSERT
+from .edge_rollup import minute_key
+
+logger = logging.getLogger(__name__)
+
+ENABLE_ANOMALY_STREAM = os.getenv("ENABLE_ANOMALY_STREAM", "1") == "1"
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.02"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+ANOMALY_COOLDOWN_SECS = float(os.getenv("ANOMALY_COOLDOWN_SECS", "900"))
+ANOMALY_PERSIST_SECS = float(os.getenv("ANOMALY_PERSIST_SECS", "300"))
+ANOMALY_SEED_DAYS = int(os.getenv("ANOMALY_SEED_DAYS", "28"))
+METRICS = ("footfall", "occupancy", "dwell")
+SLOTS = 168
+_MIN_STD = 0.5  # floor of the standard deviation, in the metric's unit
+_REL_STD = 0.1  # and of its ratio to the mean
+
+def hour_of_week(now: datetime) -> int:
+    return now.weekday() * 24 + now.hour
+
+def _severity(z: float, threshold: float) -> str:
+    z = abs(z) / threshold
+    if z >= 2:
+        return "critical"
+    if z >= 1.5:
+        return "high"
+    return "medium"
+
+class SeasonalEwma:
+    """Weighted mean, variance and sample count of each hour of the week"""
+
+    __slots__ = ("mean", "var", "n")
+
+    def __init__(self):
+        self.mean = np.zeros(SLOTS)
+        self.var = np.zeros(SLOTS)
+        self.n = np.zeros(SLOTS)
+
+    def std(self, slot: int) -> float:
+        return max(float(np.sqrt(self.var[slot])), _REL_STD * abs(float(self.mean[slot])), _MIN_STD)
+
+    def update(self, slot: int, x: float, alpha: float):
+        # Plain average until the slot has 1/alpha samples, then exponential weighting
+        a = max(alpha, 1.0 / (self.n[slot] + 1))
+        diff = x - self.mean[slot]
+        incr = a * diff
+        self.mean[slot] += incr
+        self.var[slot] = (1 - a) * (self.var[slot] + diff * incr)
+        self.n[slot] += 1
+
+    def to_bytes(self) -> bytes:
+        return np.stack([self.mean, self.var, self.n]).astype("<f8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "SeasonalEwma":
+        s = cls()
+        s.mean, s.var, s.n = np.frombuffer(blob, dtype="<f8").reshape(3, SLOTS).copy()
+        return s
+
+class _Minute:
+    __slots__ = ("entries", "occupancy_sum", "occupancy_samples", "dwell_sum", "dwell_count")
+
+    def __init__(self):
+        self.entries = 0
+        self.occupancy_sum = 0
+        self.occupancy_samples = 0
+        self.dwell_sum = 0.0
+        self.dwell_count = 0
+
+class StreamingAnomalyDetector:
+    """Per-minute seasonal anomaly checks of one camera's footfall, occupancy and dwell"""
+
+    def __init__(self, camera_id, submit, alpha: float = ANOMALY_ALPHA, threshold: float = ANOMALY_Z_THRESHOLD):
+        self.camera_id = camera_id
+        self.submit = submit  # writer.submit
+        self.alpha = alpha
+        self.threshold = threshold
+        self.series: Dict[Tuple[str, str], SeasonalEwma] = {}
+        self.minute: Optional[str] = None
+        self.slot = 0
+        self.zones: Dict[str, _Minute] = {}
+        self.last_flagged: Dict[Tuple[str, str], float] = {}
+        self._persisted: Optional[datetime] = None
+        self.load()
+
+    # State
+
+    def _series(self, zone: str, metric: str) -> SeasonalEwma:
+        s = self.series.get((zone, metric))
+        if s is None:
+            s = self.series[(zone, metric)] = SeasonalEwma()
+        return s
+
+    def load(self):
+        """Saved state of the camera, or a seed from history when there is none"""
+        sid = current_store_id()
+        try:
+            with db.transaction() as conn:
+                c = conn.cursor()
+                c.execute("SELECT state FROM anomaly_state WHERE store_id=? AND camera_id=?", (sid, self.camera_id))
+                row = c.fetchone()
+            if row:
+                for key, blob in msgpack.unpackb(row[0]).items():
+                    zone, metric = key.split("|", 1)
+                    self.series[(zone, metric)] = SeasonalEwma.from_bytes(blob)
+            else:
+                self.seed()
+        except Exception as e:
+            logger.error(f"Anomaly state unavailable for camera {self.camera_id}: {e}")
+
+    def seed(self, now: Optional[datetime] = None):
+        """Slot means and variances from the last ANOMALY_SEED_DAYS of stored metrics"""
+        sid = current_store_id()
+        since = ((now or datetime.now(timezone.utc)) - timedelta(days=ANOMALY_SEED_DAYS)).strftime("%Y-%m-%dT%H:%M:%S")
+        with db.transaction() as conn:
+            c = conn.cursor()
+            # Minute rollups give per-minute moments of every zone
+            c.execute("""SELECT zone_id, CAST(strftime('%w', minute_start) AS INTEGER), CAST(strftime('%H', minute_start) AS INTEGER),
+                                COUNT(*), AVG(entries), AVG(entries*entries),
+                                SUM(occupancy_samples>0), AVG(CASE WHEN occupancy_samples>0 THEN 1.0*occupancy_sum/occupancy_samples END),
+                                AVG(CASE WHEN occupancy_samples>0 THEN (1.0*occupancy_sum/occupancy_samples)*(1.0*occupancy_sum/occupancy_samples) END),
+                                SUM(dwell_count>0), AVG(CASE WHEN dwell_count>0 THEN dwell_sum/dwell_count END),
+                                AVG(CASE WHEN dwell_count>0 THEN (dwell_sum/dwell_count)*(dwell_sum/dwell_count) END)
+                         FROM minute_metrics WHERE store_id=? AND camera_id=? AND minute_start>=?
+                         GROUP BY 1, 2, 3""", (sid, self.camera_id, since))
+            minute_rows = c.fetchall()
+            hour_rows = []
+            if not minute_rows:
+                # Hourly rows only give the camera's footfall per minute and per-hour dwell
+                c.execute("""SELECT CAST(strftime('%w', hour_start) AS INTEGER), CAST(strftime('%H', hour_start) AS INTEGER),
+                                    COUNT(*), AVG(footfall)/60.0,
+                                    SUM(dwell_count>0), AVG(CASE WHEN dwell_count>0 THEN dwell_avg END),
+                                    AVG(CASE WHEN dwell_count>0 THEN dwell_avg*dwell_avg END)
+                             FROM hourly_metrics WHERE store_id=? AND camera_id=? AND hour_start>=?
+                             GROUP BY 1, 2""", (sid, self.camera_id, since))
+                hour_rows = c.fetchall()
+
+        def put(zone, metric, dow, hour, n, mean, sq):
+            if not n or mean is None:
+                return
+            slot = ((dow + 6) % 7) * 24 + hour  # SQLite %w counts from Sunday
+            s = self._series(zone, metric)
+            s.mean[slot], s.var[slot], s.n[slot] = mean, max((sq or 0.0) - mean * mean, 0.0), n
+
+        for zone, dow, hour, n, e, e2, on, o, o2, dn, d, d2 in minute_rows:
+            put(zone, "footfall", dow, hour, n, e, e2)
+            put(zone, "occupancy", dow, hour, on, o, o2)
+            put(zone, "dwell", dow, hour, dn, d, d2)
+        for dow, hour, n, per_minute, dn, d, d2 in hour_rows:
+            # Poisson arrivals: the variance of a minute's count equals its mean
+            put("", "footfall", dow, hour, n * 60, per_minute, per_minute + per_minute * per_minute)
+            put("", "dwell", dow, hour, dn, d, d2)
+
+    def persist(self, now: datetime):
+        self._persisted = now
+        if not self.series:
+            return
+        state = msgpack.packb({f"{zone}|{metric}": s.to_bytes() for (zone, metric), s in self.series.items()})
+        self.submit(ANOMALY_STATE_UPSERT, (current_store_id(), self.camera_id, state, now.isoformat()))
+
+    # Samples of the current minute
+
+    def _zone(self, zone: str) -> _Minute:
+        m = self.zones.get(zone)
+        if m is None:
+            m = self.zones[zone] = _Minute()
+        return m
+
+    def add_entry(self, zone: str):
+        self._zone(zone).entries += 1
+
+    def sample_occupancy(self, zone: str, count: int):
+        m = self._zone(zone)
+        m.occupancy_sum += count
+        m.occupancy_samples += 1
+
+    def add_dwell(self, zone: str, seconds: float):
+        m = self._zone(zone)
+        m.dwell_sum += seconds
+        m.dwell_count += 1
+
+    def roll(self, now: datetime):
+        """Check and fold in the previous minute when `now` falls into a new one"""
+        mk = minute_key(now)
+        if mk == self.minute:
+            return
+        if self.minute is not None:
+            self._close_minute(datetime.fromisoformat(self.minute).replace(tzinfo=timezone.utc))
+        self.minute = mk
+        self.slot = hour_of_week(now)
+        self.zones = {}
+        if self._persisted is None:
+            self._persisted = now
+        elif (now - self._persisted).total_seconds() >= ANOMALY_PERSIST_SECS:
+            self.persist(now)
+
+    def _close_minute(self, minute: datetime):
+        for zone, m in self.zones.items():
+            self._check(zone, "footfall", m.entries, minute)
+            if m.occupancy_samples:
+                self._check(zone, "occupancy", m.occupancy_sum / m.occupancy_samples, minute)
+            if m.dwell_count:
+                self._check(zone, "dwell", m.dwell_sum / m.dwell_count, minute)
+
+    def _check(self, zone: str, metric: str, value: float, minute: datetime):
+        s = self._series(zone, metric)
+        slot = self.slot
+        mean, std = float(s.mean[slot]), s.std(slot)
+        z = (value - mean) / std
+        if s.n[slot] >= ANOMALY_MIN_SAMPLES and abs(z) >= self.threshold:
+            ts = minute.timestamp()
+            last = self.last_flagged.get((zone, metric))
+            if last is None or ts - last >= ANOMALY_COOLDOWN_SECS:
+                self.last_flagged[(zone, metric)] = ts
+                self._log(zone, metric, value, mean, std, z, minute)
+            value = mean + np.sign(z) * self.threshold * std
+        s.update(slot, value, self.alpha)
+
+    def _log(self, zone: str, metric: str, value: float, mean: float, std: float, z: float, minute: datetime):
+        if metric == "dwell":
+            anomaly_type = "dwell_high_dwell" if z > 0 else "dwell_low_dwell"
+        else:
+            anomaly_type = f"{metric}_{'spike' if z > 0 else 'drop'}"
+        where = f"zone {zone}" if zone else f"camera {self.camera_id}"
+        description = (f"{metric.capitalize()} {'above' if z > 0 else 'below'} seasonal baseline at {where}: "
+                       f"{value:.1f} vs {mean:.1f} (z={z:.1f})")
+        metadata = {"detection_method": "streaming_ewma", "zone_id": zone, "hour_of_week": self.slot,
+                    "minute_start": minute.isoformat(), "z_score": round(z, 2), "baseline_std": round(std, 3),
+                    "alpha": self.alpha, "z_threshold": self.threshold}
+        logger.info(f"Anomaly on camera {self.camera_id}: {description}", extra={"anomaly_type": anomaly_type, "zone": zone})
+        detected = minute + timedelta(minutes=1)  # stream time, also right for replays
+        self.submit(ANOMALY_INSERT, (current_store_id(), self.camera_id, anomaly_type,
+                                     detected.isoformat(), _severity(z, self.threshold), value, mean,
+                                     abs(value - mean), description, json.dumps(metadata)))
@@ -0,0 +1,114 @@
+"""
+Append-only binary log of post-filter detections, one file per camera per UTC day.
+
+Each file starts with a fixed header (magic, version, camera id, frame size) followed
+by fixed-width little-endian records: timestamp, track id, cx, cy, w, h, conf.
+A processed frame without detections is one record with track id EMPTY_FRAME, so
+replays see the same frame times (zero occupancy, track expiry) as the live run.
+Files are named ``{ymd}_{W}x{H}.wdl`` so a resolution change mid-day simply starts
+a new file; readers merge them back in timestamp order.
+"""
+
+import os
+import glob
+import heapq
+import struct
+from datetime import datetime, timezone
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+MAGIC = b"WDL1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHI")    # magic, version, width, height, camera_id
+RECORD = struct.Struct("<dQ5f")      # ts, track_id, cx, cy, w, h, conf
+EMPTY_FRAME = 0  # track id of the record marking a frame without detections; real ids are never 0
+
+RECORD_DTYPE = np.dtype([
+    ("ts", "<f8"), ("track_id", "<u8"),
+    ("cx", "<f4"), ("cy", "<f4"), ("w", "<f4"), ("h", "<f4"), ("conf", "<f4"),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+def log_path(base_dir: str, camera_id: int, ymd: str, width: int, height: int) -> str:
+    return os.path.join(base_dir, str(camera_id), f"{ymd}_{width}x{height}.wdl")
+
+class DetectionLogWriter:
+    """Per-camera writer; rolls files on UTC day or frame size change"""
+
+    def __init__(self, base_dir: str, camera_id: int):
+        self.base_dir = base_dir
+        self.camera_id = camera_id
+        self._key = None
+        self._fh = None
+
+    def _open(self, ymd: str, width: int, height: int):
+        self.close()
+        path = log_path(self.base_dir, self.camera_id, ymd, width, height)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fh = open(path, "ab")
+        size = fh.tell()
+        if size == 0:
+            fh.write(HEADER.pack(MAGIC, VERSION, width, height, self.camera_id))
+        else:
+            # Drop a partial trailing record left by a crash so appends stay aligned
+            body = size - HEADER.size
+            if body % RECORD.size:
+                fh.truncate(HEADER.size + (body // RECORD.size) * RECORD.size)
+                fh.seek(0, os.SEEK_END)
+        self._fh = fh
+        self._key = (ymd, width, height)
+
+    def write_frame(self, ts: float, width: int, height: int, tracks, confs):
+        """Append one record per tracked detection of a processed frame, or an empty-frame record"""
+        ymd = datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+        if self._key != (ymd, width, height):
+            self._open(ymd, width, height)
+        if not tracks:
+            self._fh.write(RECORD.pack(ts, EMPTY_FRAME, 0, 0, 0, 0, 0))
+            return
+        buf = bytearray()
+        for (tid, cx, cy, w, h), conf in zip(tracks, confs):
+            buf += RECORD.pack(ts, tid, cx, cy, w, h, conf)
+        self._fh.write(buf)
+
+    def flush(self):
+        if self._fh:
+            self._fh.flush()
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+        self._fh = None
+        self._key = None
+
+def read_log(path: str) -> Tuple[int, int, int, np.ndarray]:
+    """Read a log file into (camera_id, width, height, records)"""
+    with open(path, "rb") as fh:
+        magic, version, width, height, camera_id = HEADER.unpack(fh.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a detection log: {path}")
+        raw = fh.read()
+    usable = len(raw) - len(raw) % RECORD.size
+    return camera_id, width, height, np.frombuffer(raw[:usable], dtype=RECORD_DTYPE)
+
+def list_days(base_dir: str, camera_id: int) -> List[str]:
+    """Days (YYYY-MM-DD) that have recorded detections for a camera"""
+    paths = glob.glob(os.path.join(base_dir, str(camera_id), "*.wdl"))
+    return sorted({os.path.basename(p).split("_", 1)[0] for p in paths})
+
+def iter_frames(base_dir: str, camera_id: int, ymd: str) -> Iterator[Tuple[float, int, int, List[tuple]]]:
+    """Yield (ts, width, height, tracks) per recorded frame of a day, in time order"""
+    def frames(path):
+        _, width, height, rec = read_log(path)
+        if not len(rec):
+            return
+        # Records of one frame share a timestamp and are written contiguously
+        bounds = np.flatnonzero(np.diff(rec["ts"])) + 1
+        for chunk in np.split(rec, bounds):
+            tracks = [(int(r["track_id"]), float(r["cx"]), float(r["cy"]), float(r["w"]), float(r["h"]))
+                      for r in chunk if r["track_id"] != EMPTY_FRAME]
+            yield float(chunk["ts"][0]), width, height, tracks
+
+    paths = sorted(glob.glob(os.path.join(base_dir, str(camera_id), f"{ymd}_*.wdl")))
+    return heapq.merge(*(frames(p) for p in paths), key=lambda f: f[0])
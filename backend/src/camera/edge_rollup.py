@@ -0,0 +1,154 @@
+"""
+Edge aggregation mode of the processor (EDGE_ROLLUPS=1).
+
+Instead of shipping every zone enter/exit and presence interval, the pipeline keeps
+per-minute counters per zone ('' = whole camera) and ships one minute_metrics row
+per zone and minute. Raw events are written to a local sqlite file on the processor
+and pruned after EDGE_EVENT_RETENTION_HOURS; a deterministic EDGE_EVENT_SAMPLE
+fraction of tracks still has its raw events sent upstream, so the backend keeps
+complete example journeys.
+"""
+
+import os
+import zlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from ..core.histogram import LogHistogram
+from ..core.store_scope import current_store_id
+from ..database.db_manager import DB
+from ..database.statements import MINUTE_METRICS_UPSERT
+
+logger = logging.getLogger(__name__)
+
+EDGE_ROLLUPS = os.getenv("EDGE_ROLLUPS", "0") == "1"
+EDGE_EVENT_DB = os.getenv("EDGE_EVENT_DB", "edge_events.db")
+EDGE_EVENT_RETENTION_HOURS = float(os.getenv("EDGE_EVENT_RETENTION_HOURS", "24"))
+EDGE_EVENT_SAMPLE = float(os.getenv("EDGE_EVENT_SAMPLE", "0"))
+
+COUNTERS = ("entries", "exits", "occupancy_samples", "occupancy_sum", "occupancy_max",
+            "interactions", "queue_joins", "queue_leaves", "queue_wait_sum", "queue_wait_count")
+
+def minute_key(now: datetime) -> str:
+    return now.strftime("%Y-%m-%dT%H:%M:00")
+
+class _Minute:
+    __slots__ = COUNTERS + ("dwell",)
+
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.dwell = LogHistogram()
+
+class MinuteRollup:
+    """Counters of the current minute of one camera, keyed by zone ('' = whole camera)"""
+
+    def __init__(self, camera_id: int, submit):
+        self.camera_id = camera_id
+        self.submit = submit  # writer.submit
+        self.minute: Optional[str] = None
+        self.zones: Dict[str, _Minute] = {}
+
+    def roll(self, now: datetime) -> bool:
+        """Ship the previous minute when `now` falls into a new one; True if it did"""
+        mk = minute_key(now)
+        if mk == self.minute:
+            return False
+        self.flush()
+        self.minute = mk
+        return True
+
+    def _zone(self, zone_id: str) -> _Minute:
+        m = self.zones.get(zone_id)
+        if m is None:
+            m = self.zones[zone_id] = _Minute()
+        return m
+
+    def add(self, zone_id: str, field: str, n=1):
+        m = self._zone(zone_id)
+        setattr(m, field, getattr(m, field) + n)
+
+    def sample_occupancy(self, zone_id: str, count: int):
+        m = self._zone(zone_id)
+        m.occupancy_samples += 1
+        m.occupancy_sum += count
+        if count > m.occupancy_max:
+            m.occupancy_max = count
+
+    def add_dwell(self, zone_id: str, seconds: float):
+        self._zone(zone_id).dwell.add(seconds)
+
+    def flush(self):
+        if self.minute is None or not self.zones:
+            self.zones = {}
+            return
+        sid = current_store_id()
+        for zone_id, m in self.zones.items():
+            self.submit(MINUTE_METRICS_UPSERT,
+                        (sid, self.camera_id, self.minute, zone_id, m.entries, m.exits,
+                         m.occupancy_samples, m.occupancy_sum, m.occupancy_max, m.interactions,
+                         m.queue_joins, m.queue_leaves, m.queue_wait_sum, m.queue_wait_count,
+                         m.dwell.count, m.dwell.sum, m.dwell.to_bytes() if m.dwell.count else None))
+        self.zones = {}
+
+class LocalEventStore:
+    """Raw zone events and presence intervals kept on the processor.
+
+    Rows are buffered and written in one transaction per flush (once a minute); rows
+    older than the retention are deleted at most once an hour.
+    """
+
+    def __init__(self, camera_id: int, path: str = EDGE_EVENT_DB,
+                 retention_hours: float = EDGE_EVENT_RETENTION_HOURS,
+                 sample: float = EDGE_EVENT_SAMPLE, upstream=None):
+        self.camera_id = camera_id
+        self.db = DB(path)
+        self.retention = timedelta(hours=retention_hours)
+        self.sample_cutoff = int(sample * 10000)
+        self.upstream = upstream  # writer.submit, for sampled tracks
+        self._pending: Dict[str, list] = {}
+        self._last_prune: Optional[datetime] = None
+        with self.db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("""CREATE TABLE IF NOT EXISTS zone_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+                zone_id TEXT, event_type TEXT NOT NULL, value REAL, person_id INTEGER,
+                ts TEXT NOT NULL, metadata TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_zone_events_ts ON zone_events(ts)")
+            c.execute("""CREATE TABLE IF NOT EXISTS zone_presence (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+                zone_id TEXT NOT NULL, person_id INTEGER NOT NULL, start_ts TEXT NOT NULL, end_ts TEXT NOT NULL,
+                samples INTEGER DEFAULT 1, closed INTEGER DEFAULT 0,
+                UNIQUE(store_id, camera_id, zone_id, person_id, start_ts))""")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_zone_presence_end ON zone_presence(end_ts)")
+            conn.commit()
+
+    def sampled(self, person_id: int) -> bool:
+        """Same answer for every event of a track, so sampled journeys are complete"""
+        return zlib.crc32(f"{self.camera_id}:{person_id}".encode()) % 10000 < self.sample_cutoff
+
+    def submit(self, sql: str, params: tuple, person_id: int):
+        self._pending.setdefault(sql, []).append(params)
+        if self.upstream is not None and self.sample_cutoff and self.sampled(person_id):
+            self.upstream(sql, params)
+
+    def flush(self, now: Optional[datetime] = None):
+        now = now or datetime.now(timezone.utc)
+        prune = self._last_prune is None or now - self._last_prune >= timedelta(hours=1)
+        if not self._pending and not prune:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            with self.db.transaction() as conn:
+                c = conn.cursor()
+                for sql, rows in batch.items():
+                    c.executemany(sql, rows)
+                if prune:
+                    cutoff = (now - self.retention).isoformat()
+                    c.execute("DELETE FROM zone_events WHERE ts < ?", (cutoff,))
+                    c.execute("DELETE FROM zone_presence WHERE end_ts < ? AND closed=1", (cutoff,))
+                    self._last_prune = now
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Local event store error on camera {self.camera_id}: {e}")
@@ -0,0 +1,216 @@
+"""
+Non-blocking publisher for live tracking state in Redis.
+
+The tracker collects each frame's Redis commands and hands them over as one batch.
+A background thread sends whatever has accumulated as a single pipeline, so the
+detection loop never waits on Redis. The buffer holds at most LIVE_BUFFER_FRAMES
+frames; when Redis is slow or down the oldest frames are dropped and counted in
+live_updates_dropped_total. Socket timeouts bound how long one send can hang.
+
+Deletions (HDEL/ZREM of expired tracks) are never dropped: they are taken out of the
+frames into a pending set and sent with every batch until one succeeds, since later
+frames keep refreshing the TTL of the keys they would otherwise linger in. Commands
+published with retain=True (unique-visitor PFADDs, alert messages) are not superseded
+by later frames either; they are kept in order and resent until they go through, up
+to LIVE_RETAIN_OPS of them. Only positions and occupancy, which the next frame
+rewrites, are ever dropped.
+
+Live tracks of a camera live in one hash, live_tracks:{camera_id}, mapping track id
+to a msgpack record. Fields are removed when the tracker expires a track and the
+hash itself carries LIVE_TRACK_TTL, so a stopped processor leaves nothing behind.
+Readers skip records older than OCCUPANCY_WINDOW by their packed timestamp.
+live_cameras:{store_id} indexes the cameras currently publishing.
+
+Occupancy is the sorted set occupancy:{camera_id}, holding track ids scored by
+last-seen time. Members older than OCCUPANCY_WINDOW are trimmed with
+ZREMRANGEBYSCORE, both by the tracker and by readers, and the count is a ZCARD.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+import msgpack
+
+from ..core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+LIVE_REDIS_TIMEOUT = float(os.getenv("LIVE_REDIS_TIMEOUT", "0.5"))
+LIVE_BUFFER_FRAMES = int(os.getenv("LIVE_BUFFER_FRAMES", "50"))
+LIVE_RETAIN_OPS = int(os.getenv("LIVE_RETAIN_OPS", "100000"))
+LIVE_TRACK_TTL = 30  # seconds
+OCCUPANCY_WINDOW = 10  # seconds unseen before a track stops counting, as the tracker's timeout
+
+def tracks_key(camera_id) -> str:
+    return f"live_tracks:{camera_id}"
+
+def cameras_key(store_id) -> str:
+    return f"live_cameras:{store_id}"
+
+def occupancy_key(camera_id) -> str:
+    return f"occupancy:{camera_id}"
+
+def pack_track(cx, cy, w, h, ts, zones) -> bytes:
+    return msgpack.packb({"cx": cx, "cy": cy, "w": w, "h": h, "ts": ts, "zones": list(zones)})
+
+def _unpack_tracks(camera_id, fields: Dict, now: Optional[float] = None,
+                   window: float = OCCUPANCY_WINDOW) -> List[Dict[str, Any]]:
+    cutoff = (now if now is not None else time.time()) - window
+    tracks = []
+    for tid, value in sorted(fields.items(), key=lambda f: int(f[0])):
+        track = msgpack.unpackb(value)
+        if track.get("ts", 0) < cutoff:
+            continue  # expired, its deletion has not reached Redis yet
+        # 63-bit ids exceed JavaScript's exact integer range, so they go out as strings
+        track["track_id"] = str(int(tid))
+        track["camera_id"] = camera_id
+        tracks.append(track)
+    return tracks
+
+def read_camera_tracks(client, camera_id, now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Live tracks of one camera (one HGETALL)"""
+    return _unpack_tracks(camera_id, client.hgetall(tracks_key(camera_id)), now)
+
+def read_store_tracks(client, store_id, now: Optional[float] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Live tracks of every publishing camera of a store, read in one pipeline"""
+    camera_ids = sorted(int(c) for c in client.smembers(cameras_key(store_id)))
+    if not camera_ids:
+        return {}
+    pipe = client.pipeline(transaction=False)
+    for cid in camera_ids:
+        pipe.hgetall(tracks_key(cid))
+    out = {str(cid): _unpack_tracks(cid, fields, now) for cid, fields in zip(camera_ids, pipe.execute())}
+    return {cid: tracks for cid, tracks in out.items() if tracks}
+
+def read_occupancy(client, camera_ids: List[int], now: Optional[float] = None,
+                   window: float = OCCUPANCY_WINDOW) -> Dict[int, int]:
+    """People currently present per camera, trimmed and counted in one pipeline"""
+    if not camera_ids:
+        return {}
+    cutoff = (now if now is not None else time.time()) - window
+    pipe = client.pipeline(transaction=False)
+    for cid in camera_ids:
+        pipe.zremrangebyscore(occupancy_key(cid), "-inf", f"({cutoff}")
+        pipe.zcard(occupancy_key(cid))
+    counts = pipe.execute()[1::2]
+    return {cid: int(n) for cid, n in zip(camera_ids, counts)}
+
+Op = Tuple  # (redis method name, *args), e.g. ("hset", key, field, value)
+_DELETES = ("hdel", "zrem")
+
+class LiveStatePublisher:
+    def __init__(self, camera_id, url: str = REDIS_URL, max_frames: int = LIVE_BUFFER_FRAMES,
+                 socket_timeout: float = LIVE_REDIS_TIMEOUT, retry_delay: float = 1.0,
+                 max_retained: int = LIVE_RETAIN_OPS):
+        self.camera_id = camera_id
+        self.client = redis.from_url(url, socket_timeout=socket_timeout,
+                                     socket_connect_timeout=socket_timeout)
+        self.max_frames = max_frames
+        self.max_retained = max_retained
+        self.retry_delay = retry_delay
+        self._frames: deque = deque()
+        self._deletes: Dict[Tuple[str, str], set] = {}  # (method, key) -> members not yet removed
+        self._retained: List[Op] = []  # retain=True commands not yet sent, oldest first
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, ops: List[Op], retain: bool = False):
+        """Queue one frame's commands; drops the oldest frame when the buffer is full.
+
+        retain=True commands are resent until they succeed instead of being dropped.
+        """
+        if not ops:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name=f"live-state-{self.camera_id}")
+            self._thread.start()
+        with self._cond:
+            frame = []
+            for op in ops:
+                if op[0] in _DELETES:
+                    self._deletes.setdefault((op[0], op[1]), set()).update(op[2:])
+                else:
+                    frame.append(op)
+            if retain and frame:
+                room = self.max_retained - len(self._retained)
+                if len(frame) > room:
+                    registry.inc("live_updates_dropped_total", len(frame) - max(room, 0),
+                                 camera=self.camera_id, reason="retain_full")
+                self._retained += frame[:max(room, 0)]
+                registry.set("live_retained_ops", len(self._retained), camera=self.camera_id)
+            elif frame:
+                if len(self._frames) >= self.max_frames:
+                    dropped = self._frames.popleft()
+                    registry.inc("live_updates_dropped_total", len(dropped),
+                                 camera=self.camera_id, reason="buffer_full")
+                self._frames.append(frame)
+            registry.set("live_buffer_frames", len(self._frames), camera=self.camera_id)
+            registry.set("live_deletes_pending", self._pending_deletes(), camera=self.camera_id)
+            self._cond.notify()
+
+    def _pending_deletes(self) -> int:
+        return sum(len(members) for members in self._deletes.values())
+
+    def _take(self) -> Tuple[List[Op], int, Dict[Tuple[str, str], set]]:
+        """Everything buffered: retained commands first, deletions last; blocks until
+        there is something. Retained commands and deletions stay queued until _sent."""
+        with self._cond:
+            while not self._frames and not self._deletes and not self._retained:
+                self._cond.wait()
+            frames, self._frames = list(self._frames), deque()
+            retained = list(self._retained)
+            deletes = {k: set(members) for k, members in self._deletes.items()}
+            registry.set("live_buffer_frames", 0, camera=self.camera_id)
+        ops = retained + [op for frame in frames for op in frame]
+        return ops + [(method, key, *members) for (method, key), members in deletes.items()], len(retained), deletes
+
+    def _sent(self, retained: int, deletes: Dict[Tuple[str, str], set]):
+        with self._cond:
+            del self._retained[:retained]  # only appended to, so the sent ones are the head
+            registry.set("live_retained_ops", len(self._retained), camera=self.camera_id)
+            for k, members in deletes.items():
+                left = self._deletes.get(k, set()) - members
+                if left:
+                    self._deletes[k] = left
+                else:
+                    self._deletes.pop(k, None)
+            registry.set("live_deletes_pending", self._pending_deletes(), camera=self.camera_id)
+
+    def _run(self):
+        while True:
+            self.flush_once()
+
+    def flush_once(self) -> bool:
+        """Send what has accumulated as one pipeline. On failure only the frames are
+        dropped; retained commands and deletions are sent again with the next batch."""
+        ops, retained, deletes = self._take()
+        if self._send(ops):
+            self._sent(retained, deletes)
+            return True
+        dropped = len(ops) - retained - len(deletes)
+        registry.inc("live_updates_dropped_total", dropped, camera=self.camera_id, reason="redis_error")
+        time.sleep(self.retry_delay)
+        return False
+
+    def _send(self, ops: List[Op]) -> bool:
+        t0 = time.perf_counter()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for method, *args in ops:
+                getattr(pipe, method)(*args)
+            pipe.execute()
+        except redis.RedisError as e:
+            # Live state is best effort; repeats are rate limited by the log filter
+            logger.warning(f"Redis live update error (camera {self.camera_id}): {e}", extra={"key": "live_redis"})
+            return False
+
+        registry.observe("live_flush_seconds", time.perf_counter() - t0, camera=self.camera_id)
+        registry.inc("live_updates_sent_total", len(ops), camera=self.camera_id)
+        return True
@@ -1,28 +1,84 @@
 
-import os, time, cv2, numpy as np, json
+import os, time, numpy as np, json, logging
+from functools import partial
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from ultralytics import YOLO
-import redis
 from ..database.db_manager import db
+from ..database.batch_writer import writer, BatchedWriter
+from ..database.statements import (TRACK_SESSION_INSERT, ZONE_EVENT_INSERT, ZONE_PRESENCE_UPSERT,
+                                   HOURLY_METRICS_UPSERT, DURATION_HISTOGRAM_UPSERT, HEATMAP_GRID_UPSERT,
+                                   TRACK_EMBEDDING_INSERT, ZONE_FLOW_UPSERT, FLOOR_HEATMAP_UPSERT)
+from ..core.metrics import start_metrics_server
+from ..core.histogram import LogHistogram
+from ..core.heatmap import HeatmapGrid
+from ..core.zone_flows import ZoneFlows
+from ..core import trajectory, reid
+from ..core.track_ids import TrackIdGenerator
 from ..core.store_scope import current_store_id
-from ..core.zone_manager import ZoneManager
+from ..core.zone_manager import ZoneManager, tripwire_crossings
+from . import unique_visitors
+from .detection_log import DetectionLogWriter
+from .unique_visitors import DailyUniqueCache
+from .unique_hll import hll_ops, UNIQUE_HLL_READD_SECS
+from .queue_state import QueueMonitor
+from .alert_rules import RuleEngine
+from .anomaly_stream import StreamingAnomalyDetector, ENABLE_ANOMALY_STREAM
+from .edge_rollup import EDGE_ROLLUPS, MinuteRollup, LocalEventStore
+from .live_state import (LiveStatePublisher, LIVE_TRACK_TTL, tracks_key, cameras_key,
+                         occupancy_key, pack_track)
 
 MODEL_DEVICE=os.getenv("MODEL_DEVICE","cpu")
 REDIS_URL=os.getenv("REDIS_URL","redis://localhost:6379")
+DETECTION_LOG_DIR=os.getenv("DETECTION_LOG_DIR","")
+PROCESSOR_METRICS_PORT=int(os.getenv("PROCESSOR_METRICS_PORT","0"))
+PRESENCE_CHECKPOINT_SECS=float(os.getenv("PRESENCE_CHECKPOINT_SECS","60"))
+HOURLY_FLUSH_SECS=float(os.getenv("HOURLY_FLUSH_SECS","60"))
+HEATMAP_MAX_GAP_SECS=float(os.getenv("HEATMAP_MAX_GAP_SECS","2"))
+TRAJECTORY_TOLERANCE_PX=float(os.getenv("TRAJECTORY_TOLERANCE_PX","3"))
+TRIPWIRE_MARGIN_PX=float(os.getenv("TRIPWIRE_MARGIN_PX","8"))
+TRAJECTORY_MAX_POINTS=2000  # live points per track after in-place compaction, which runs at twice this
+REID_SAMPLE_SECS=float(os.getenv("REID_SAMPLE_SECS","1"))
+REID_MAX_SAMPLES=int(os.getenv("REID_MAX_SAMPLES","10"))  # crops averaged into a track's embedding
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def local_writer():
+    """Point this process's pipeline writes at a direct database writer.
+
+    Replays and simulations write to the local database even on a processor host
+    configured with WRITER_SPOOL_DIR or INGEST_URL: sharing the spool would interleave
+    their rows with the live camera's, and the ingest cursor is per camera. Pipelines
+    must be built inside the block, since they bind writer.submit at construction.
+    """
+    global writer
+    local = BatchedWriter(db)
+    saved = writer, unique_visitors.writer
+    writer = unique_visitors.writer = local
+    try:
+        yield local
+    finally:
+        local.stop()
+        writer, unique_visitors.writer = saved
 
 class EnhancedCentroidTracker:
-    def __init__(self, camera_id):
+    def __init__(self, camera_id, clock=time.time):
         self.camera_id = camera_id
-        self.next_id = 1
+        self.clock = clock  # injectable so recorded/synthetic streams can run on their own timeline
+        self.ids = TrackIdGenerator(camera_id, clock)  # 64-bit, unique across cameras and restarts
         self.tracks = {}  # id -> {cx, cy, last_ts, entry_time, zones_history, dwell_start}
-        self.redis_client = redis.from_url(REDIS_URL) if REDIS_URL else None
+        self.live = LiveStatePublisher(camera_id, REDIS_URL) if REDIS_URL else None
+        self._live_ops = []  # Redis commands for the current frame, sent as one batch
+        self._hll_ops = []  # this frame's unique-visitor PFADDs, which must not be dropped
         self.track_timeout = 10  # seconds
         self.max_distance = 75  # pixels
+        self.frame_size = (0, 0)  # set by the pipeline, stored with trajectories
+        self.embedder = reid.load_embedder() if reid.ENABLE_REID else None
         
     def update(self, dets):
         assigned = set()
         out = []
-        now = time.time()
+        now = self.clock()
         
         # Match detections to existing tracks
         for cx, cy, w, h in dets:
@@ -58,29 +114,32 @@ class EnhancedCentroidTracker:
                     'cx': cx, 'cy': cy, 'last_ts': now,
                     'vx': vx, 'vy': vy
                 })
+                path = old_track['path']
+                path.append((now, cx, cy))
+                if len(path) >= 2 * TRAJECTORY_MAX_POINTS:
+                    # A jittery track that stands still does not simplify under the cap at the
+                    # normal tolerance, so compact hard enough that this runs once per cap points
+                    old_track['path'] = [tuple(p) for p in trajectory.compact(
+                        np.array(path), TRAJECTORY_TOLERANCE_PX, TRAJECTORY_MAX_POINTS)]
                 
                 out.append((best_track, cx, cy, w, h))
                 
                 # Update Redis with live tracking data
-                if self.redis_client:
+                if self.live:
                     self._update_redis_track(best_track, cx, cy, w, h)
+                    self._count_unique(best_track, now)
             else:
                 # Create new track
-                tid = self.next_id
-                self.next_id += 1
+                tid = self.ids.next()
                 
-                self.tracks[tid] = {
-                    'cx': cx, 'cy': cy, 'last_ts': now,
-                    'entry_time': now, 'zones_history': [],
-                    'dwell_start': {}, 'vx': 0, 'vy': 0,
-                    'total_dwell': 0, 'queue_entries': []
-                }
+                self.tracks[tid] = self._new_track(cx, cy, now)
                 
                 out.append((tid, cx, cy, w, h))
                 
                 # Update Redis
-                if self.redis_client:
+                if self.live:
                     self._update_redis_track(tid, cx, cy, w, h)
+                    self._count_unique(tid, now)
         
         # Remove expired tracks
         expired_tracks = []
@@ -92,63 +151,111 @@ class EnhancedCentroidTracker:
                 self._finalize_track(tid, track_data)
                 
                 # Remove from Redis
-                if self.redis_client:
-                    self.redis_client.delete(f"track:{self.camera_id}:{tid}")
+                if self.live:
+                    self._live_ops.append(("hdel", tracks_key(self.camera_id), tid))
+                    self._live_ops.append(("zrem", occupancy_key(self.camera_id), tid))
         
         for tid in expired_tracks:
             del self.tracks[tid]
         
+        if self.live and self._live_ops:
+            # Occupancy: everyone seen this frame scored by now, then drop members past the timeout.
+            # One TTL refresh per frame for the camera's keys and the store's camera index
+            occ = occupancy_key(self.camera_id)
+            seen = {tid: now for tid, *_ in out}
+            if seen:
+                self._live_ops.append(("zadd", occ, seen))
+            self._live_ops += [
+                ("zremrangebyscore", occ, "-inf", f"({now - self.track_timeout}"),
+                ("expire", occ, LIVE_TRACK_TTL),
+                ("expire", tracks_key(self.camera_id), LIVE_TRACK_TTL),
+                ("sadd", cameras_key(current_store_id()), self.camera_id),
+                ("expire", cameras_key(current_store_id()), LIVE_TRACK_TTL),
+            ]
+            self.live.publish(self._live_ops)
+        if self.live and self._hll_ops:
+            self.live.publish(self._hll_ops, retain=True)
+        self._live_ops = []
+        self._hll_ops = []
+        
         return out
     
+    def _new_track(self, cx, cy, now):
+        return {
+            'cx': cx, 'cy': cy, 'last_ts': now,
+            'entry_time': now, 'zones_history': [],
+            'dwell_start': {}, 'vx': 0, 'vy': 0,
+            'total_dwell': 0, 'queue_entries': [],
+            'path': [(now, cx, cy)]
+        }
+    
+    def observe_appearance(self, frame, tracks):
+        """Add crops of this frame's tracks to their appearance embeddings (ENABLE_REID).
+        
+        A track is sampled at most once per REID_SAMPLE_SECS and REID_MAX_SAMPLES times.
+        """
+        if self.embedder is None:
+            return
+        now = self.clock()
+        for tid, cx, cy, w, h in tracks:
+            t = self.tracks.get(tid)
+            if t is None or t.get('reid_n', 0) >= REID_MAX_SAMPLES or now - t.get('reid_ts', 0) < REID_SAMPLE_SECS:
+                continue
+            vec = self.embedder(reid.crop(frame, cx, cy, w, h))
+            if vec is None:
+                continue
+            t['reid_sum'] = vec if 'reid_sum' not in t else t['reid_sum'] + vec
+            t['reid_n'] = t.get('reid_n', 0) + 1
+            t['reid_ts'] = now
+    
     def _update_redis_track(self, track_id, cx, cy, w, h):
-        """Update real-time tracking data in Redis"""
-        try:
-            track_data = {
-                'camera_id': self.camera_id,
-                'track_id': track_id,
-                'cx': cx, 'cy': cy, 'w': w, 'h': h,
-                'timestamp': time.time(),
-                'zones': list(self.tracks[track_id].get('current_zones', []))
-            }
-            
-            self.redis_client.setex(
-                f"track:{self.camera_id}:{track_id}",
-                30,  # 30 second expiry
-                json.dumps(track_data)
-            )
-            
-            # Update live metrics
-            self.redis_client.incr(f"live_count:{self.camera_id}")
-            self.redis_client.expire(f"live_count:{self.camera_id}", 60)
-            
-        except Exception as e:
-            print(f"Redis update error: {e}")
+        """Queue this frame's real-time tracking data for Redis"""
+        zones = self.tracks[track_id].get('current_zones', [])
+        self._live_ops.append(
+            ("hset", tracks_key(self.camera_id), track_id, pack_track(cx, cy, w, h, self.clock(), zones)))
+    
+    def _count_unique(self, track_id, now):
+        """Add the track to the unique-visitor HyperLogLogs once per hour it is seen in, and
+        again every UNIQUE_HLL_READD_SECS while it is live in case an add was lost"""
+        track = self.tracks[track_id]
+        hour = time.strftime("%Y-%m-%dT%H", time.gmtime(now))
+        if track.get('hll_hour') != hour or now - track.get('hll_ts', now) >= UNIQUE_HLL_READD_SECS:
+            track['hll_hour'] = hour
+            track['hll_ts'] = now
+            self._hll_ops += hll_ops(current_store_id(), self.camera_id, str(track_id), hour)
     
     def _finalize_track(self, track_id, track_data):
         """Log completed track metrics to database"""
         try:
             sid = current_store_id()
-            total_time = time.time() - track_data['entry_time']
+            total_time = self.clock() - track_data['entry_time']
+            entry_iso = _naive_utc_iso(track_data['entry_time'])
             
-            with db.transaction() as conn:
-                c = conn.cursor()
-                c.execute("""
-                    INSERT INTO track_sessions 
-                    (store_id, camera_id, track_id, entry_time, exit_time, total_dwell, 
-                     zones_visited, queue_events, created_at)
-                    VALUES (?,?,?,?,?,?,?,?,?)
-                """, (
-                    sid, self.camera_id, track_id,
-                    datetime.fromtimestamp(track_data['entry_time']).isoformat(),
-                    datetime.now().isoformat(),
-                    track_data.get('total_dwell', 0),
-                    json.dumps(track_data.get('zones_history', [])),
-                    json.dumps(track_data.get('queue_entries', [])),
-                    datetime.now().isoformat()
+            # Trajectory relative to entry, simplified to within TRAJECTORY_TOLERANCE_PX
+            points = np.array(track_data.get('path') or [(track_data['entry_time'], track_data['cx'], track_data['cy'])],
+                              dtype=np.float64)
+            points[:, 0] -= track_data['entry_time']
+            points = trajectory.simplify(points, TRAJECTORY_TOLERANCE_PX)
+            
+            writer.submit(TRACK_SESSION_INSERT, (
+                sid, self.camera_id, track_id, entry_iso,
+                _naive_utc_iso(self.clock()),
+                track_data.get('total_dwell', 0),
+                json.dumps(track_data.get('zones_history', [])),
+                json.dumps(track_data.get('queue_entries', [])),
+                datetime.now().isoformat(),
+                trajectory.encode(points, self.frame_size),
+                len(points)
+            ))
+            if track_data.get('reid_n'):
+                # Matched to a store-level person_uuid by the backend's re-ID index
+                vec = track_data['reid_sum'] / np.linalg.norm(track_data['reid_sum'])
+                writer.submit(TRACK_EMBEDDING_INSERT, (
+                    sid, self.camera_id, track_id, entry_iso,
+                    track_data['entry_time'], self.clock(), track_data['reid_n'], reid.to_bytes(vec)
                 ))
-                conn.commit()
         except Exception as e:
-            print(f"Track finalization error: {e}")
+            logger.exception(f"Track finalization error: {e}")
     
     def get_track_dwell_time(self, track_id, zone_name):
         """Get current dwell time for a track in a specific zone"""
@@ -157,7 +264,7 @@ class EnhancedCentroidTracker:
             
         dwell_start = self.tracks[track_id]['dwell_start'].get(zone_name)
         if dwell_start:
-            return time.time() - dwell_start
+            return self.clock() - dwell_start
         return 0
     
     def update_zone_presence(self, track_id, current_zones, previous_zones):
@@ -166,7 +273,7 @@ class EnhancedCentroidTracker:
             return
             
         track = self.tracks[track_id]
-        now = time.time()
+        now = self.clock()
         
         # Handle zone exits (calculate dwell time)
         for zone in previous_zones:
@@ -190,48 +297,67 @@ class EnhancedCentroidTracker:
         
         track['current_zones'] = current_zones
 
-def _publish_event(camera_id, zone_id, event_type, value, person_id, ts):
+def _naive_utc_iso(ts):
+    """Epoch seconds as naive UTC ISO, the form of track_sessions.entry_time/exit_time"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+def _publish_event(camera_id, zone_id, event_type, value, person_id, ts, local=None):
     sid=current_store_id()
-    with db.transaction() as conn:
-        c=conn.cursor()
-        c.execute("""INSERT INTO zone_events (store_id,camera_id,zone_id,event_type,value,person_id,ts)
-                     VALUES (?,?,?,?,?,?,?)""",(sid,camera_id,zone_id,event_type,value,person_id,ts))
-        conn.commit()
+    params=(sid,camera_id,zone_id,event_type,value,person_id,ts)
+    if local: local.submit(ZONE_EVENT_INSERT,params,person_id)
+    else: writer.submit(ZONE_EVENT_INSERT,params)
 
-def _mark_unique(camera_id, person_id, ymd):
+def _write_presence(camera_id, zone_id, person_id, start_ts, end_ts, samples, closed, local=None):
     sid=current_store_id()
-    with db.transaction() as conn:
-        c=conn.cursor()
-        c.execute("""INSERT OR IGNORE INTO unique_daily (store_id,camera_id,ymd,person_id) VALUES (?,?,?,?)""",(sid,camera_id,ymd,person_id))
-        conn.commit()
+    params=(sid,camera_id,zone_id,person_id,start_ts,end_ts,samples,1 if closed else 0)
+    if local: local.submit(ZONE_PRESENCE_UPSERT,params,person_id)
+    else: writer.submit(ZONE_PRESENCE_UPSERT,params)
 
 def _flush_hour(camera_id, hour_key, metrics):
+    """Add a partial hour to hourly_metrics; counters and sums are deltas, so repeated
+    flushes and restarts within the hour accumulate instead of overwriting"""
     sid=current_store_id()
-    import json
-    with db.transaction() as conn:
-        c=conn.cursor()
-        c.execute("""INSERT INTO hourly_metrics (store_id,camera_id,hour_start,footfall,unique_visitors,dwell_avg,dwell_p95,queue_wait_avg,interactions,zones_json)
-                     VALUES (?,?,?,?,?,?,?,?,?,?)""",
+    dwell_n=metrics.get("dwell_count",0); wait_n=metrics.get("queue_wait_count",0)
+    writer.submit(HOURLY_METRICS_UPSERT,
                   (sid,camera_id,hour_key,metrics.get("footfall",0),metrics.get("unique_visitors",0),
-                   metrics.get("dwell_avg",0.0),metrics.get("dwell_p95",0.0),
-                   metrics.get("queue_wait_avg",0.0),metrics.get("interactions",0),json.dumps(metrics.get("zones",{}))))
-        conn.commit()
+                   metrics.get("dwell_sum",0.0)/dwell_n if dwell_n else 0.0,metrics.get("dwell_p95",0.0),
+                   metrics.get("queue_wait_sum",0.0)/wait_n if wait_n else 0.0,metrics.get("interactions",0),
+                   metrics.get("entrance_count",0),metrics.get("exit_count",0),json.dumps(metrics.get("zones",{})),
+                   metrics.get("dwell_sum",0.0),dwell_n,metrics.get("queue_wait_sum",0.0),wait_n))
+
+def _flush_histogram(camera_id, hour_key, zone_id, metric, hist):
+    sid=current_store_id()
+    writer.submit(DURATION_HISTOGRAM_UPSERT,
+                  (sid,camera_id,hour_key,zone_id,metric,hist.count,hist.to_bytes()))
+
+def _flush_heatmap(camera_id, hour_key, heatmap):
+    sid=current_store_id()
+    writer.submit(HEATMAP_GRID_UPSERT,(sid,camera_id,hour_key,heatmap.total,heatmap.to_bytes()))
+
+def _flush_floor_heatmap(camera_id, hour_key, grid):
+    sid=current_store_id()
+    writer.submit(FLOOR_HEATMAP_UPSERT,(sid,camera_id,hour_key,grid.total,grid.to_bytes()))
+
+def _flush_flows(camera_id, hour_key, flows):
+    sid=current_store_id()
+    writer.submit(ZONE_FLOW_UPSERT,(sid,camera_id,hour_key,flows.tracks,flows.to_bytes()))
 
 class QueueManager:
-    def __init__(self, camera_id):
+    def __init__(self, camera_id, clock=time.time):
         self.camera_id = camera_id
+        self.clock = clock
         self.queue_entries = {}  # track_id -> entry_time
         self.queue_wait_times = []
         
     def track_queue_entry(self, track_id, zone_type):
         """Track when someone enters a queue zone"""
         if zone_type == "queue" and track_id not in self.queue_entries:
-            self.queue_entries[track_id] = time.time()
+            self.queue_entries[track_id] = self.clock()
     
     def track_queue_exit(self, track_id, zone_type):
         """Track when someone exits a queue zone"""
         if zone_type == "queue" and track_id in self.queue_entries:
-            wait_time = time.time() - self.queue_entries[track_id]
+            wait_time = self.clock() - self.queue_entries[track_id]
             self.queue_wait_times.append(wait_time)
             del self.queue_entries[track_id]
             return wait_time
@@ -247,7 +373,384 @@ class QueueManager:
         """Reset queue metrics for new time period"""
         self.queue_wait_times = []
 
+def _new_hour_metrics():
+    """Counters accumulated since the last partial-hour flush"""
+    return {
+        "footfall": 0, "unique_visitors": 0, "dwell_sum": 0.0, "dwell_count": 0,
+        "dwell_p95": 0.0, "queue_wait_sum": 0.0, "queue_wait_count": 0, "interactions": 0,
+        "zones": {}, "entrance_count": 0, "exit_count": 0
+    }
+
+class ZoneEventPipeline:
+    """Tracker -> zone -> event stages of run_camera, independent of capture and inference.
+
+    run_camera feeds it live YOLO detections; the re-analysis tool feeds it recorded
+    detections. Time comes from the tracker clock so non-live streams stay consistent.
+    """
+    def __init__(self, camera_id, tracker=None, zm=None, edge=EDGE_ROLLUPS, anomalies=ENABLE_ANOMALY_STREAM,
+                 rules=True):
+        self.camera_id = camera_id
+        self.tracker = tracker or EnhancedCentroidTracker(camera_id)
+        self.zm = zm or ZoneManager(camera_id)
+        self.queue_manager = QueueManager(camera_id, clock=self.tracker.clock)
+        self.queues = QueueMonitor(camera_id)  # live length, rates and expected wait per queue zone
+        live = self.tracker.live
+        # Only live pipelines evaluate alert rules; replayed data must not fire or resolve real alerts
+        self.alerts = RuleEngine(camera_id, writer.submit, partial(live.publish, retain=True) if live else None,
+                                 clock=self.tracker.clock) if rules else None
+        self._frame_interval = None  # EWMA seconds between processed frames, for fps rules
+        # Off for replays and simulations: their anomalies and baselines are not the live camera's
+        self.anomalies = StreamingAnomalyDetector(camera_id, writer.submit) if anomalies else None
+        self.per_track_zones = {}
+        self.presence = {}  # (tid, zone) -> open interval {start, end, samples, written}
+        self.uniques = DailyUniqueCache(camera_id)
+        self.track_dwell = {}  # live tid -> total_dwell, booked into the hour when the track ends
+        self.hour_key = None
+        self.metrics = _new_hour_metrics()
+        self.hists = {}  # (zone or '', metric) -> durations since the last flush
+        self.hour_dwell = LogHistogram()  # dwell of every track finished this hour, for dwell_p95
+        self._waits_flushed = 0
+        self._last_flush = None
+        self.heatmap = HeatmapGrid()  # person-seconds per cell since the last flush
+        self.floor_heatmap = None  # the same per floor-plan cell, when the camera is calibrated
+        self.flows = ZoneFlows()  # zone transitions and co-visits since the last flush
+        self.wire_anchors = {}  # tid -> (K, 2) last position clear of each tripwire
+        self._last_frame = None
+        # Edge mode: ship minute rollups, keep raw events on the processor
+        self.rollup = MinuteRollup(camera_id, writer.submit) if edge else None
+        self.local_events = LocalEventStore(camera_id, upstream=writer.submit) if edge else None
+
+    def roll_hour(self, now):
+        """Flush the previous hour when `now` falls into a new one"""
+        hk = now.strftime("%Y-%m-%dT%H:00:00")
+        if self.hour_key is None:
+            self.hour_key = hk
+        elif hk != self.hour_key:
+            self.flush_hour(now)
+            self.hour_key = hk
+            self.hour_dwell = LogHistogram()
+            self._waits_flushed = 0
+            self.queue_manager.reset_period()
+
+    def flush_hour(self, now):
+        """Upsert what the current hour gained since the last flush.
+
+        Runs every HOURLY_FLUSH_SECS so the current hour is visible while it is in
+        progress; the flush at the hour boundary is simply the last one.
+        """
+        self._last_flush = now
+        if self.hour_key is None:
+            return
+        metrics = self.metrics
+        
+        waits = self.queue_manager.queue_wait_times[self._waits_flushed:]
+        self._waits_flushed += len(waits)
+        metrics["queue_wait_sum"] = float(sum(waits))
+        metrics["queue_wait_count"] = len(waits)
+        
+        if self.hour_dwell.count:
+            metrics["dwell_p95"] = self.hour_dwell.quantile(0.95)
+        
+        _flush_hour(self.camera_id, self.hour_key, metrics)
+        for (zone_id, metric), hist in self.hists.items():
+            _flush_histogram(self.camera_id, self.hour_key, zone_id, metric, hist)
+        if self.heatmap.total > 0:
+            _flush_heatmap(self.camera_id, self.hour_key, self.heatmap)
+            self.heatmap.reset()
+        if self.floor_heatmap is not None and self.floor_heatmap.total > 0:
+            _flush_floor_heatmap(self.camera_id, self.hour_key, self.floor_heatmap)
+            self.floor_heatmap.reset()
+        if not self.flows.empty:
+            _flush_flows(self.camera_id, self.hour_key, self.flows)
+            self.flows.reset()
+        self.metrics = _new_hour_metrics()
+        self.hists = {}
+
+    def _floor_grid(self, floor):
+        grid = self.floor_heatmap
+        if grid is None or grid.grid.shape != (floor.cell_rows, floor.cell_cols):
+            grid = self.floor_heatmap = HeatmapGrid(floor.cell_rows, floor.cell_cols)
+        return grid
+
+    def _record_duration(self, zone_id, metric, seconds):
+        """Add a completed dwell or queue wait to the pending histogram of (zone, metric)"""
+        hist = self.hists.get((zone_id, metric))
+        if hist is None:
+            hist = self.hists[(zone_id, metric)] = LogHistogram()
+        hist.add(seconds)
+        if self.anomalies and metric == "dwell":
+            self.anomalies.add_dwell(zone_id, seconds)
+        if self.rollup:
+            if metric == "dwell":
+                self.rollup.add_dwell(zone_id, seconds)
+            else:
+                self.rollup.add(zone_id, "queue_wait_sum", seconds)
+                self.rollup.add(zone_id, "queue_wait_count")
+
+    def _extend_presence(self, tid, zone_name, now):
+        """Add a sample to the open interval, writing it on open and every checkpoint"""
+        iv = self.presence.get((tid, zone_name))
+        if iv is None:
+            iv = self.presence[(tid, zone_name)] = {"start": now, "end": now, "samples": 0, "written": None}
+        iv["end"] = now
+        iv["samples"] += 1
+        if iv["written"] is None or (now - iv["written"]).total_seconds() >= PRESENCE_CHECKPOINT_SECS:
+            _write_presence(self.camera_id, zone_name, tid, iv["start"].isoformat(),
+                            now.isoformat(), iv["samples"], False, self.local_events)
+            iv["written"] = now
+
+    def _close_presence(self, tid, zone_name):
+        iv = self.presence.pop((tid, zone_name), None)
+        if iv:
+            _write_presence(self.camera_id, zone_name, tid, iv["start"].isoformat(),
+                            iv["end"].isoformat(), iv["samples"], True, self.local_events)
+            self._record_duration(zone_name, "dwell", (iv["end"] - iv["start"]).total_seconds())
+
+    def close_open_presence(self):
+        """Close every open presence interval, e.g. at the end of a replay"""
+        for tid, zone_name in list(self.presence):
+            self._close_presence(tid, zone_name)
+
+    def close(self, now):
+        """Write out all in-progress state, e.g. at the end of a replay or simulation"""
+        self.close_open_presence()
+        self.flows.finish_all()
+        self.uniques.flush()
+        if self.anomalies:
+            self.anomalies.persist(now)
+        self.flush_hour(now)
+        if self.rollup:
+            self.rollup.flush()
+            self.local_events.flush(now)
+
+    def _cross_tripwires(self, now, W, H, tracks, names, a, b):
+        """Count directed tripwire crossings of this frame's tracks (one vectorized test)"""
+        k = len(names)
+        points = np.array([(t[1], t[2]) for t in tracks], dtype=np.float64).reshape(-1, 2)
+        blank = np.full((k, 2), np.nan)
+        anchors = np.stack([self.wire_anchors.get(t[0], blank) for t in tracks]) if tracks else np.zeros((0, k, 2))
+        if anchors.shape[1:] != (k, 2):  # zones reloaded with a different set of wires
+            anchors = np.full((len(tracks), k, 2), np.nan)
+        crossed, settled = tripwire_crossings(anchors, points, a, b, TRIPWIRE_MARGIN_PX)
+        anchors[settled] = np.broadcast_to(points[:, None, :], anchors.shape)[settled]
+        for i, t in enumerate(tracks):
+            self.wire_anchors[t[0]] = anchors[i]
+        
+        metrics = self.metrics
+        for i, j in zip(*np.nonzero(crossed)):
+            tid = tracks[i][0]
+            if crossed[i, j] > 0:
+                metrics["footfall"] += 1
+                metrics["entrance_count"] += 1
+                event, field = "cross_in", "entries"
+                if self.anomalies:
+                    self.anomalies.add_entry("")
+                    self.anomalies.add_entry(names[j])
+            else:
+                metrics["exit_count"] += 1
+                event, field = "cross_out", "exits"
+            _publish_event(self.camera_id, names[j], event, 1, tid, now.isoformat(), self.local_events)
+            if self.rollup:
+                self.rollup.add(names[j], field)
+                self.rollup.add("", field)
+        
+        for tid in [t for t in self.wire_anchors if t not in self.tracker.tracks]:
+            del self.wire_anchors[tid]
+
+    def _rule_values(self, ts, tracked, occupancy):
+        """Current values of the metrics alert rules can reference"""
+        values = {("occupancy", ""): tracked,
+                  ("fps", ""): 1.0 / self._frame_interval if self._frame_interval else 0.0}
+        for zone in self.zm.zones:
+            values[("zone_occupancy", zone["name"])] = occupancy.get(zone["name"], 0)
+        waits = any(r.metric == "queue_wait" for r in self.alerts.rules)
+        for name, q in self.queues.zones.items():
+            values[("queue_length", name)] = q.length
+            if waits:
+                values[("queue_wait", name)] = q.snapshot(ts)["expected_wait_secs"] or 0.0
+        return values
+    
+    def process(self, now, W, H, dets):
+        """Track detections and run zone/event logic; returns the tracker output"""
+        self.tracker.frame_size = (W, H)
+        tracks = self.tracker.update(dets)
+        self.process_tracks(now, W, H, tracks)
+        return tracks
+
+    def process_tracks(self, now, W, H, tracks):
+        """Zone classification, events and hourly counters for already-tracked people"""
+        camera_id = self.camera_id
+        tracker = self.tracker
+        zm = self.zm
+        queue_manager = self.queue_manager
+        queues = self.queues
+        ts = now.timestamp()
+        per_track_zones = self.per_track_zones
+        metrics = self.metrics
+        rollup = self.rollup
+        anomalies = self.anomalies
+        if rollup and rollup.roll(now):
+            self.local_events.flush(now)
+        if anomalies:
+            anomalies.roll(now)
+        occupancy = {}  # zone -> people in it this frame
+        
+        # With tripwires, footfall and exits come from line crossings instead of entry zones
+        wire_names, wire_a, wire_b = zm.get_tripwires(W, H)
+        if wire_names:
+            self._cross_tripwires(now, W, H, tracks, wire_names, wire_a, wire_b)
+        
+        # Process each tracked person
+        for tid, cx, cy, w, h in tracks:
+            track = tracker.tracks.get(tid, {})
+            self.uniques.observe(tid, now, track.get('total_dwell', 0))
+            if tid not in per_track_zones:
+                metrics["unique_visitors"] += 1
+            
+            # Zone classification
+            hits = zm.classify(W, H, cx, cy, h)
+            current_zones = set([h["name"] for h in hits])
+            previous_zones = set(per_track_zones.get(tid, []))
+            
+            # Update tracker with zone information
+            tracker.update_zone_presence(tid, current_zones, previous_zones)
+            
+            # Zone transition events
+            for zone_name in (current_zones - previous_zones):
+                _publish_event(camera_id, zone_name, "enter", 1, tid, now.isoformat(), self.local_events)
+                self.flows.enter(tid, zone_name)
+                
+                # Handle specific zone types
+                zone_info = next((z for z in hits if z["name"] == zone_name), None)
+                if zone_info:
+                    zone_type = zone_info["ztype"]
+                    
+                    # Queue management
+                    if zone_type == "queue":
+                        queue_manager.track_queue_entry(tid, zone_type)
+                        queues.zone(zone_name).arrive(tid, ts)
+                        if rollup:
+                            rollup.add(zone_name, "queue_joins")
+                            rollup.add("", "queue_joins")
+                    
+                    # Entrance tracking
+                    elif zone_type == "entry" and not wire_names:
+                        if tid not in per_track_zones:
+                            metrics["footfall"] += 1
+                            metrics["entrance_count"] += 1
+                            if rollup:
+                                rollup.add("", "entries")
+                            if anomalies:
+                                anomalies.add_entry("")
+                if rollup:
+                    rollup.add(zone_name, "entries")
+                if anomalies:
+                    anomalies.add_entry(zone_name)
+            
+            for zone_name in (previous_zones - current_zones):
+                _publish_event(camera_id, zone_name, "exit", 1, tid, now.isoformat(), self.local_events)
+                
+                # Handle queue exits; the person has left the zone, so look it up by name
+                zone_info = zm.get_zone_by_name(zone_name)
+                if rollup:
+                    rollup.add(zone_name, "exits")
+                if zone_info and zone_info["ztype"] == "queue":
+                    queues.zone(zone_name).depart(tid, ts)
+                    if rollup:
+                        rollup.add(zone_name, "queue_leaves")
+                        rollup.add("", "queue_leaves")
+                    wait_time = queue_manager.track_queue_exit(tid, "queue")
+                    if wait_time > 0:
+                        self._record_duration(zone_name, "queue_wait", wait_time)
+                        self._record_duration("", "queue_wait", wait_time)
+            
+            # Presence intervals (run-length instead of one row per frame)
+            for zone_name in (previous_zones - current_zones):
+                self._close_presence(tid, zone_name)
+            for zone_name in current_zones:
+                self._extend_presence(tid, zone_name, now)
+            
+            # Interaction tracking
+            shelf_interactions = any(z["ztype"] == "shelf" for z in hits)
+            if shelf_interactions:
+                metrics["interactions"] += 1
+                if rollup:
+                    rollup.add("", "interactions")
+                    for z in hits:
+                        if z["ztype"] == "shelf":
+                            rollup.add(z["name"], "interactions")
+            
+            # Zone-specific metrics
+            for zone_hit in hits:
+                zone_name = zone_hit["name"]
+                metrics["zones"][zone_name] = metrics["zones"].get(zone_name, 0) + 1
+                occupancy[zone_name] = occupancy.get(zone_name, 0) + 1
+            
+            # Update zone tracking
+            per_track_zones[tid] = current_zones
+            self.track_dwell[tid] = tracker.tracks.get(tid, {}).get('total_dwell', 0)
+        
+        if self._last_frame is not None:
+            gap = (now - self._last_frame).total_seconds()
+            if gap > 0:
+                self._frame_interval = gap if self._frame_interval is None else 0.9 * self._frame_interval + 0.1 * gap
+        
+        # Dwell-weighted occupancy grid: each person adds the time since the previous frame
+        if self._last_frame is not None and tracks:
+            dt = min((now - self._last_frame).total_seconds(), HEATMAP_MAX_GAP_SECS)
+            self.heatmap.add_points([t[1] for t in tracks], [t[2] for t in tracks], W, H, dt)
+            if zm.floor is not None:
+                # O(1) table lookup of each foot point's floor cell
+                self._floor_grid(zm.floor).add_cells(
+                    zm.floor.cells(W, H, [t[1] for t in tracks], [t[2] + t[4] / 2 for t in tracks]), dt)
+        self._last_frame = now
+        
+        # Close intervals of tracks the tracker has expired and book their dwell
+        for tid, zone_name in [k for k in self.presence if k[0] not in tracker.tracks]:
+            self._close_presence(tid, zone_name)
+            if zone_name in queues.zones:
+                queues.zone(zone_name).depart(tid, ts)
+        queue_zones = [z["name"] for z in zm.zones if z["ztype"] == "queue"]
+        if queue_zones or queues.zones:
+            queues.set_lengths(occupancy, queue_zones)
+            if tracker.live and queues.due(ts):
+                tracker.live.publish(queues.ops(current_store_id(), ts))
+        
+        # Alert rules on this frame's values
+        if self.alerts:
+            self.alerts.maybe_reload(ts)
+            if self.alerts.rules:
+                self.alerts.evaluate(ts, self._rule_values(ts, len(tracks), occupancy))
+        if rollup:
+            # One occupancy sample per processed frame, zero included, per zone and camera
+            rollup.sample_occupancy("", len(tracks))
+            for zone in zm.zones:
+                rollup.sample_occupancy(zone["name"], occupancy.get(zone["name"], 0))
+        if anomalies:
+            anomalies.sample_occupancy("", len(tracks))
+            for zone in zm.zones:
+                anomalies.sample_occupancy(zone["name"], occupancy.get(zone["name"], 0))
+        for tid in [t for t in self.track_dwell if t not in tracker.tracks]:
+            self.flows.finish(tid)
+            if rollup and not wire_names:
+                rollup.add("", "exits")
+            dwell = self.track_dwell.pop(tid)
+            if dwell > 0:
+                metrics["dwell_sum"] += dwell
+                metrics["dwell_count"] += 1
+                self.hour_dwell.add(dwell)
+                self._record_duration("", "dwell", dwell)
+        
+        self.uniques.maybe_flush(now)
+        if self._last_flush is None:
+            self._last_flush = now
+        elif (now - self._last_flush).total_seconds() >= HOURLY_FLUSH_SECS:
+            self.flush_hour(now)
+
 def run_camera(camera_id: int, rtsp_url: str):
+    # Capture and inference only; the pipeline above imports without them (replays, tests)
+    import cv2
+    from ultralytics import YOLO
     cap = cv2.VideoCapture(rtsp_url)
     
     # Initialize camera with auto-reconnect
@@ -255,39 +758,37 @@ def run_camera(camera_id: int, rtsp_url: str):
     max_retries = 5
     
     while not cap.isOpened() and retry_count < max_retries:
-        print(f"Attempting to connect to camera {camera_id} (attempt {retry_count + 1})")
+        logger.info(f"Attempting to connect to camera {camera_id} (attempt {retry_count + 1})")
         cap = cv2.VideoCapture(rtsp_url)
         retry_count += 1
         time.sleep(5)
     
     if not cap.isOpened():
-        print(f"Failed to connect to camera {camera_id} after {max_retries} attempts")
+        logger.error(f"Failed to connect to camera {camera_id} after {max_retries} attempts")
         return
     
     # Enhanced initialization
     model = YOLO("yolov8n.pt")
-    tracker = EnhancedCentroidTracker(camera_id)
-    zm = ZoneManager(camera_id)
-    queue_manager = QueueManager(camera_id)
+    writer.start()
+    if PROCESSOR_METRICS_PORT:
+        start_metrics_server(PROCESSOR_METRICS_PORT)
+    pipeline = ZoneEventPipeline(camera_id)
+    tracker = pipeline.tracker
     
-    per_track_zones = {}
-    hour_key = None
-    metrics = {
-        "footfall": 0, "unique_visitors": 0, "dwell_avg": 0.0, 
-        "dwell_p95": 0.0, "queue_wait_avg": 0.0, "interactions": 0, 
-        "zones": {}, "entrance_count": 0, "exit_count": 0
-    }
+    # Optional append-only record of post-filter detections for offline re-analysis
+    detection_log = DetectionLogWriter(DETECTION_LOG_DIR, camera_id) if DETECTION_LOG_DIR else None
     
     frame_count = 0
     detection_interval = max(1, int(os.getenv("DETECTION_INTERVAL", "3")))  # Process every Nth frame
     
-    print(f"Started processing camera {camera_id}")
+    logger.info(f"Started processing camera {camera_id}")
     
     while True:
         try:
             ok, frame = cap.read()
             if not ok:
-                print(f"Failed to read frame from camera {camera_id}, reconnecting...")
+                logger.warning(f"Failed to read frame from camera {camera_id}, reconnecting...")
+                pipeline.alerts.evaluate(time.time(), {("fps", ""): 0.0})
                 cap.release()
                 time.sleep(2)
                 cap = cv2.VideoCapture(rtsp_url)
@@ -295,41 +796,9 @@ def run_camera(camera_id: int, rtsp_url: str):
                 
             H, W = frame.shape[:2]
             now = datetime.now(timezone.utc)
-            ymd = now.strftime("%Y-%m-%d")
-            hk = now.strftime("%Y-%m-%dT%H:00:00")
             
             # Handle hour transition
-            if hour_key is None:
-                hour_key = hk
-            elif hk != hour_key:
-                # Calculate final metrics for the hour
-                metrics["queue_wait_avg"] = queue_manager.get_average_wait_time()
-                
-                # Calculate unique visitors from tracker data
-                unique_count = len([t for t in tracker.tracks.values() 
-                                 if (now.timestamp() - t['entry_time']) < 3600])
-                metrics["unique_visitors"] = unique_count
-                
-                # Calculate dwell statistics
-                all_dwell_times = []
-                for track in tracker.tracks.values():
-                    if track.get('total_dwell', 0) > 0:
-                        all_dwell_times.append(track['total_dwell'])
-                
-                if all_dwell_times:
-                    metrics["dwell_avg"] = float(np.mean(all_dwell_times))
-                    metrics["dwell_p95"] = float(np.percentile(all_dwell_times, 95))
-                
-                _flush_hour(camera_id, hour_key, metrics)
-                
-                # Reset for new hour
-                hour_key = hk
-                metrics = {
-                    "footfall": 0, "unique_visitors": 0, "dwell_avg": 0.0,
-                    "dwell_p95": 0.0, "queue_wait_avg": 0.0, "interactions": 0,
-                    "zones": {}, "entrance_count": 0, "exit_count": 0
-                }
-                queue_manager.reset_period()
+            pipeline.roll_hour(now)
             
             # Skip detection for performance optimization
             frame_count += 1
@@ -340,6 +809,7 @@ def run_camera(camera_id: int, rtsp_url: str):
             # Person detection
             res = model(frame, imgsz=640, device=MODEL_DEVICE, verbose=False)
             dets = []
+            confs = []
             
             for r in res:
                 for b in r.boxes:
@@ -359,74 +829,26 @@ def run_camera(camera_id: int, rtsp_url: str):
                         continue
                         
                     dets.append((cx, cy, w, h))
+                    confs.append(conf)
             
-            # Update tracking
-            tracks = tracker.update(dets)
+            # Tracking, zones and events
+            tracks = pipeline.process(now, W, H, dets)
+            tracker.observe_appearance(frame, tracks)
             
-            # Process each tracked person
-            for tid, cx, cy, w, h in tracks:
-                _mark_unique(camera_id, str(tid), ymd)
-                
-                # Zone classification
-                hits = zm.classify(W, H, cx, cy)
-                current_zones = set([h["name"] for h in hits])
-                previous_zones = set(per_track_zones.get(tid, []))
-                
-                # Update tracker with zone information
-                tracker.update_zone_presence(tid, current_zones, previous_zones)
-                
-                # Zone transition events
-                for zone_name in (current_zones - previous_zones):
-                    _publish_event(camera_id, zone_name, "enter", 1, str(tid), now.isoformat())
-                    
-                    # Handle specific zone types
-                    zone_info = next((z for z in hits if z["name"] == zone_name), None)
-                    if zone_info:
-                        zone_type = zone_info["ztype"]
-                        
-                        # Queue management
-                        if zone_type == "queue":
-                            queue_manager.track_queue_entry(tid, zone_type)
-                        
-                        # Entrance tracking
-                        elif zone_type == "entry":
-                            if tid not in [t for t in per_track_zones.keys()]:
-                                metrics["footfall"] += 1
-                                metrics["entrance_count"] += 1
-                
-                for zone_name in (previous_zones - current_zones):
-                    _publish_event(camera_id, zone_name, "exit", 1, str(tid), now.isoformat())
-                    
-                    # Handle queue exits
-                    zone_exits = zm.classify(W, H, cx, cy)  # Get zone info for exits
-                    for zone_info in zone_exits:
-                        if zone_info["name"] == zone_name and zone_info["ztype"] == "queue":
-                            wait_time = queue_manager.track_queue_exit(tid, "queue")
-                
-                # Continuous presence events
-                for zone_name in current_zones:
-                    _publish_event(camera_id, zone_name, "presence", 1, str(tid), now.isoformat())
-                
-                # Interaction tracking
-                shelf_interactions = any(z["ztype"] == "shelf" for z in hits)
-                if shelf_interactions:
-                    metrics["interactions"] += 1
-                
-                # Zone-specific metrics
-                for zone_hit in hits:
-                    zone_name = zone_hit["name"]
-                    metrics["zones"][zone_name] = metrics["zones"].get(zone_name, 0) + 1
-                
-                # Update zone tracking
-                per_track_zones[tid] = current_zones
+            if detection_log:
+                # tracker.update emits exactly one track per detection, in detection order
+                detection_log.write_frame(now.timestamp(), W, H, tracks, confs)
             
             # Performance monitoring
             if frame_count % 100 == 0:
                 active_tracks = len(tracker.tracks)
-                print(f"Camera {camera_id}: {active_tracks} active tracks, Frame {frame_count}")
+                logger.info(f"Camera {camera_id}: {active_tracks} active tracks, Frame {frame_count}",
+                            extra={"active_tracks": active_tracks, "frame": frame_count})
+                if detection_log:
+                    detection_log.flush()
             
         except Exception as e:
-            print(f"Error processing camera {camera_id}: {e}")
+            logger.exception(f"Error processing camera {camera_id}: {e}")
             time.sleep(1)
             continue
         
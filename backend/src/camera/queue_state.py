@@ -0,0 +1,144 @@
+"""
+Live queue length and expected wait per queue zone.
+
+For each queue zone the processor keeps the current number of people in it (from
+the frame's zone classification), the join and leave times of the last
+QUEUE_RATE_WINDOW_SECS, and an exponentially weighted service time. Service time
+of a leaver is the time since the later of its join and the previous leave, i.e.
+how long the head of a FIFO queue took.
+
+Expected wait for someone joining now:
+  - Little's law, W = L / lambda with lambda the departure rate over the window, once
+    the window holds QUEUE_MIN_DEPARTURES leaves;
+  - otherwise L x the EWMA service time, which is available after one leave.
+
+Every QUEUE_PUBLISH_SECS the processor writes one msgpack record per zone into the
+store hash queues:{store_id} (field "{camera_id}:{zone}") through the tracker's live
+publisher, so a store's queues are read with one HGETALL. Records carry their
+timestamp; readers skip those older than QUEUE_STALE_SECS.
+"""
+
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import msgpack
+
+QUEUE_RATE_WINDOW_SECS = float(os.getenv("QUEUE_RATE_WINDOW_SECS", "300"))
+QUEUE_SERVICE_ALPHA = float(os.getenv("QUEUE_SERVICE_ALPHA", "0.2"))
+QUEUE_MIN_DEPARTURES = int(os.getenv("QUEUE_MIN_DEPARTURES", "3"))
+QUEUE_PUBLISH_SECS = float(os.getenv("QUEUE_PUBLISH_SECS", "1"))
+QUEUE_STALE_SECS = 30  # records not refreshed for this long belong to a stopped processor
+
+def queues_key(store_id) -> str:
+    return f"queues:{store_id}"
+
+def _round(v: Optional[float]) -> Optional[float]:
+    return round(v, 1) if v is not None else None
+
+class QueueEstimator:
+    """Rates, service time and wait estimate of one queue zone"""
+
+    def __init__(self, window: float = QUEUE_RATE_WINDOW_SECS, alpha: float = QUEUE_SERVICE_ALPHA):
+        self.window = window
+        self.alpha = alpha
+        self.length = 0
+        self.arrivals: deque = deque()
+        self.departures: deque = deque()
+        self.joined: Dict[Any, float] = {}  # tid -> join time of people in the queue
+        self.service: Optional[float] = None  # EWMA seconds
+        self.last_departure: Optional[float] = None
+        self.started: Optional[float] = None
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        while self.arrivals and self.arrivals[0] < cutoff:
+            self.arrivals.popleft()
+        while self.departures and self.departures[0] < cutoff:
+            self.departures.popleft()
+
+    def arrive(self, tid, now: float):
+        if self.started is None:
+            self.started = now
+        self.arrivals.append(now)
+        self.joined.setdefault(tid, now)
+
+    def depart(self, tid, now: float):
+        if self.started is None:
+            self.started = now
+        joined = self.joined.pop(tid, None)
+        if joined is not None:
+            sample = now - max(joined, self.last_departure or joined)
+            self.service = sample if self.service is None else \
+                self.alpha * sample + (1 - self.alpha) * self.service
+        self.departures.append(now)
+        self.last_departure = now
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        self._trim(now)
+        span = min(self.window, max(now - (now if self.started is None else self.started), 1.0))
+        arrival_rate = len(self.arrivals) / span
+        departure_rate = len(self.departures) / span
+        littles = self.length / departure_rate if len(self.departures) >= QUEUE_MIN_DEPARTURES else None
+        by_service = self.length * self.service if self.service is not None else None
+        expected = littles if littles is not None else by_service
+        return {
+            "length": self.length,
+            "arrivals_per_min": round(arrival_rate * 60, 2),
+            "departures_per_min": round(departure_rate * 60, 2),
+            "service_secs": _round(self.service),
+            "wait_littles_secs": _round(littles),
+            "wait_service_secs": _round(by_service),
+            "expected_wait_secs": _round(expected),
+        }
+
+class QueueMonitor:
+    """Queue estimators of one camera's queue zones and their periodic Redis records"""
+
+    def __init__(self, camera_id, publish_every: float = QUEUE_PUBLISH_SECS):
+        self.camera_id = camera_id
+        self.publish_every = publish_every
+        self.zones: Dict[str, QueueEstimator] = {}
+        self._last_publish: Optional[float] = None
+
+    def zone(self, name: str) -> QueueEstimator:
+        q = self.zones.get(name)
+        if q is None:
+            q = self.zones[name] = QueueEstimator()
+        return q
+
+    def set_lengths(self, lengths: Dict[str, int], queue_zones: List[str]):
+        """People in each queue zone this frame (zones seen joining, e.g. floor zones, included)"""
+        for name in set(queue_zones) | set(self.zones):
+            self.zone(name).length = lengths.get(name, 0)
+
+    def due(self, now: float) -> bool:
+        return self._last_publish is None or now - self._last_publish >= self.publish_every
+
+    def ops(self, store_id, now: float) -> List[tuple]:
+        """Redis commands writing every zone's record (one HSET for the camera)"""
+        self._last_publish = now
+        if not self.zones:
+            return []
+        key = queues_key(store_id)
+        mapping = {}
+        for name, q in self.zones.items():
+            record = q.snapshot(now)
+            record["ts"] = now
+            mapping[f"{self.camera_id}:{name}"] = msgpack.packb(record)
+        return [("hset", key, None, None, mapping), ("expire", key, QUEUE_STALE_SECS * 10)]
+
+def read_store_queues(client, store_id, now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Live state of every queue zone of a store (one HGETALL)"""
+    now = now if now is not None else time.time()
+    out = []
+    for field, value in client.hgetall(queues_key(store_id)).items():
+        field = field.decode() if isinstance(field, bytes) else field
+        record = msgpack.unpackb(value)
+        if now - record.get("ts", 0) > QUEUE_STALE_SECS:
+            continue
+        camera_id, zone = field.split(":", 1)
+        record.update({"camera_id": int(camera_id), "zone": zone})
+        out.append(record)
+    return sorted(out, key=lambda r: (r["camera_id"], r["zone"]))
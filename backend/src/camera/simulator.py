@@ -0,0 +1,321 @@
+"""
+Synthetic shopper trajectories for load-testing the tracker -> zone -> event stages.
+
+Shoppers arrive as a Poisson process, walk from an entry zone to a few shelf zones,
+dwell there, optionally wait in a FIFO checkout queue and leave the way they came.
+Detections get Gaussian jitter and occlusion dropouts, then go through the same
+ZoneEventPipeline as run_camera on a simulated clock, so runs are much faster than
+real time. The report compares footfall, dwell and queue metrics with ground truth.
+Rows are written straight to the scratch database; the command refuses to run with
+INGEST_URL or WRITER_SPOOL_DIR set so nothing can reach a live store's data.
+
+    python -m src.camera.simulator --camera-id 1 --minutes 120 --db /tmp/sim.db
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from ..database.db_manager import db, migrate_all, DB_PATH
+from ..core.store_scope import current_store_id
+from ..core.zone_manager import EnhancedZoneManager, point_in_poly
+from .processor import EnhancedCentroidTracker, ZoneEventPipeline, local_writer
+
+class SimClock:
+    """Mutable clock shared by the tracker and queue manager"""
+    def __init__(self, t: float):
+        self.t = t
+    def __call__(self) -> float:
+        return self.t
+
+class Shopper:
+    """Piecewise-linear path through the frame with a precomputed timeline"""
+    def __init__(self, sid: int, t0: float, x: float, y: float, box: Tuple[float, float]):
+        self.sid = sid
+        self.ts = [t0]
+        self.xs = [x]
+        self.ys = [y]
+        self.box = box
+        self.occluded_until = 0.0
+        self.entry = None
+        self.checkout = False
+        self.queue = None
+
+    @property
+    def t_end(self) -> float:
+        return self.ts[-1]
+
+    def move_to(self, x: float, y: float, speed: float):
+        dist = np.hypot(x - self.xs[-1], y - self.ys[-1])
+        self.ts.append(self.ts[-1] + dist / max(speed, 1e-6))
+        self.xs.append(x)
+        self.ys.append(y)
+
+    def stay(self, seconds: float):
+        self.ts.append(self.ts[-1] + max(seconds, 0.0))
+        self.xs.append(self.xs[-1])
+        self.ys.append(self.ys[-1])
+
+    def position(self, t: float) -> Tuple[float, float]:
+        return float(np.interp(t, self.ts, self.xs)), float(np.interp(t, self.ts, self.ys))
+
+class TrajectorySimulator:
+    def __init__(self, zm: EnhancedZoneManager, width: int, height: int, fps: float = 4.0,
+                 arrivals_per_min: float = 2.0, shelves_per_visit: float = 2.0,
+                 dwell_mean: float = 30.0, dwell_sigma: float = 0.8,
+                 checkout_prob: float = 0.6, service_mean: float = 45.0,
+                 walk_speed: float = 60.0, jitter_px: float = 3.0,
+                 dropout_prob: float = 0.02, occlusion_mean: float = 1.0, seed: int = 0):
+        self.zm = zm
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.arrivals_per_min = arrivals_per_min
+        self.shelves_per_visit = shelves_per_visit
+        self.dwell_mean = dwell_mean      # seconds, mean of the lognormal shelf dwell
+        self.dwell_sigma = dwell_sigma    # lognormal shape
+        self.checkout_prob = checkout_prob
+        self.service_mean = service_mean  # seconds, exponential checkout service time
+        self.walk_speed = walk_speed      # pixels per second
+        self.jitter_px = jitter_px
+        self.dropout_prob = dropout_prob  # chance per visible frame that an occlusion starts
+        self.occlusion_mean = occlusion_mean
+        self.rng = np.random.default_rng(seed)
+
+        zones = zm.get_scaled_zones(width, height)
+        self.zones = zones
+        self.entries = [z for z in zones if z["ztype"] == "entry"]
+        self.shelves = [z for z in zones if z["ztype"] not in ("entry", "queue", "tripwire")]
+        self.queues = [z for z in zones if z["ztype"] == "queue"]
+
+    def _point_in(self, zone: Optional[Dict[str, Any]]) -> Tuple[float, float]:
+        """Uniform random point inside a scaled zone, or anywhere in frame"""
+        if zone is None:
+            return float(self.rng.uniform(0, self.width)), float(self.rng.uniform(0, self.height))
+        xs = [p[0] for p in zone["poly"]]
+        ys = [p[1] for p in zone["poly"]]
+        for _ in range(100):
+            x, y = self.rng.uniform(min(xs), max(xs)), self.rng.uniform(min(ys), max(ys))
+            if point_in_poly(x, y, zone["poly"]):
+                return float(x), float(y)
+        return zone["scaled_centroid"]
+
+    def _pick(self, zones: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return zones[self.rng.integers(len(zones))] if zones else None
+
+    def generate(self, t0: float, duration: float) -> List[Shopper]:
+        """Build all shopper paths for [t0, t0 + duration)"""
+        rate = self.arrivals_per_min / 60.0
+        arrivals = []
+        t = t0
+        while rate > 0:
+            t += self.rng.exponential(1.0 / rate)
+            if t >= t0 + duration:
+                break
+            arrivals.append(t)
+
+        shoppers = []
+        for i, ta in enumerate(arrivals, 1):
+            entry = self._pick(self.entries)
+            box = (float(self.rng.normal(0.08, 0.01) * self.width), float(self.rng.normal(0.3, 0.04) * self.height))
+            s = Shopper(i, ta, *self._point_in(entry), box=box)
+            s.entry = entry
+            s.stay(1.0)
+            for _ in range(self.rng.poisson(self.shelves_per_visit) if self.shelves else 0):
+                s.move_to(*self._point_in(self._pick(self.shelves)), self.walk_speed)
+                s.stay(self.rng.lognormal(np.log(self.dwell_mean), self.dwell_sigma))
+            s.checkout = bool(self.queues) and self.rng.random() < self.checkout_prob
+            if s.checkout:
+                s.queue = self._pick(self.queues)
+                s.move_to(*self._point_in(s.queue), self.walk_speed)
+            shoppers.append(s)
+
+        # Single-server FIFO per queue zone, in order of arrival at the queue
+        server_free = {}
+        for s in sorted((s for s in shoppers if s.checkout), key=lambda s: s.t_end):
+            qid = s.queue["id"]
+            start = max(s.t_end, server_free.get(qid, 0.0))
+            done = start + self.rng.exponential(self.service_mean)
+            server_free[qid] = done
+            s.stay(done - s.t_end)
+
+        for s in shoppers:
+            s.move_to(*self._point_in(s.entry), self.walk_speed)
+            s.stay(1.0)
+        return shoppers
+
+    def observe(self, shoppers: List[Shopper], t: float) -> Tuple[List[tuple], List[tuple]]:
+        """True positions and noisy detections of everyone in frame at time t"""
+        truth, dets = [], []
+        for s in shoppers:
+            if not (s.ts[0] <= t <= s.t_end):
+                continue
+            x, y = s.position(t)
+            truth.append((s.sid, x, y))
+            if t < s.occluded_until:
+                continue
+            if self.rng.random() < self.dropout_prob:
+                s.occluded_until = t + self.rng.exponential(self.occlusion_mean)
+                continue
+            jx, jy = self.rng.normal(0, self.jitter_px, 2)
+            dets.append((x + jx, y + jy, s.box[0], s.box[1]))
+        return truth, dets
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0, "mean": 0.0, "p95": 0.0}
+    return {"count": len(values), "mean": float(np.mean(values)), "p95": float(np.percentile(values, 95))}
+
+def _zone_runs(visits: Dict[Tuple[int, str], List[float]], key: Tuple[int, str], t: float, dt: float):
+    """Extend the current run of a shopper in a zone, or start a new one"""
+    runs = visits.setdefault(key, [])
+    if runs and abs(runs[-1][1] - (t - dt)) < dt / 2:
+        runs[-1][1] = t
+    else:
+        runs.append([t, t])
+
+def run_simulation(camera_id: int, sim: TrajectorySimulator, minutes: float,
+                   start_ts: Optional[float] = None, use_redis: bool = False) -> Dict[str, Any]:
+    """Feed synthetic detections through ZoneEventPipeline and score the results"""
+    t0 = start_ts if start_ts is not None else float(int(time.time()) // 3600 * 3600)
+    duration = minutes * 60.0
+    dt = 1.0 / sim.fps
+    clock = SimClock(t0)
+    tracker = EnhancedCentroidTracker(camera_id, clock=clock)
+    if not use_redis:
+        tracker.live = None
+    with local_writer() as writer:
+        pipeline = ZoneEventPipeline(camera_id, tracker=tracker, zm=sim.zm, anomalies=False, rules=False)
+        zone_types = {z["name"]: z["ztype"] for z in sim.zones}
+
+        shoppers = sim.generate(t0, duration)
+        end = max([t0 + duration] + [s.t_end for s in shoppers])
+        truth_visits = {}
+        frames = detections = 0
+
+        wall_start = time.perf_counter()
+        t = t0
+        while t <= end:
+            clock.t = t
+            now = datetime.fromtimestamp(t, timezone.utc)
+            truth, dets = sim.observe(shoppers, t)
+            for sid, x, y in truth:
+                for hit in sim.zm.classify(sim.width, sim.height, x, y):
+                    _zone_runs(truth_visits, (sid, hit["name"]), t, dt)
+            pipeline.roll_hour(now)
+            pipeline.process(now, sim.width, sim.height, dets)
+            frames += 1
+            detections += len(dets)
+            t += dt
+
+        # Let every remaining track time out so its session is finalized
+        clock.t = t + tracker.track_timeout + 1
+        pipeline.process(datetime.fromtimestamp(clock.t, timezone.utc), sim.width, sim.height, [])
+        pipeline.close(datetime.fromtimestamp(clock.t, timezone.utc))
+        writer.flush()
+    wall = time.perf_counter() - wall_start
+
+    # Measured values come back out of the database, as dashboards would see them
+    sid = current_store_id()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT SUM(footfall) FROM hourly_metrics
+                     WHERE store_id=? AND camera_id=? AND hour_start >= ?""",
+                  (sid, camera_id, datetime.fromtimestamp(t0, timezone.utc).strftime("%Y-%m-%dT%H:00:00")))
+        footfall_measured = c.fetchone()[0]
+        c.execute("""SELECT zones_visited FROM track_sessions
+                     WHERE store_id=? AND camera_id=? AND entry_time >= ?""",
+                  (sid, camera_id, datetime.fromtimestamp(t0, timezone.utc).replace(tzinfo=None).isoformat()))
+        sessions = [json.loads(r[0]) if r[0] else [] for r in c.fetchall()]
+
+    measured_dwell, measured_queue = [], []
+    for visits in sessions:
+        for v in visits:
+            (measured_queue if zone_types.get(v["zone"]) == "queue" else measured_dwell).append(v["duration"])
+
+    true_dwell, true_queue = [], []
+    for (_, zone), runs in truth_visits.items():
+        for a, b in runs:
+            (true_queue if zone_types.get(zone) == "queue" else true_dwell).append(b - a + dt)
+
+    true_footfall = len(shoppers) if sim.entries else 0
+    footfall_measured = int(footfall_measured or 0)
+    return {
+        "camera_id": camera_id,
+        "shoppers": len(shoppers),
+        "throughput": {
+            "frames": frames,
+            "detections": detections,
+            "wall_seconds": wall,
+            "frames_per_sec": frames / wall if wall > 0 else 0.0,
+            "detections_per_sec": detections / wall if wall > 0 else 0.0,
+            "speedup_vs_realtime": float(end - t0) / wall if wall > 0 else 0.0
+        },
+        "footfall": {
+            "truth": true_footfall,
+            "measured": footfall_measured,
+            "error_pct": (footfall_measured - true_footfall) / max(true_footfall, 1) * 100
+        },
+        "tracks": {"truth": len(shoppers), "measured_sessions": len(sessions)},
+        "dwell": {"truth": _stats(true_dwell), "measured": _stats(measured_dwell)},
+        "queue_wait": {"truth": _stats(true_queue), "measured": _stats(measured_queue)}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic trajectory load test for the zone/event pipeline")
+    parser.add_argument("--camera-id", type=int, required=True, help="Camera whose zones are used")
+    parser.add_argument("--zones", help="JSON zone set instead of the camera's zones (see analytics/reanalysis.py)")
+    parser.add_argument("--db", required=True, help="Scratch sqlite database for generated rows (not DB_PATH)")
+    parser.add_argument("--minutes", type=float, default=60.0, help="Simulated duration")
+    parser.add_argument("--width", type=int, default=None, help="Frame width (default: screenshot width)")
+    parser.add_argument("--height", type=int, default=None, help="Frame height (default: screenshot height)")
+    parser.add_argument("--fps", type=float, default=4.0, help="Processed frames per simulated second")
+    parser.add_argument("--arrivals-per-min", type=float, default=2.0)
+    parser.add_argument("--shelves-per-visit", type=float, default=2.0)
+    parser.add_argument("--dwell-mean", type=float, default=30.0, help="Mean shelf dwell (seconds)")
+    parser.add_argument("--dwell-sigma", type=float, default=0.8, help="Lognormal shape of shelf dwell")
+    parser.add_argument("--checkout-prob", type=float, default=0.6)
+    parser.add_argument("--service-mean", type=float, default=45.0, help="Mean checkout service time (seconds)")
+    parser.add_argument("--walk-speed", type=float, default=60.0, help="Pixels per second")
+    parser.add_argument("--jitter", type=float, default=3.0, help="Detection jitter (pixels, 1 sigma)")
+    parser.add_argument("--dropout", type=float, default=0.02, help="Per-frame occlusion start probability")
+    parser.add_argument("--occlusion-mean", type=float, default=1.0, help="Mean occlusion length (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--redis", action="store_true", help="Also push live track state to Redis")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.abspath(args.db) == os.path.abspath(DB_PATH):
+        parser.error("--db must be a scratch database, not the store database (DB_PATH)")
+    for var in ("INGEST_URL", "WRITER_SPOOL_DIR"):
+        if os.getenv(var):
+            parser.error(f"unset {var}: simulated rows must only go to the scratch database")
+
+    # Zones come from the store database, generated rows go to the scratch one
+    if args.zones:
+        from ..analytics.reanalysis import load_zone_set
+        zm = load_zone_set(args.camera_id, args.zones)
+    else:
+        zm = EnhancedZoneManager(args.camera_id)
+    db.path = args.db
+    migrate_all()
+    width = args.width or zm.img_w or 1280
+    height = args.height or zm.img_h or 720
+
+    sim = TrajectorySimulator(
+        zm, width, height, fps=args.fps, arrivals_per_min=args.arrivals_per_min,
+        shelves_per_visit=args.shelves_per_visit, dwell_mean=args.dwell_mean, dwell_sigma=args.dwell_sigma,
+        checkout_prob=args.checkout_prob, service_mean=args.service_mean, walk_speed=args.walk_speed,
+        jitter_px=args.jitter, dropout_prob=args.dropout, occlusion_mean=args.occlusion_mean, seed=args.seed
+    )
+    report = run_simulation(args.camera_id, sim, args.minutes, use_redis=args.redis)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
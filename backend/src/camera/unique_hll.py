@@ -0,0 +1,193 @@
+"""
+Unique visitor counts from Redis HyperLogLogs.
+
+Processors PFADD every track ID to uv:{store}:{camera}:{day}
+and to uv:{store}:{camera}:{day}T{hour} the first time it is seen in that hour, as
+part of the tracker's per-frame Redis batch. With ENABLE_REID the backend's matcher
+also adds each store-level person_uuid under camera 0, the store-wide key.
+
+Uniques over any cameras and window are one PFCOUNT (or PFMERGE into a scratch key
+for long ranges) over whole-day keys plus hour keys for partial days, in constant
+memory. Day registers are snapshotted into unique_hll and put back into Redis when
+a query reaches past their TTL. Hour keys expire after UNIQUE_HLL_HOUR_TTL_DAYS and are
+not snapshotted, so a window whose partial days are older than that is answered from
+the days alone and flagged complete=False.
+
+A processor re-adds each live track every UNIQUE_HLL_READD_SECS as well as once per
+new hour; PFADD is idempotent, so this only matters when an earlier add was lost.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from ..database.db_manager import db
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_HLL_DAY_TTL_DAYS = int(os.getenv("UNIQUE_HLL_DAY_TTL_DAYS", "40"))
+UNIQUE_HLL_HOUR_TTL_DAYS = int(os.getenv("UNIQUE_HLL_HOUR_TTL_DAYS", "8"))
+UNIQUE_HLL_SNAPSHOT_SECS = float(os.getenv("UNIQUE_HLL_SNAPSHOT_SECS", "900"))
+UNIQUE_HLL_READD_SECS = float(os.getenv("UNIQUE_HLL_READD_SECS", "300"))
+STORE_CAMERA = 0  # camera_id of the store-wide (re-identified) registers
+_RESTORE_TTL = 3600  # seconds a register restored from a snapshot stays in Redis
+_PFCOUNT_KEYS = 64  # above this, unions are merged into a scratch key in chunks
+
+def day_key(store_id, camera_id, ymd: str) -> str:
+    return f"uv:{store_id}:{camera_id}:{ymd}"
+
+def hour_key(store_id, camera_id, hour: str) -> str:
+    return f"uv:{store_id}:{camera_id}:{hour}"
+
+def hll_ops(store_id, camera_id, member: str, hour: str) -> List[tuple]:
+    """Redis commands adding a visitor to the day and hour registers (hour = YYYY-MM-DDTHH, UTC)"""
+    dk, hk = day_key(store_id, camera_id, hour[:10]), hour_key(store_id, camera_id, hour)
+    return [("pfadd", dk, member), ("expire", dk, UNIQUE_HLL_DAY_TTL_DAYS * 86400),
+            ("pfadd", hk, member), ("expire", hk, UNIQUE_HLL_HOUR_TTL_DAYS * 86400)]
+
+def _parse(ts: str, end: bool) -> datetime:
+    if len(ts) == 10:
+        ts += "T23:00:00" if end else "T00:00:00"
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)  # keys are UTC hours
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+def window_keys(start: str, end: str) -> Tuple[List[str], List[str]]:
+    """(whole days, hours of partial days) covering [start, end]; a date-only end covers that day"""
+    t, last = _parse(start, False), _parse(end, True)
+    days, hours = [], []
+    while t <= last:
+        if t.hour == 0 and t + timedelta(hours=23) <= last:
+            days.append(t.strftime("%Y-%m-%d"))
+            t += timedelta(days=1)
+        else:
+            hours.append(t.strftime("%Y-%m-%dT%H"))
+            t += timedelta(hours=1)
+    return days, hours
+
+def expired_hours(hours: List[str], now: Optional[datetime] = None) -> List[str]:
+    """Hour keys of a window that may already have expired from Redis"""
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None)
+    cutoff = (now - timedelta(days=UNIQUE_HLL_HOUR_TTL_DAYS)).strftime("%Y-%m-%dT%H")
+    return [h for h in hours if h < cutoff]
+
+def _restore_days(client, store_id: str, camera_ids: List[int], days: List[str]):
+    """Put snapshotted day registers back for keys that have expired from Redis"""
+    wanted = [(cid, ymd) for cid in camera_ids for ymd in days]
+    pipe = client.pipeline(transaction=False)
+    for cid, ymd in wanted:
+        pipe.exists(day_key(store_id, cid, ymd))
+    missing = [w for w, present in zip(wanted, pipe.execute()) if not present]
+    if not missing:
+        return
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute(f"""SELECT camera_id, ymd, registers FROM unique_hll
+                      WHERE store_id=? AND ymd BETWEEN ? AND ?
+                        AND camera_id IN ({",".join("?" * len(camera_ids))})""",
+                  (store_id, days[0], days[-1], *camera_ids))
+        snapshots = {(cid, ymd): blob for cid, ymd, blob in c.fetchall()}
+    pipe = client.pipeline(transaction=False)
+    for cid, ymd in missing:
+        blob = snapshots.get((cid, ymd))
+        if blob:
+            pipe.set(day_key(store_id, cid, ymd), blob, ex=_RESTORE_TTL, nx=True)
+    pipe.execute()
+
+def count_union(client, keys: List[str]) -> int:
+    """Cardinality of the union of HLL keys; missing keys count as empty"""
+    if not keys:
+        return 0
+    if len(keys) <= _PFCOUNT_KEYS:
+        return int(client.pfcount(*keys))
+    scratch = f"uv:tmp:{uuid.uuid4().hex}"
+    pipe = client.pipeline(transaction=False)
+    for i in range(0, len(keys), _PFCOUNT_KEYS):
+        # PFMERGE folds an existing destination into the union
+        pipe.pfmerge(scratch, *keys[i:i + _PFCOUNT_KEYS])
+    pipe.pfcount(scratch)
+    pipe.delete(scratch)
+    return int(pipe.execute()[-2])
+
+def count_unique(client, store_id: str, start: str, end: str,
+                 camera_ids: Iterable[int], now: Optional[datetime] = None) -> Dict[str, object]:
+    """Unique visitors of the cameras over [start, end] (hour resolution, UTC).
+
+    Camera-level identifiers are per camera, so a union over several cameras counts a
+    person once per camera they were seen on; pass [STORE_CAMERA] for re-identified
+    store-wide counts. complete is False when hours of partial days are past their
+    TTL; expired_hours says how many.
+    """
+    camera_ids = sorted(set(int(c) for c in camera_ids))
+    days, hours = window_keys(start, end)
+    if not camera_ids or not (days or hours):
+        return {"start": start, "end": end, "camera_ids": camera_ids, "unique_visitors": 0, "complete": True}
+    if days:
+        _restore_days(client, store_id, camera_ids, days)
+    expired = expired_hours(hours, now)
+    if expired:
+        logger.warning(f"Unique visitor window {start}..{end} has {len(expired)} hours past the "
+                       f"{UNIQUE_HLL_HOUR_TTL_DAYS}-day hour key TTL; counting whole days only for those")
+    keys = [day_key(store_id, cid, ymd) for cid in camera_ids for ymd in days]
+    keys += [hour_key(store_id, cid, hour) for cid in camera_ids for hour in hours if hour not in expired]
+    return {"start": start, "end": end, "camera_ids": camera_ids, "days": len(days),
+            "hours": len(hours), "unique_visitors": count_union(client, keys),
+            "complete": not expired, "expired_hours": len(expired)}
+
+def snapshot_day(client, ymd: str) -> int:
+    """Copy every store's and camera's register for a day into unique_hll; returns rows written"""
+    keys = [k.decode() if isinstance(k, bytes) else k for k in client.scan_iter(match=f"uv:*:*:{ymd}", count=1000)]
+    if not keys:
+        return 0
+    pipe = client.pipeline(transaction=False)
+    for k in keys:
+        pipe.get(k)
+        pipe.pfcount(k)
+    res = pipe.execute()
+    now = datetime.now(timezone.utc).isoformat()
+    rows = []
+    for k, blob, n in zip(keys, res[0::2], res[1::2]):
+        store_id, camera_id, _ = k[len("uv:"):].rsplit(":", 2)
+        if blob and camera_id.isdigit():
+            rows.append((store_id, int(camera_id), ymd, blob, int(n), now))
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.executemany("""INSERT INTO unique_hll (store_id,camera_id,ymd,registers,approx_count,updated_at)
+                         VALUES (?,?,?,?,?,?)
+                         ON CONFLICT(store_id,camera_id,ymd) DO UPDATE SET
+                         registers=excluded.registers, approx_count=excluded.approx_count,
+                         updated_at=excluded.updated_at""", rows)
+        conn.commit()
+    return len(rows)
+
+class HllSnapshotter:
+    """Background snapshots of today's and yesterday's day registers (backend)"""
+
+    def __init__(self, url: str, interval: float = UNIQUE_HLL_SNAPSHOT_SECS):
+        self.client = redis.from_url(url)
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        return sum(snapshot_day(self.client, (now - timedelta(days=d)).strftime("%Y-%m-%d")) for d in (1, 0))
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Unique HLL snapshot error: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="hll-snapshot")
+            self._thread.start()
@@ -0,0 +1,113 @@
+"""
+In-process cache of people already recorded in unique_daily for the current day.
+
+Only first sightings are sent to the writer. first_seen/last_seen/total_dwell are
+kept in memory and written back as one batch of UPDATEs every UNIQUE_UPDATE_SECS.
+The per-day set becomes a Bloom filter once a day gets very large, trading a small
+chance of missing a new visitor for bounded memory. It rolls over at the UTC day boundary.
+"""
+
+import os
+import hashlib
+from datetime import datetime
+from typing import Dict, Optional
+
+from ..database.batch_writer import writer
+from ..database.statements import UNIQUE_DAILY_INSERT, UNIQUE_DAILY_UPDATE
+from ..core.store_scope import current_store_id
+from ..core.metrics import registry
+
+UNIQUE_UPDATE_SECS = float(os.getenv("UNIQUE_UPDATE_SECS", "60"))
+UNIQUE_BLOOM_THRESHOLD = int(os.getenv("UNIQUE_BLOOM_THRESHOLD", "200000"))
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        import math
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+class DailyUniqueCache:
+    def __init__(self, camera_id, update_interval: float = UNIQUE_UPDATE_SECS,
+                 bloom_threshold: int = UNIQUE_BLOOM_THRESHOLD):
+        self.camera_id = camera_id
+        self.update_interval = update_interval
+        self.bloom_threshold = bloom_threshold
+        self.ymd: Optional[str] = None
+        self._seen = set()
+        self._bloom: Optional[BloomFilter] = None
+        self._count = 0
+        self._dirty: Dict[int, tuple] = {}  # person_id -> (last_seen, total_dwell)
+        self._last_flush: Optional[datetime] = None
+
+    def __len__(self):
+        return self._count
+
+    def _contains(self, person_id: int) -> bool:
+        return person_id in self._bloom if self._bloom is not None else person_id in self._seen
+
+    def _add(self, person_id: int):
+        self._count += 1
+        if self._bloom is not None:
+            self._bloom.add(person_id)
+            return
+        self._seen.add(person_id)
+        if len(self._seen) > self.bloom_threshold:
+            self._bloom = BloomFilter(self.bloom_threshold * 10)
+            for pid in self._seen:
+                self._bloom.add(pid)
+            self._seen = set()
+
+    def observe(self, person_id: int, now: datetime, total_dwell: float = 0.0) -> bool:
+        """Record a sighting; returns True (and inserts the row) on the first one of the day"""
+        ymd = now.strftime("%Y-%m-%d")
+        if ymd != self.ymd:
+            self.rollover(ymd)
+
+        ts = now.isoformat()
+        first = not self._contains(person_id)
+        if first:
+            self._add(person_id)
+            registry.set("unique_cache_size", self._count, camera=self.camera_id)
+            writer.submit(UNIQUE_DAILY_INSERT,
+                          (current_store_id(), self.camera_id, ymd, person_id, ts, ts, total_dwell))
+        else:
+            self._dirty[person_id] = (ts, total_dwell)
+        return first
+
+    def maybe_flush(self, now: datetime):
+        if self._last_flush is None:
+            self._last_flush = now
+        elif (now - self._last_flush).total_seconds() >= self.update_interval:
+            self.flush()
+            self._last_flush = now
+
+    def flush(self):
+        """Write pending last_seen/total_dwell updates as one batch"""
+        if not self._dirty:
+            return
+        sid = current_store_id()
+        for person_id, (last_seen, dwell) in self._dirty.items():
+            writer.submit(UNIQUE_DAILY_UPDATE, (last_seen, dwell, sid, self.camera_id, self.ymd, person_id))
+        self._dirty = {}
+
+    def rollover(self, ymd: str):
+        """Flush the finished day and start an empty one"""
+        self.flush()
+        self.ymd = ymd
+        self._seen = set()
+        self._bloom = None
+        self._count = 0
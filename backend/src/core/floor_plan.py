@@ -0,0 +1,192 @@
+"""
+Camera-to-floor-plan projection.
+
+A camera is calibrated with four or more correspondences between screenshot pixels
+and store floor-plan coordinates; the homography is estimated with the normalized
+DLT. Instead of projecting detections at runtime, a lookup table is precomputed
+from it: one floor cell index per LUT_STEP x LUT_STEP block of screenshot pixels
+(-1 off the floor plan or above the horizon). Processors index it in O(1) with each
+person's foot point and accumulate person-seconds per floor cell into an hourly
+floor grid (floor_heatmap_grids), which is what lets overlapping cameras be merged
+into one store-level picture (analytics/heatmaps.py). Zones drawn once on the floor
+plan (zones rows with camera_id 0, polygons in floor coordinates) are folded through
+it into a per-camera pixel -> zone-mask table the same way; the mask has one bit per
+zone, so a store has at most MAX_FLOOR_ZONES of them. The tables are loaded with the
+camera's zones, i.e. when a processor starts.
+"""
+
+import os
+import json
+import zlib
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..database.db_manager import db
+from .store_scope import current_store_id
+
+logger = logging.getLogger(__name__)
+
+LUT_STEP = int(os.getenv("FLOOR_LUT_STEP", "8"))  # screenshot pixels per LUT entry
+FLOOR_ZONES_CAMERA = 0  # camera_id of zones defined on the floor plan
+MAX_FLOOR_ZONES = 63  # bits of the int64 zone mask
+
+def _normalizer(pts: np.ndarray) -> np.ndarray:
+    """Similarity moving points to mean 0 and mean distance sqrt(2)"""
+    mean = pts.mean(axis=0)
+    scale = np.sqrt(2) / max(np.mean(np.hypot(*(pts - mean).T)), 1e-9)
+    return np.array([[scale, 0, -scale * mean[0]], [0, scale, -scale * mean[1]], [0, 0, 1]])
+
+def estimate_homography(image_pts: Sequence[Sequence[float]],
+                        floor_pts: Sequence[Sequence[float]]) -> Tuple[np.ndarray, float]:
+    """Homography image -> floor from >= 4 correspondences and its RMS reprojection error"""
+    src = np.asarray(image_pts, dtype=np.float64)
+    dst = np.asarray(floor_pts, dtype=np.float64)
+    if len(src) < 4 or src.shape != dst.shape or src.shape[1] != 2:
+        raise ValueError("Need at least four image/floor point pairs")
+    ts, td = _normalizer(src), _normalizer(dst)
+    s = (ts @ np.column_stack([src, np.ones(len(src))]).T).T
+    d = (td @ np.column_stack([dst, np.ones(len(dst))]).T).T
+    rows = []
+    for (x, y, _), (u, v, _) in zip(s, d):
+        rows.append([-x, -y, -1, 0, 0, 0, u * x, u * y, u])
+        rows.append([0, 0, 0, -x, -y, -1, v * x, v * y, v])
+    _, sv, vt = np.linalg.svd(np.asarray(rows))
+    if sv[-2] < 1e-9:
+        raise ValueError("Degenerate correspondences (three or more points on a line?)")
+    h = np.linalg.inv(td) @ vt[-1].reshape(3, 3) @ ts
+    h /= h[2, 2]
+    proj, valid = project(h, src)
+    if not valid.all():
+        raise ValueError("Calibration points map behind the camera")
+    rms = float(np.sqrt(np.mean(np.sum((proj - dst) ** 2, axis=1))))
+    return h, rms
+
+def project(h: np.ndarray, pts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Project (N, 2) points; valid is False where w <= 0 (above the horizon)"""
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    p = np.column_stack([pts, np.ones(len(pts))]) @ h.T
+    w = p[:, 2]
+    valid = w > 1e-9
+    out = np.full((len(pts), 2), np.nan)
+    out[valid] = p[valid, :2] / w[valid, None]
+    return out, valid
+
+def build_lut(h: np.ndarray, img_w: int, img_h: int, floor_w: float, floor_h: float,
+              cell_size: float, step: int = LUT_STEP) -> np.ndarray:
+    """(rows, cols) int32 table of floor cell index per block of screenshot pixels"""
+    cols, rows = max(1, -(-img_w // step)), max(1, -(-img_h // step))
+    xs = (np.arange(cols) + 0.5) * step
+    ys = (np.arange(rows) + 0.5) * step
+    gx, gy = np.meshgrid(xs, ys)
+    floor, valid = project(h, np.column_stack([gx.ravel(), gy.ravel()]))
+    cell_cols = int(np.ceil(floor_w / cell_size))
+    with np.errstate(invalid="ignore"):
+        inside = valid & (floor[:, 0] >= 0) & (floor[:, 0] < floor_w) & (floor[:, 1] >= 0) & (floor[:, 1] < floor_h)
+    lut = np.full(len(floor), -1, dtype=np.int32)
+    fx = (floor[inside, 0] // cell_size).astype(np.int32)
+    fy = (floor[inside, 1] // cell_size).astype(np.int32)
+    lut[inside] = fy * cell_cols + fx
+    return lut.reshape(rows, cols)
+
+def encode_lut(lut: np.ndarray) -> bytes:
+    return zlib.compress(lut.astype("<i4").tobytes(), 6)
+
+def decode_lut(blob: bytes, rows: int, cols: int) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(blob), dtype="<i4").reshape(rows, cols).astype(np.int32)
+
+def cell_centers(floor_w: float, floor_h: float, cell_size: float) -> np.ndarray:
+    """(cells, 2) floor coordinates of every cell center, in cell index order"""
+    cols, rows = int(np.ceil(floor_w / cell_size)), int(np.ceil(floor_h / cell_size))
+    gx, gy = np.meshgrid((np.arange(cols) + 0.5) * cell_size, (np.arange(rows) + 0.5) * cell_size)
+    return np.column_stack([gx.ravel(), gy.ravel()])
+
+def _points_in_poly(pts: np.ndarray, poly: Sequence[Sequence[float]]) -> np.ndarray:
+    """Vectorized ray casting of many points against one polygon"""
+    inside = np.zeros(len(pts), dtype=bool)
+    x, y = pts[:, 0], pts[:, 1]
+    n = len(poly)
+    for i in range(n):
+        x1, y1 = poly[i]
+        x2, y2 = poly[(i + 1) % n]
+        cond = ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1 + 1e-12) + x1)
+        inside ^= cond
+    return inside
+
+class FloorProjector:
+    """A camera's pixel -> floor cell (and floor zone) tables, loaded once per processor"""
+
+    def __init__(self, camera_id: int, lut: np.ndarray, img_w: int, img_h: int, cell_cols: int,
+                 cell_rows: int, zones: Optional[List[Dict]] = None, zone_lut: Optional[np.ndarray] = None):
+        self.camera_id = camera_id
+        self.lut = lut
+        self.img_w = img_w
+        self.img_h = img_h
+        self.cell_cols = cell_cols
+        self.cell_rows = cell_rows
+        self.zones = zones or []  # floor zones, bit i of zone_lut
+        self.zone_lut = zone_lut
+
+    @classmethod
+    def load(cls, camera_id: int, store_id: Optional[str] = None) -> Optional["FloorProjector"]:
+        """The camera's tables, or None if it is not calibrated"""
+        sid = store_id or current_store_id()
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT cal.lut, cal.lut_rows, cal.lut_cols, cal.img_width, cal.img_height,
+                                fp.width, fp.height, fp.cell_size
+                         FROM camera_calibrations cal JOIN floor_plans fp ON fp.store_id = cal.store_id
+                         WHERE cal.store_id=? AND cal.camera_id=?""", (sid, camera_id))
+            row = c.fetchone()
+            if not row:
+                return None
+            c.execute("SELECT id, name, ztype, polygon_json, color, priority FROM zones WHERE store_id=? AND camera_id=?",
+                      (sid, FLOOR_ZONES_CAMERA))
+            zone_rows = c.fetchall()
+        blob, rows, cols, img_w, img_h, floor_w, floor_h, cell_size = row
+        lut = decode_lut(blob, rows, cols)
+        cell_cols = int(np.ceil(floor_w / cell_size))
+        cell_rows = int(np.ceil(floor_h / cell_size))
+
+        zones, zone_lut = [], None
+        if len(zone_rows) > MAX_FLOOR_ZONES:
+            logger.warning(f"Store {sid} has {len(zone_rows)} floor zones; only the first {MAX_FLOOR_ZONES} "
+                           f"are classified on camera {camera_id}")
+        if zone_rows:
+            # Fold floor zones into the pixel table: cell -> bitmask, then pixel -> bitmask
+            centers = cell_centers(floor_w, floor_h, cell_size)
+            cell_mask = np.zeros(len(centers), dtype=np.int64)
+            for zone_id, name, ztype, polygon_json, color, priority in zone_rows[:MAX_FLOOR_ZONES]:
+                poly = json.loads(polygon_json)
+                if len(poly) < 3:
+                    continue
+                cell_mask[_points_in_poly(centers, poly)] |= np.int64(1) << len(zones)
+                zones.append({"id": zone_id, "name": name, "ztype": ztype, "priority": priority or 1,
+                              "area": 0, "color": color or "#00ff00", "floor": True})
+            zone_lut = np.where(lut >= 0, cell_mask[np.clip(lut, 0, None)], 0)
+        return cls(camera_id, lut, img_w, img_h, cell_cols, cell_rows, zones, zone_lut)
+
+    def _index(self, fw: int, fh: int, x: float, y: float) -> Tuple[int, int]:
+        rows, cols = self.lut.shape
+        ix = min(max(int(x * cols / fw), 0), cols - 1)
+        iy = min(max(int(y * rows / fh), 0), rows - 1)
+        return iy, ix
+
+    def cell(self, fw: int, fh: int, x: float, y: float) -> int:
+        """Floor cell under a frame pixel (use the foot point), -1 if off the floor plan"""
+        return int(self.lut[self._index(fw, fh, x, y)])
+
+    def cells(self, fw: int, fh: int, xs, ys) -> np.ndarray:
+        """Vectorized cell() for many points"""
+        rows, cols = self.lut.shape
+        ix = np.clip((np.asarray(xs, dtype=np.float64) * (cols / fw)).astype(np.int32), 0, cols - 1)
+        iy = np.clip((np.asarray(ys, dtype=np.float64) * (rows / fh)).astype(np.int32), 0, rows - 1)
+        return self.lut[iy, ix]
+
+    def zones_at(self, fw: int, fh: int, x: float, y: float) -> List[Dict]:
+        """Floor zones under a frame pixel"""
+        if self.zone_lut is None:
+            return []
+        mask = int(self.zone_lut[self._index(fw, fh, x, y)])
+        return [z for i, z in enumerate(self.zones) if mask >> i & 1]
@@ -0,0 +1,88 @@
+"""
+Low-resolution occupancy grids for floor heatmaps.
+
+Each camera accumulates a GRID_ROWS x GRID_COLS float32 grid over normalized frame
+coordinates; a cell holds person-seconds spent there (each track centroid adds the
+time since the previous processed frame). Grids are stored per hour as zlib-compressed
+float32 arrays and are additive, so any range is the sum of its hours.
+
+Floor grids use the same format with one cell per floor-plan cell (core/floor_plan.py).
+"""
+
+import zlib
+import struct
+from typing import Iterable, Optional
+
+import numpy as np
+
+GRID_COLS = 64
+GRID_ROWS = 36
+_VERSION = 1
+_HEADER = struct.Struct("<BHH")  # version, rows, cols
+
+class HeatmapGrid:
+    def __init__(self, rows: int = GRID_ROWS, cols: int = GRID_COLS):
+        self.rows = rows
+        self.cols = cols
+        self.grid = np.zeros((rows, cols), dtype=np.float32)
+
+    def add_points(self, xs, ys, width: float, height: float, weight: float):
+        """Add `weight` to the cells of points given in frame pixels"""
+        if weight <= 0 or not len(xs):
+            return
+        ix = np.clip((np.asarray(xs, dtype=np.float32) * (self.cols / width)).astype(np.int32), 0, self.cols - 1)
+        iy = np.clip((np.asarray(ys, dtype=np.float32) * (self.rows / height)).astype(np.int32), 0, self.rows - 1)
+        counts = np.bincount(iy * self.cols + ix, minlength=self.rows * self.cols)
+        self.grid += (counts * weight).astype(np.float32).reshape(self.rows, self.cols)
+
+    def add_cells(self, cells, weight: float):
+        """Add `weight` to cells given as flat indices; negative indices are skipped"""
+        cells = np.asarray(cells, dtype=np.int64)
+        cells = cells[(cells >= 0) & (cells < self.rows * self.cols)]
+        if weight <= 0 or not len(cells):
+            return
+        counts = np.bincount(cells, minlength=self.rows * self.cols)
+        self.grid += (counts * weight).astype(np.float32).reshape(self.rows, self.cols)
+
+    @property
+    def total(self) -> float:
+        return float(self.grid.sum())
+
+    def reset(self):
+        self.grid.fill(0)
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_VERSION, self.rows, self.cols) + zlib.compress(self.grid.astype("<f4").tobytes(), 6)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "HeatmapGrid":
+        if not data:
+            return cls()
+        version, rows, cols = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported heatmap version {version}")
+        h = cls(rows, cols)
+        h.grid = np.frombuffer(zlib.decompress(data[_HEADER.size:]), dtype="<f4").reshape(rows, cols).astype(np.float32)
+        return h
+
+def merge_blobs(a: Optional[bytes], b: Optional[bytes]) -> bytes:
+    """Sum two serialized grids (registered as the SQL function heatmap_merge).
+
+    A grid of a different shape (a floor plan re-gridded mid-hour) replaces the old one.
+    """
+    if not a:
+        return b
+    if not b:
+        return a
+    h, other = HeatmapGrid.from_bytes(a), HeatmapGrid.from_bytes(b)
+    if h.grid.shape != other.grid.shape:
+        return b
+    h.grid += other.grid
+    return h.to_bytes()
+
+def sum_blobs(blobs: Iterable[Optional[bytes]]) -> HeatmapGrid:
+    total = HeatmapGrid()
+    for blob in blobs:
+        if blob:
+            total.grid += HeatmapGrid.from_bytes(blob).grid
+    return total
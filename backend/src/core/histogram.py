@@ -0,0 +1,128 @@
+"""
+Mergeable log-bucket histograms of durations.
+
+Bucket i > 0 covers [MIN_VALUE * GAMMA**(i-1), MIN_VALUE * GAMMA**i); bucket 0 holds
+everything below MIN_VALUE. Quantiles are read from bucket midpoints, so any quantile
+is within about (GAMMA - 1) / 2 relative error however many histograms are merged.
+Serialized as varints of non-empty buckets, typically a few dozen bytes per hour.
+"""
+
+import math
+import struct
+from typing import Dict, Iterable, Optional
+
+MIN_VALUE = 0.1  # seconds
+GAMMA = 1.05
+_LOG_GAMMA = math.log(GAMMA)
+_VERSION = 1
+_HEADER = struct.Struct("<Bd")  # version, sum
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _get_varint(buf: bytes, pos: int):
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+class LogHistogram:
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+
+    @staticmethod
+    def bucket(value: float) -> int:
+        if value < MIN_VALUE:
+            return 0
+        return int(math.log(value / MIN_VALUE) / _LOG_GAMMA) + 1
+
+    @staticmethod
+    def bucket_value(index: int) -> float:
+        """Representative value (geometric midpoint) of a bucket"""
+        if index == 0:
+            return 0.0
+        return MIN_VALUE * GAMMA ** (index - 0.5)
+
+    def add(self, value: float, n: int = 1):
+        i = self.bucket(value)
+        self.counts[i] = self.counts.get(i, 0) + n
+        self.count += n
+        self.sum += value * n
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        for i, n in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + n
+        self.count += other.count
+        self.sum += other.sum
+        return self
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen > rank:
+                return self.bucket_value(i)
+        return self.bucket_value(max(self.counts))
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def summary(self, quantiles: Iterable[float] = (0.5, 0.9, 0.95)) -> Dict[str, float]:
+        out = {"count": self.count, "mean": self.mean}
+        for q in quantiles:
+            out[f"p{int(round(q * 100))}"] = self.quantile(q)
+        return out
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(_HEADER.pack(_VERSION, self.sum))
+        _put_varint(out, len(self.counts))
+        prev = 0
+        for i in sorted(self.counts):
+            _put_varint(out, i - prev)
+            _put_varint(out, self.counts[i])
+            prev = i
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "LogHistogram":
+        h = cls()
+        if not data:
+            return h
+        version, h.sum = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported histogram version {version}")
+        n, pos = _get_varint(data, _HEADER.size)
+        i = 0
+        for _ in range(n):
+            delta, pos = _get_varint(data, pos)
+            count, pos = _get_varint(data, pos)
+            i += delta
+            h.counts[i] = count
+            h.count += count
+        return h
+
+    def __len__(self):
+        return self.count
+
+def merge_blobs(a: Optional[bytes], b: Optional[bytes]) -> bytes:
+    """Merge two serialized histograms (registered as the SQL function hist_merge)"""
+    return LogHistogram.from_bytes(a).merge(LogHistogram.from_bytes(b)).to_bytes()
+
+def merge_all(blobs: Iterable[Optional[bytes]]) -> LogHistogram:
+    h = LogHistogram()
+    for blob in blobs:
+        h.merge(LogHistogram.from_bytes(blob))
+    return h
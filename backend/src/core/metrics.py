@@ -0,0 +1,103 @@
+"""
+Minimal in-process metrics for camera processors.
+
+Counters, gauges and summaries (count/sum/max) keyed by name and labels, rendered in
+the Prometheus text format. Processors expose them on PROCESSOR_METRICS_PORT when set.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Tuple
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._values: Dict[Tuple[str, Tuple], Any] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._types[name] = "counter"
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge"""
+        with self._lock:
+            self._types[name] = "gauge"
+            self._values[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation of a summary (count, sum, max)"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._types[name] = "summary"
+            count, total, peak = self._values.get(key, (0, 0.0, 0.0))
+            self._values[key] = (count + 1, total + value, max(peak, value))
+
+    def get(self, name: str, default=0, **labels):
+        with self._lock:
+            return self._values.get(self._key(name, labels), default)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Flat dict of current values, e.g. for status payloads"""
+        out = {}
+        with self._lock:
+            for (name, labels), value in self._values.items():
+                suffix = ",".join(f"{k}={v}" for k, v in labels)
+                key = f"{name}{{{suffix}}}" if suffix else name
+                if self._types[name] == "summary":
+                    count, total, peak = value
+                    value = {"count": count, "sum": total, "max": peak}
+                out[key] = value
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                mtype = self._types[name]
+                lines.append(f"# TYPE {name} {mtype}")
+                for (n, labels), value in sorted(self._values.items()):
+                    if n != name:
+                        continue
+                    lbl = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lbl = f"{{{lbl}}}" if lbl else ""
+                    if mtype == "summary":
+                        count, total, peak = value
+                        lines.append(f"{name}_count{lbl} {count}")
+                        lines.append(f"{name}_sum{lbl} {total}")
+                        lines.append(f"{name}_max{lbl} {peak}")
+                    else:
+                        lines.append(f"{name}{lbl} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve registry.render() at /metrics from a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
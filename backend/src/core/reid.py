@@ -0,0 +1,181 @@
+"""
+Appearance embeddings and the per-store re-identification index.
+
+Processors with ENABLE_REID=1 average an embedding over a few crops of each track
+and store it with the finished track. The baseline embedding is a colour histogram
+of the upper and lower half of the person box (hue x saturation bins plus grey
+levels), square-rooted and L2-normalized so the dot product is the Bhattacharyya
+coefficient. REID_ONNX_MODEL swaps in a small ONNX re-ID network when onnxruntime
+is installed.
+
+The backend keeps one EmbeddingIndex per store: a float32 matrix of the embeddings
+of tracks that ended within REID_WINDOW_SECS, searched with a single matrix-vector
+product. A match above REID_THRESHOLD reuses that person's store-level person_uuid.
+"""
+
+import os
+import uuid
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENABLE_REID = os.getenv("ENABLE_REID", "0").lower() in ("1", "true")
+REID_ONNX_MODEL = os.getenv("REID_ONNX_MODEL", "")
+REID_WINDOW_SECS = float(os.getenv("REID_WINDOW_SECS", "1800"))
+REID_THRESHOLD = float(os.getenv("REID_THRESHOLD", "0.85"))
+
+HUE_BINS = 8
+SAT_BINS = 3
+GREY_BINS = 4
+MIN_SATURATION = 0.2  # below this a pixel counts by brightness only
+_PIXEL_STRIDE = 2
+
+def _region_hist(rgb: np.ndarray) -> np.ndarray:
+    px = rgb.reshape(-1, 3).astype(np.float32) / 255.0
+    if not len(px):
+        return np.zeros(HUE_BINS * SAT_BINS + GREY_BINS, dtype=np.float32)
+    mx, mn = px.max(axis=1), px.min(axis=1)
+    chroma = mx - mn
+    sat = np.where(mx > 0, chroma / np.maximum(mx, 1e-6), 0)
+    r, g, b = px.T
+    c = np.maximum(chroma, 1e-6)
+    hue = np.select([mx == r, mx == g], [((g - b) / c) % 6, (b - r) / c + 2], (r - g) / c + 4) / 6.0
+    colour = sat >= MIN_SATURATION
+    hb = np.minimum((hue[colour] * HUE_BINS).astype(np.int32), HUE_BINS - 1)
+    sb = np.minimum(((sat[colour] - MIN_SATURATION) / (1 - MIN_SATURATION) * SAT_BINS).astype(np.int32), SAT_BINS - 1)
+    gb = np.minimum((mx[~colour] * GREY_BINS).astype(np.int32), GREY_BINS - 1)
+    counts = np.concatenate([np.bincount(hb * SAT_BINS + sb, minlength=HUE_BINS * SAT_BINS),
+                             np.bincount(gb, minlength=GREY_BINS)]).astype(np.float32)
+    return counts / len(px)
+
+def color_embedding(crop_bgr: np.ndarray) -> Optional[np.ndarray]:
+    """Unit-length colour descriptor of a person crop (BGR, as decoded by OpenCV)"""
+    if crop_bgr is None or crop_bgr.ndim != 3 or min(crop_bgr.shape[:2]) < 8:
+        return None
+    rgb = crop_bgr[::_PIXEL_STRIDE, ::_PIXEL_STRIDE, ::-1]
+    h = len(rgb)
+    # Trim the head and feet, which are mostly background and skin
+    upper, lower = rgb[h // 8:h // 2], rgb[h // 2:h * 7 // 8]
+    vec = np.sqrt(np.concatenate([_region_hist(upper), _region_hist(lower)]))
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else None
+
+class OnnxEmbedder:
+    """Small ONNX re-ID network (NCHW float input, ImageNet normalization)"""
+
+    _MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    _STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    def __init__(self, path: str):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.height, self.width = (int(inp.shape[2]), int(inp.shape[3])) if isinstance(inp.shape[2], int) else (256, 128)
+
+    def __call__(self, crop_bgr: np.ndarray) -> Optional[np.ndarray]:
+        if crop_bgr is None or crop_bgr.ndim != 3 or min(crop_bgr.shape[:2]) < 8:
+            return None
+        h, w = crop_bgr.shape[:2]
+        ys = (np.arange(self.height) * h // self.height)
+        xs = (np.arange(self.width) * w // self.width)
+        rgb = crop_bgr[ys][:, xs, ::-1].astype(np.float32) / 255.0
+        x = ((rgb - self._MEAN) / self._STD).transpose(2, 0, 1)[None]
+        vec = np.asarray(self.session.run(None, {self.input_name: x})[0], dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else None
+
+def load_embedder(model_path: str = REID_ONNX_MODEL):
+    """The ONNX embedder if configured and loadable, else the colour histogram"""
+    if model_path:
+        try:
+            return OnnxEmbedder(model_path)
+        except Exception as e:
+            logger.warning(f"Re-ID model {model_path} unavailable ({e}), using colour histograms")
+    return color_embedding
+
+def crop(frame: np.ndarray, cx: float, cy: float, w: float, h: float) -> np.ndarray:
+    H, W = frame.shape[:2]
+    x1, y1 = max(int(cx - w / 2), 0), max(int(cy - h / 2), 0)
+    x2, y2 = min(int(cx + w / 2), W), min(int(cy + h / 2), H)
+    return frame[y1:y2, x1:x2]
+
+def to_bytes(vec: np.ndarray) -> bytes:
+    return np.asarray(vec, dtype="<f2").tobytes()
+
+def from_bytes(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f2").astype(np.float32)
+
+class EmbeddingIndex:
+    """Recent track embeddings of one store with their person_uuids.
+
+    Rows live in preallocated arrays that double when full; eviction drops rows whose
+    track ended more than `window` seconds before the newest and compacts in place.
+    """
+
+    def __init__(self, window: float = REID_WINDOW_SECS, threshold: float = REID_THRESHOLD,
+                 capacity: int = 1024):
+        self.window = window
+        self.threshold = threshold
+        self.vecs: Optional[np.ndarray] = None
+        self.entry = np.zeros(capacity)
+        self.exit = np.zeros(capacity)
+        self.cams = np.zeros(capacity, dtype=np.int64)
+        self.uuids: List[str] = []
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def evict(self, now: float):
+        keep = np.flatnonzero(self.exit[:self.n] >= now - self.window)
+        if len(keep) == self.n:
+            return
+        k = len(keep)
+        self.vecs[:k] = self.vecs[keep]
+        self.entry[:k] = self.entry[keep]
+        self.exit[:k] = self.exit[keep]
+        self.cams[:k] = self.cams[keep]
+        self.uuids = [self.uuids[i] for i in keep]
+        self.n = k
+
+    def search(self, vec: np.ndarray, camera_id: int, entry: float) -> Tuple[Optional[str], float]:
+        """Best earlier track by cosine similarity, skipping tracks of the same camera that
+        were still visible when this one appeared (those are other people)"""
+        if not self.n or self.vecs.shape[1] != len(vec):
+            return None, 0.0
+        sims = self.vecs[:self.n] @ vec
+        sims[(self.cams[:self.n] == camera_id) & (self.exit[:self.n] > entry)] = -1.0
+        i = int(np.argmax(sims))
+        if sims[i] < self.threshold:
+            return None, float(sims[i])
+        return self.uuids[i], float(sims[i])
+
+    def add(self, vec: np.ndarray, camera_id: int, entry: float, exit_: float, person_uuid: str):
+        if self.vecs is None:
+            self.vecs = np.zeros((len(self.entry), len(vec)), dtype=np.float32)
+        if self.vecs.shape[1] != len(vec):
+            # Embedder changed (e.g. an ONNX model was configured): start over
+            self.vecs = np.zeros((len(self.entry), len(vec)), dtype=np.float32)
+            self.uuids, self.n = [], 0
+        if self.n == len(self.entry):
+            cap = 2 * self.n
+            self.vecs = np.resize(self.vecs, (cap, self.vecs.shape[1]))
+            self.entry, self.exit, self.cams = (np.resize(a, cap) for a in (self.entry, self.exit, self.cams))
+        self.vecs[self.n] = vec
+        self.entry[self.n] = entry
+        self.exit[self.n] = exit_
+        self.cams[self.n] = camera_id
+        self.uuids.append(person_uuid)
+        self.n += 1
+
+    def match(self, vec: np.ndarray, camera_id: int, entry: float, exit_: float) -> Tuple[str, bool]:
+        """Store-level person_uuid of a finished track and whether it matched an earlier one"""
+        self.evict(exit_)
+        found, _ = self.search(vec, camera_id, entry)
+        person_uuid = found or str(uuid.uuid4())
+        self.add(vec, camera_id, entry, exit_, person_uuid)
+        return person_uuid, found is not None
@@ -0,0 +1,174 @@
+"""
+Structured, non-blocking logging for camera processors.
+
+configure_processor_logging() routes every logger of the process through a
+QueueHandler: the frame loop only formats the message and puts it on a bounded
+in-memory queue (records are dropped and counted in log_records_dropped_total when
+it is full), and a QueueListener thread writes JSON lines to
+PROCESSOR_LOG_DIR/camera-{id}.log (rotating) and, with PROCESSOR_LOG_SYSLOG=host:port,
+to a syslog/UDP aggregator.
+
+Each record carries camera_id and store_id. Repetitive messages are rate limited per
+key, the logging call site unless `extra={"key": ...}` names one: the first
+PROCESSOR_LOG_BURST records of a key per PROCESSOR_LOG_WINDOW_SECS pass, after that
+one in PROCESSOR_LOG_SAMPLE, and the next record that passes reports how many were
+suppressed.
+"""
+
+import os
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .metrics import registry
+from .store_scope import current_store_id
+
+PROCESSOR_LOG_DIR = os.getenv("PROCESSOR_LOG_DIR", "logs")
+PROCESSOR_LOG_LEVEL = os.getenv("PROCESSOR_LOG_LEVEL", "INFO")
+PROCESSOR_LOG_MAX_BYTES = int(os.getenv("PROCESSOR_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+PROCESSOR_LOG_BACKUPS = int(os.getenv("PROCESSOR_LOG_BACKUPS", "5"))
+PROCESSOR_LOG_SYSLOG = os.getenv("PROCESSOR_LOG_SYSLOG", "")
+PROCESSOR_LOG_STDERR = os.getenv("PROCESSOR_LOG_STDERR", "0") == "1"
+PROCESSOR_LOG_QUEUE = int(os.getenv("PROCESSOR_LOG_QUEUE", "10000"))
+PROCESSOR_LOG_BURST = int(os.getenv("PROCESSOR_LOG_BURST", "10"))
+PROCESSOR_LOG_WINDOW_SECS = float(os.getenv("PROCESSOR_LOG_WINDOW_SECS", "60"))
+PROCESSOR_LOG_SAMPLE = int(os.getenv("PROCESSOR_LOG_SAMPLE", "100"))
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, context and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class ContextFilter(logging.Filter):
+    """Adds camera_id and store_id unless the call passed its own"""
+
+    def __init__(self, camera_id=None, store_id=None):
+        super().__init__()
+        self.camera_id = camera_id
+        self.store_id = store_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "camera_id"):
+            record.camera_id = self.camera_id
+        if not hasattr(record, "store_id"):
+            record.store_id = self.store_id
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """Per-key burst allowance per window, then 1-in-N sampling"""
+
+    def __init__(self, burst: int = PROCESSOR_LOG_BURST, window: float = PROCESSOR_LOG_WINDOW_SECS,
+                 sample: int = PROCESSOR_LOG_SAMPLE, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sample = max(1, sample)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._keys: Dict[str, list] = {}  # key -> [window start, records in window, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "key", None) or f"{record.name}:{record.lineno}"
+        now = self.clock()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                state = self._keys[key] = [now, 0, suppressed]
+            state[1] += 1
+            n = state[1]
+            if n > self.burst and (n - self.burst) % self.sample:
+                state[2] += 1
+                return False
+            suppressed, state[2] = state[2], 0
+        record.key = key
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising on a full queue"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format the message in the caller (args may change later) and keep the
+        # traceback in its own field instead of appending it to the message
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = record.exc_text = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            registry.inc("log_records_dropped_total")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def _handlers(camera_id) -> List[logging.Handler]:
+    formatter = JsonFormatter()
+    handlers: List[logging.Handler] = []
+    if PROCESSOR_LOG_DIR:
+        os.makedirs(PROCESSOR_LOG_DIR, exist_ok=True)
+        name = f"camera-{camera_id}.log" if camera_id is not None else "processor.log"
+        handlers.append(logging.handlers.RotatingFileHandler(
+            os.path.join(PROCESSOR_LOG_DIR, name), maxBytes=PROCESSOR_LOG_MAX_BYTES,
+            backupCount=PROCESSOR_LOG_BACKUPS, encoding="utf-8"))
+    if PROCESSOR_LOG_SYSLOG:
+        host, _, port = PROCESSOR_LOG_SYSLOG.rpartition(":")
+        handlers.append(logging.handlers.SysLogHandler(address=(host or "localhost", int(port))))
+    if PROCESSOR_LOG_STDERR or not handlers:
+        handlers.append(logging.StreamHandler())
+    for h in handlers:
+        h.setFormatter(formatter)
+    return handlers
+
+def configure_processor_logging(camera_id=None, store_id=None):
+    """Replace the root logger's handlers with the queue; safe to call more than once"""
+    global _listener
+    _stop_listener()
+    q: queue.Queue = queue.Queue(maxsize=PROCESSOR_LOG_QUEUE)
+    handler = DroppingQueueHandler(q)
+    handler.addFilter(ContextFilter(camera_id, store_id or current_store_id()))
+    handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(PROCESSOR_LOG_LEVEL)
+    _listener = logging.handlers.QueueListener(q, *_handlers(camera_id), respect_handler_level=True)
+    _listener.start()
+
+def _stop_listener():
+    # Drains what is queued, e.g. before the interpreter exits
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(_stop_listener)
@@ -0,0 +1,44 @@
+"""
+64-bit track identifiers, unique across cameras and processor restarts.
+
+Layout (most significant first): 1 unused sign bit, 41 bits of milliseconds since
+2020-01-01 UTC (until 2089), 10 bits of camera slot (camera_id mod 1024) and
+12 bits of sequence within the millisecond. IDs of one camera increase with time,
+so an index on them is append-only, and they fit SQLite's signed INTEGER.
+
+Each tracker owns its generator and only the processing thread calls it, so there
+is no lock. When more than 4096 tracks start within one millisecond the generator
+borrows the next millisecond, and it never goes backwards if the clock does.
+"""
+
+import time
+
+EPOCH_MS = 1577836800000  # 2020-01-01T00:00:00Z
+TIME_BITS = 41
+SLOT_BITS = 10
+SEQ_BITS = 12
+SLOT_MASK = (1 << SLOT_BITS) - 1
+SEQ_MASK = (1 << SEQ_BITS) - 1
+
+class TrackIdGenerator:
+    def __init__(self, camera_id: int, clock=time.time):
+        self.slot = int(camera_id) & SLOT_MASK
+        self.clock = clock
+        self._last_ms = -1
+        self._seq = 0
+
+    def next(self) -> int:
+        ms = max(int(self.clock() * 1000) - EPOCH_MS, self._last_ms, 0)
+        if ms == self._last_ms:
+            self._seq = (self._seq + 1) & SEQ_MASK
+            if self._seq == 0:
+                ms += 1  # sequence exhausted: borrow the next millisecond
+        else:
+            self._seq = 0
+        self._last_ms = ms
+        return (ms << (SLOT_BITS + SEQ_BITS)) | (self.slot << SEQ_BITS) | self._seq
+
+def split(track_id: int):
+    """(unix seconds, camera slot, sequence) of an ID"""
+    return ((track_id >> (SLOT_BITS + SEQ_BITS)) + EPOCH_MS) / 1000.0, \
+        (track_id >> SEQ_BITS) & SLOT_MASK, track_id & SEQ_MASK
@@ -0,0 +1,143 @@
+"""
+Compact track trajectories.
+
+A path is an (N, 3) array of (t, x, y): t in seconds from the track's entry, x/y in
+frame pixels. Paths are simplified with Douglas-Peucker using the synchronized
+Euclidean distance (the distance to where the simplified path says the person was at
+that instant), so pauses survive simplification. Encoded as 0.1 s / 1 px integers,
+delta + zigzag + varint, then zlib; a typical visit is tens of bytes.
+"""
+
+import zlib
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_VERSION = 1
+_HEADER = struct.Struct("<BHHI")  # version, frame width, frame height, points
+TIME_SCALE = 10.0  # ticks per second
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker over (t, x, y) with the synchronized Euclidean distance"""
+    n = len(points)
+    if n <= 2 or tolerance <= 0:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        seg = points[a + 1:b]
+        span = points[b, 0] - points[a, 0]
+        frac = (seg[:, 0] - points[a, 0]) / span if span > 0 else np.zeros(len(seg))
+        ex = points[a, 1] + frac * (points[b, 1] - points[a, 1])
+        ey = points[a, 2] + frac * (points[b, 2] - points[a, 2])
+        d = np.hypot(seg[:, 1] - ex, seg[:, 2] - ey)
+        i = int(np.argmax(d))
+        if d[i] > tolerance:
+            mid = a + 1 + i
+            keep[mid] = True
+            stack.append((a, mid))
+            stack.append((mid, b))
+    return points[keep]
+
+def compact(points: np.ndarray, tolerance: float, max_points: int, rounds: int = 4) -> np.ndarray:
+    """Simplify to at most max_points, doubling the tolerance up to `rounds` times and
+    then keeping evenly spaced points (endpoints included) if that is not enough"""
+    out = simplify(points, tolerance)
+    for _ in range(rounds):
+        if len(out) <= max_points or tolerance <= 0:
+            break
+        tolerance *= 2
+        out = simplify(out, tolerance)
+    if len(out) > max_points:
+        out = out[np.round(np.linspace(0, len(out) - 1, max(max_points, 2))).astype(np.int64)]
+    return out
+
+def _zigzag(v: np.ndarray) -> np.ndarray:
+    return ((v << 1) ^ (v >> 63)).astype(np.uint64)
+
+def _unzigzag(u: np.ndarray) -> np.ndarray:
+    return (u >> np.uint64(1)).astype(np.int64) ^ -(u & np.uint64(1)).astype(np.int64)
+
+def _varints(values: np.ndarray) -> bytes:
+    out = bytearray()
+    for n in values.tolist():
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+    return bytes(out)
+
+def _unvarints(buf: np.ndarray) -> np.ndarray:
+    """Vectorized varint decode of a uint8 array into uint64 values"""
+    if not buf.size:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    pos = np.arange(buf.size) - np.repeat(starts, ends - starts + 1)
+    parts = (buf & 0x7F).astype(np.uint64) << (np.uint64(7) * pos.astype(np.uint64))
+    return np.add.reduceat(parts, starts)
+
+def encode(points: np.ndarray, frame_size: Tuple[int, int] = (0, 0)) -> bytes:
+    """Quantize, delta and varint-pack a (t, x, y) path"""
+    q = np.empty((len(points), 3), dtype=np.int64)
+    q[:, 0] = np.round(points[:, 0] * TIME_SCALE)
+    q[:, 1:] = np.round(points[:, 1:])
+    deltas = np.diff(q, axis=0, prepend=np.zeros((1, 3), dtype=np.int64))
+    body = zlib.compress(_varints(_zigzag(deltas.ravel())), 6)
+    return _HEADER.pack(_VERSION, int(frame_size[0]), int(frame_size[1]), len(points)) + body
+
+def _header(blob: bytes):
+    version, w, h, n = _HEADER.unpack_from(blob)
+    if version != _VERSION:
+        raise ValueError(f"Unsupported trajectory version {version}")
+    return w, h, n
+
+def _to_points(deltas: np.ndarray) -> np.ndarray:
+    q = np.cumsum(deltas.reshape(-1, 3), axis=0)
+    out = q.astype(np.float64)
+    out[:, 0] /= TIME_SCALE
+    return out
+
+def decode(blob: Optional[bytes]) -> np.ndarray:
+    """(N, 3) float array of (t, x, y)"""
+    if not blob:
+        return np.zeros((0, 3))
+    _header(blob)
+    raw = np.frombuffer(zlib.decompress(blob[_HEADER.size:]), dtype=np.uint8)
+    return _to_points(_unzigzag(_unvarints(raw)))
+
+def frame_size(blob: bytes) -> Tuple[int, int]:
+    w, h, _ = _header(blob)
+    return w, h
+
+def decode_many(blobs: Iterable[Optional[bytes]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Bulk decode for path analytics: (points (M, 3), offsets (K + 1,)).
+
+    Path k is points[offsets[k]:offsets[k + 1]]; all varints are decoded in one pass.
+    """
+    raws: List[bytes] = []
+    counts: List[int] = []
+    for blob in blobs:
+        if not blob:
+            counts.append(0)
+            continue
+        counts.append(_header(blob)[2])
+        raws.append(zlib.decompress(blob[_HEADER.size:]))
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    if not raws:
+        return np.zeros((0, 3)), offsets
+    deltas = _unzigzag(_unvarints(np.frombuffer(b"".join(raws), dtype=np.uint8))).reshape(-1, 3)
+    q = np.cumsum(deltas, axis=0)
+    # Each path's deltas start from zero: subtract the running total of the paths before it
+    sizes = np.asarray([c for c in counts if c], dtype=np.int64)
+    ends = np.cumsum(sizes) - 1
+    carry = np.vstack((np.zeros((1, 3), dtype=q.dtype), q[ends[:-1]]))
+    q -= np.repeat(carry, sizes, axis=0)
+    points = q.astype(np.float64)
+    points[:, 0] /= TIME_SCALE
+    return points, offsets
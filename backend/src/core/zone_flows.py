@@ -0,0 +1,150 @@
+"""
+Zone-to-zone transition and co-visit counts of one camera.
+
+Zones are matrix rows/columns in the order they were first seen, and their names are
+stored with the counts:
+
+  transitions[i, j]  entries into zone j whose previous zone was i
+  covisits[i, j]     finished tracks that visited i and, later, j for the first time;
+                     the diagonal counts tracks that visited i, and the symmetric
+                     co-visit count of i and j is covisits[i, j] + covisits[j, i]
+
+Counts are stored per hour as the zone names plus zlib-compressed uint32 matrices.
+Blobs with different zone lists merge by name, so any range is the sum of its hours.
+"""
+
+import zlib
+import struct
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_VERSION = 1
+_HEADER = struct.Struct("<BHI")  # version, zones, length of the names
+
+class ZoneFlows:
+    def __init__(self, zones: Iterable[str] = ()):
+        self.zones: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.transitions = np.zeros((0, 0), dtype=np.int64)
+        self.covisits = np.zeros((0, 0), dtype=np.int64)
+        self.tracks = 0  # finished tracks that visited a zone
+        self._tracks: Dict[Any, list] = {}  # tid -> [index of the last zone entered, first-visit order]
+        for name in zones:
+            self._zone(name)
+
+    def _zone(self, name: str) -> int:
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.zones)
+            self.zones.append(name)
+            self.transitions = np.pad(self.transitions, ((0, 1), (0, 1)))
+            self.covisits = np.pad(self.covisits, ((0, 1), (0, 1)))
+        return i
+
+    def enter(self, tid, zone: str):
+        """A track entered a zone"""
+        j = self._zone(zone)
+        state = self._tracks.get(tid)
+        if state is None:
+            state = self._tracks[tid] = [None, []]
+        if state[0] is not None and state[0] != j:
+            self.transitions[state[0], j] += 1
+        state[0] = j
+        if j not in state[1]:
+            state[1].append(j)
+
+    def finish(self, tid):
+        """A track ended: add its visits to the co-visit counts"""
+        state = self._tracks.pop(tid, None)
+        if not state or not state[1]:
+            return
+        seq = np.array(state[1])
+        self.tracks += 1
+        self.covisits[seq, seq] += 1
+        if len(seq) > 1:
+            a, b = np.triu_indices(len(seq), 1)
+            self.covisits[seq[a], seq[b]] += 1  # pairs are distinct, so no np.add.at needed
+
+    def finish_all(self):
+        for tid in list(self._tracks):
+            self.finish(tid)
+
+    @property
+    def empty(self) -> bool:
+        return not self.transitions.any() and not self.covisits.any()
+
+    def reset(self):
+        """Zero the counts; tracks in progress are kept"""
+        self.transitions.fill(0)
+        self.covisits.fill(0)
+        self.tracks = 0
+
+    def merge(self, other: "ZoneFlows") -> "ZoneFlows":
+        idx = np.array([self._zone(name) for name in other.zones], dtype=np.int64)
+        if len(idx):
+            self.transitions[np.ix_(idx, idx)] += other.transitions
+            self.covisits[np.ix_(idx, idx)] += other.covisits
+        self.tracks += other.tracks
+        return self
+
+    def symmetric_covisits(self) -> np.ndarray:
+        both = self.covisits + self.covisits.T
+        np.fill_diagonal(both, np.diagonal(self.covisits))
+        return both
+
+    def funnel(self, steps: List[str]) -> List[Dict[str, Any]]:
+        """Tracks reaching each step of an ordered zone sequence.
+
+        Two steps are exact (visited the first, then the second). Longer funnels chain
+        the pairwise conversion rates, i.e. assume each step depends only on the one
+        before it.
+        """
+        counts: List[float] = []
+        for k, name in enumerate(steps):
+            i = self.index.get(name)
+            if i is None:
+                counts.append(0.0)
+            elif k == 0:
+                counts.append(float(self.covisits[i, i]))
+            else:
+                p = self.index.get(steps[k - 1])
+                visited = int(self.covisits[p, p]) if p is not None else 0
+                counts.append(counts[-1] * float(self.covisits[p, i]) / visited if visited else 0.0)
+        return [{"zone": name, "tracks": round(n, 1),
+                 "conversion_from_previous": round(n / counts[k - 1], 4) if k and counts[k - 1] else None,
+                 "conversion_from_first": round(n / counts[0], 4) if k and counts[0] else None}
+                for k, (name, n) in enumerate(zip(steps, counts))]
+
+    def to_bytes(self) -> bytes:
+        names = "\0".join(self.zones).encode()
+        counts = np.stack([self.transitions, self.covisits]).astype("<u4").tobytes()
+        return _HEADER.pack(_VERSION, len(self.zones), len(names)) + names + zlib.compress(counts, 6)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "ZoneFlows":
+        if not data:
+            return cls()
+        version, n, names_len = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported zone flow version {version}")
+        names = data[_HEADER.size:_HEADER.size + names_len].decode()
+        f = cls(names.split("\0") if n else ())
+        counts = np.frombuffer(zlib.decompress(data[_HEADER.size + names_len:]), dtype="<u4").reshape(2, n, n)
+        f.transitions, f.covisits = counts.astype(np.int64)
+        return f
+
+def merge_blobs(a: Optional[bytes], b: Optional[bytes]) -> bytes:
+    """Sum two serialized flow counts (registered as the SQL function zone_flow_merge)"""
+    if not a:
+        return b
+    if not b:
+        return a
+    return ZoneFlows.from_bytes(a).merge(ZoneFlows.from_bytes(b)).to_bytes()
+
+def sum_blobs(blobs: Iterable[Optional[bytes]]) -> ZoneFlows:
+    total = ZoneFlows()
+    for blob in blobs:
+        if blob:
+            total.merge(ZoneFlows.from_bytes(blob))
+    return total
@@ -1,9 +1,13 @@
 
 from typing import List, Tuple, Dict, Any, Optional
 import json
+import logging
 import numpy as np
 from ..database.db_manager import db
 from .store_scope import current_store_id
+from .floor_plan import FloorProjector
+
+logger = logging.getLogger(__name__)
 
 def point_in_poly(x: float, y: float, poly: List[Tuple[float, float]]) -> bool:
     """Improved point-in-polygon using ray casting algorithm"""
@@ -53,6 +57,34 @@ def polygon_centroid(poly: List[Tuple[float, float]]) -> Tuple[float, float]:
     
     return (cx / (6 * area), cy / (6 * area))
 
+def tripwire_crossings(anchors: np.ndarray, points: np.ndarray, a: np.ndarray, b: np.ndarray,
+                       margin: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Directed line-crossing test of M tracks against K tripwires in one pass.
+
+    anchors: (M, K, 2) last position of each track clear of each wire (NaN if none yet)
+    points:  (M, 2) current positions; a, b: (K, 2) wire endpoints (A -> B)
+    Returns (crossed, settled), both (M, K): crossed is +1 for a crossing to the right
+    of A -> B as drawn on screen ("in"), -1 for the left ("out"), 0 otherwise. settled
+    marks positions more than `margin` pixels from the wire's line; only those become
+    the new anchors, so jitter along the line cannot produce crossings.
+    """
+    d = b - a                                            # (K, 2)
+    length = np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-9)
+    rel = points[:, None, :] - a[None, :, :]             # (M, K, 2)
+    side = (d[None, :, 0] * rel[..., 1] - d[None, :, 1] * rel[..., 0]) / length
+    settled = np.abs(side) > margin
+
+    # Proper intersection of anchor -> point with A -> B
+    rel0 = anchors - a[None, :, :]
+    side0 = d[None, :, 0] * rel0[..., 1] - d[None, :, 1] * rel0[..., 0]
+    move = points[:, None, :] - anchors                  # (M, K, 2)
+    ta = move[..., 0] * (a[None, :, 1] - anchors[..., 1]) - move[..., 1] * (a[None, :, 0] - anchors[..., 0])
+    tb = move[..., 0] * (b[None, :, 1] - anchors[..., 1]) - move[..., 1] * (b[None, :, 0] - anchors[..., 0])
+    with np.errstate(invalid="ignore"):
+        hit = settled & (side0 * side < 0) & (ta * tb <= 0)
+    crossed = np.where(hit, np.sign(side), 0).astype(np.int8)
+    return crossed, settled
+
 class EnhancedZoneManager:
     def __init__(self, camera_id: int):
         self.camera_id = camera_id
@@ -62,6 +94,7 @@ class EnhancedZoneManager:
         self.zones = []
         self.zone_hierarchy = {}  # For nested zones
         self.zone_priorities = {}  # Zone priority mapping
+        self.floor = None  # FloorProjector when the camera is calibrated to the floor plan
         self._load()
     
     def _load(self):
@@ -104,12 +137,19 @@ class EnhancedZoneManager:
                 
                 self.zones.append(zone_data)
                 self.zone_priorities[name] = priority or 1
+        
+        try:
+            self.floor = FloorProjector.load(self.camera_id, self.store_id)
+        except Exception as e:
+            logger.warning(f"Floor plan tables unavailable for camera {self.camera_id}: {e}")
+            self.floor = None
     
     def reload(self):
         """Reload zones from database"""
         self.zones = []
         self.zone_hierarchy = {}
         self.zone_priorities = {}
+        self._tripwires_key = None
         self._load()
     
     def _scale_polygon(self, fw: int, fh: int, poly: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
@@ -137,8 +177,12 @@ class EnhancedZoneManager:
         
         return scaled_zones
     
-    def classify(self, fw: int, fh: int, cx: float, cy: float) -> List[Dict[str, Any]]:
-        """Classify point into zones with priority handling"""
+    def classify(self, fw: int, fh: int, cx: float, cy: float, h: float = 0) -> List[Dict[str, Any]]:
+        """Classify point into zones with priority handling.
+        
+        Floor-plan zones are looked up at the foot point (cy + h/2) through the
+        camera's precomputed table when the camera is calibrated.
+        """
         hits = []
         scaled_zones = self.get_scaled_zones(fw, fh)
         
@@ -146,6 +190,8 @@ class EnhancedZoneManager:
         scaled_zones.sort(key=lambda z: z["priority"], reverse=True)
         
         for zone in scaled_zones:
+            if zone["ztype"] == "tripwire":
+                continue
             if point_in_poly(cx, cy, zone["poly"]):
                 hits.append({
                     "id": zone["id"],
@@ -156,6 +202,9 @@ class EnhancedZoneManager:
                     "color": zone["color"]
                 })
         
+        if self.floor is not None and self.floor.zones:
+            hits.extend(self.floor.zones_at(fw, fh, cx, cy + h / 2))
+        
         return hits
     
     def get_zone_by_name(self, zone_name: str) -> Optional[Dict[str, Any]]:
@@ -163,8 +212,22 @@ class EnhancedZoneManager:
         for zone in self.zones:
             if zone["name"] == zone_name:
                 return zone
+        for zone in (self.floor.zones if self.floor is not None else []):
+            if zone["name"] == zone_name:
+                return zone
         return None
     
+    def get_tripwires(self, fw: int, fh: int) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Names and scaled endpoints (A, B as (K, 2) arrays) of the tripwire zones"""
+        key = (fw, fh)
+        if getattr(self, "_tripwires_key", None) != key:
+            wires = [z for z in self.get_scaled_zones(fw, fh) if z["ztype"] == "tripwire" and len(z["poly"]) == 2]
+            self._tripwires = ([z["name"] for z in wires],
+                               np.array([z["poly"][0] for z in wires], dtype=np.float64).reshape(-1, 2),
+                               np.array([z["poly"][1] for z in wires], dtype=np.float64).reshape(-1, 2))
+            self._tripwires_key = key
+        return self._tripwires
+    
     def get_zones_by_type(self, zone_type: str) -> List[Dict[str, Any]]:
         """Get all zones of a specific type"""
         return [zone for zone in self.zones if zone["ztype"] == zone_type]
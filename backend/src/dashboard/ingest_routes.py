@@ -0,0 +1,123 @@
+"""
+Ingestion API for edge processors.
+
+Processors POST compressed batches (see database/ingest.py) authenticated with a
+per-camera token. Each batch is applied in one transaction together with the
+camera's ingest cursor, and acknowledged with its sequence number. A batch from a new
+writer epoch resets the cursor; one older than the cursor of its own epoch is
+acknowledged without being applied, logged and counted in ingest_seq_regressions_total.
+"""
+
+import os
+import hashlib
+import logging
+import secrets
+from fastapi import APIRouter, Header, HTTPException, Request
+
+from ..database.db_manager import db
+from ..database.batch_writer import apply_rows
+from ..database.ingest import decode_batch, cursor_status
+from ..database.statements import INGEST_KINDS
+from ..core.store_scope import current_store_id
+from ..core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(64 << 20)))
+
+router = APIRouter(prefix="/api/ingest")
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _authenticate(camera_id: int, authorization: str) -> str:
+    """Store of the camera whose token was presented"""
+    token = authorization[7:] if authorization.startswith("Bearer ") else ""
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT store_id, token_hash FROM camera_tokens WHERE camera_id=?", (camera_id,))
+        row = c.fetchone()
+    if not token or not row or not secrets.compare_digest(row[1], _hash_token(token)):
+        raise HTTPException(status_code=401, detail="Invalid camera credentials")
+    return row[0]
+
+@router.post("/tokens/{camera_id}")
+async def issue_token(camera_id: int):
+    """Create (or replace) a camera's ingest token; the token is only shown once"""
+    sid = current_store_id()
+    token = secrets.token_urlsafe(32)
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM cameras WHERE id=? AND store_id=?", (camera_id, sid))
+        if not c.fetchone():
+            raise HTTPException(status_code=404, detail="Camera not found")
+        c.execute("""INSERT INTO camera_tokens (camera_id, store_id, token_hash) VALUES (?,?,?)
+                     ON CONFLICT(camera_id) DO UPDATE SET store_id=excluded.store_id,
+                     token_hash=excluded.token_hash, created_at=CURRENT_TIMESTAMP""",
+                  (camera_id, sid, _hash_token(token)))
+        conn.commit()
+    return {"camera_id": camera_id, "token": token}
+
+@router.get("/cursor")
+async def get_cursor(x_camera_id: int = Header(...), authorization: str = Header("")):
+    """Last applied batch sequence of the camera, so a restarted processor can resume"""
+    _authenticate(x_camera_id, authorization)
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT segment, offset, epoch FROM ingest_cursor WHERE camera_id=?", (x_camera_id,))
+        row = c.fetchone()
+    return {"camera_id": x_camera_id, "seq": list(row[:2]) if row else None, "epoch": row[2] if row else None}
+
+@router.post("/batch")
+async def ingest_batch(request: Request, x_camera_id: int = Header(...), authorization: str = Header(""),
+                       content_encoding: str = Header("")):
+    """Apply one batch of processor rows in a single transaction"""
+    store_id = _authenticate(x_camera_id, authorization)
+    try:
+        batch = decode_batch(await request.body(), content_encoding.lower(), INGEST_MAX_BYTES)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Malformed batch: {e}")
+
+    seq = batch.get("seq")
+    epoch = batch.get("epoch")
+    runs = batch.get("rows") or []
+    if isinstance(runs, dict):  # processors predating ordered runs
+        runs = list(runs.items())
+    unknown = [k for k, _ in runs if k not in INGEST_KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown row kinds: {unknown}")
+
+    # Store and camera always come from the credentials, never from the payload
+    grouped = []
+    for kind, rows in runs:
+        sql, store_idx, camera_idx = INGEST_KINDS[kind]
+        fixed = []
+        for params in rows:
+            params = list(params)
+            params[store_idx], params[camera_idx] = store_id, x_camera_id
+            fixed.append(tuple(params))
+        grouped.append((sql, fixed))
+
+    with db.transaction() as conn:
+        c = conn.cursor()
+        if seq:
+            c.execute("SELECT segment, offset, epoch FROM ingest_cursor WHERE camera_id=?", (x_camera_id,))
+            row = c.fetchone()
+            status = cursor_status(row, epoch, seq)
+            if status == "regressed":
+                registry.inc("ingest_seq_regressions_total", camera=x_camera_id)
+                logger.warning(f"Ingest: camera {x_camera_id} sent batch {seq} behind its cursor "
+                               f"{list(row[:2])} in epoch {epoch}; acknowledged without applying")
+            if status in ("repeat", "regressed"):
+                return {"ack": seq, "applied": False, "rows": 0, "regressed": status == "regressed"}
+            if status == "reset":
+                registry.inc("ingest_epoch_resets_total", camera=x_camera_id)
+                logger.info(f"Ingest: camera {x_camera_id} started epoch {epoch} at {seq} "
+                            f"(was {row[2]} at {list(row[:2])})")
+        cursor_row = ("""INSERT INTO ingest_cursor (camera_id, segment, offset, epoch) VALUES (?,?,?,?)
+                         ON CONFLICT(camera_id) DO UPDATE SET segment=excluded.segment, offset=excluded.offset,
+                         epoch=excluded.epoch, updated_at=CURRENT_TIMESTAMP""",
+                      (x_camera_id, seq[0], seq[1], epoch)) if seq else None
+        rejected = apply_rows(conn, grouped, cursor_row)
+
+    return {"ack": seq, "applied": True, "rows": sum(len(r) for _, r in grouped), "rejected": rejected}
@@ -2,7 +2,8 @@
 import os, json
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional
+import numpy as np
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
@@ -14,16 +15,29 @@ from ..database.migrations import run_migrations
 from ..database.db_manager import db
 from ..core.store_scope import current_store_id
 from ..analytics.analytics_engine import recompute_daily_store_metrics
+from ..analytics.reid_matcher import matcher as reid_matcher
+from ..core.reid import ENABLE_REID
+from .ingest_routes import router as ingest_router
 
 load_dotenv()
 
 app=FastAPI(title="WINK Store Backend")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.include_router(ingest_router)
 
 @app.on_event("startup")
 async def boot():
     # Run database migrations
     run_migrations()
+    
+    # Store-level person identity from processor embeddings
+    if ENABLE_REID:
+        reid_matcher.start()
+    
+    # History for unique-visitor HyperLogLogs
+    if os.getenv("REDIS_URL", "redis://localhost:6379"):
+        from ..camera.unique_hll import HllSnapshotter
+        HllSnapshotter(os.getenv("REDIS_URL", "redis://localhost:6379")).start()
 
     # Create assets directory
     Path(os.getenv("ASSETS_DIR","assets")).mkdir(parents=True, exist_ok=True)
@@ -93,6 +107,8 @@ async def list_zones(camera_id: Optional[int] = Query(None)):
 async def add_zone(camera_id:int=Form(...), name:str=Form(...), ztype:str=Form(...), polygon_json:str=Form(...)):
     sid=current_store_id()
     coords=json.loads(polygon_json)
+    if ztype=="tripwire" and len(coords)!=2:
+        raise HTTPException(status_code=400, detail="A tripwire is a directed segment [[x1,y1],[x2,y2]]; 'in' is crossing to its right")
     with db.transaction() as conn:
         c=conn.cursor()
         c.execute("INSERT INTO zones (store_id,camera_id,name,ztype,polygon_json) VALUES (?,?,?,?,?)",(sid,camera_id,name,ztype,json.dumps(coords)))
@@ -124,6 +140,119 @@ async def overlay(camera_id:int):
     out=ASSETS_DIR/"zones"/sid/str(camera_id)/"overlay.png"; out.parent.mkdir(parents=True,exist_ok=True); img.save(out,"PNG")
     return FileResponse(str(out))
 
+# ---- Floor plan & camera calibration ----
+class CalibrationPoint(BaseModel):
+    image: List[float]  # [x, y] in zone screenshot pixels
+    floor: List[float]  # [x, y] in floor plan units
+
+class CalibrationRequest(BaseModel):
+    points: List[CalibrationPoint]
+
+@app.post("/api/floorplan")
+async def upload_floorplan(width:float=Form(...), height:float=Form(...), cell_size:float=Form(...),
+                           file:Optional[UploadFile]=File(None)):
+    """Store floor plan: extent in floor units (e.g. cm) and the analytics cell size"""
+    if width<=0 or height<=0 or cell_size<=0:
+        raise HTTPException(status_code=400, detail="width, height and cell_size must be positive")
+    sid=current_store_id()
+    fp=None
+    if file is not None:
+        out=ASSETS_DIR/"floorplan"/sid; out.mkdir(parents=True, exist_ok=True)
+        fp=out/"floorplan.png"; fp.write_bytes(await file.read())
+    with db.transaction() as conn:
+        c=conn.cursor()
+        c.execute("""INSERT INTO floor_plans (store_id,file_path,width,height,cell_size) VALUES (?,?,?,?,?)
+                     ON CONFLICT(store_id) DO UPDATE SET file_path=COALESCE(excluded.file_path,file_path),
+                     width=excluded.width,height=excluded.height,cell_size=excluded.cell_size""",
+                  (sid,str(fp) if fp else None,width,height,cell_size))
+        conn.commit()
+    return {"status":"ok","note":"re-run camera calibrations after changing the extent or cell size"}
+
+@app.post("/api/floorplan/zones")
+async def add_floor_zone(name:str=Form(...), ztype:str=Form(...), polygon_json:str=Form(...)):
+    """Zone defined once on the floor plan; applies to every calibrated camera"""
+    from ..core.floor_plan import FLOOR_ZONES_CAMERA, MAX_FLOOR_ZONES
+    sid=current_store_id()
+    coords=json.loads(polygon_json)
+    if len(coords)<3:
+        raise HTTPException(status_code=400, detail="A floor zone needs at least three points")
+    with db.transaction() as conn:
+        c=conn.cursor()
+        c.execute("SELECT COUNT(*) FROM zones WHERE store_id=? AND camera_id=?", (sid,FLOOR_ZONES_CAMERA))
+        if c.fetchone()[0]>=MAX_FLOOR_ZONES:
+            raise HTTPException(status_code=400, detail=f"A store can have at most {MAX_FLOOR_ZONES} floor zones")
+        c.execute("INSERT INTO zones (store_id,camera_id,name,ztype,polygon_json) VALUES (?,?,?,?,?)",
+                  (sid,FLOOR_ZONES_CAMERA,name,ztype,json.dumps(coords)))
+        conn.commit(); return {"id": c.lastrowid}
+
+@app.post("/api/calibration/{camera_id}")
+async def calibrate_camera(camera_id:int, req:CalibrationRequest):
+    """Fit the camera's screenshot -> floor homography and precompute its lookup table"""
+    from ..core.floor_plan import estimate_homography, build_lut, encode_lut, project
+    sid=current_store_id()
+    with db.transaction() as conn:
+        c=conn.cursor()
+        c.execute("SELECT img_width,img_height FROM zone_screenshots WHERE store_id=? AND camera_id=?", (sid,camera_id))
+        shot=c.fetchone()
+        c.execute("SELECT width,height,cell_size FROM floor_plans WHERE store_id=?", (sid,))
+        plan=c.fetchone()
+    if not shot: raise HTTPException(status_code=404, detail="Upload screenshot first")
+    if not plan: raise HTTPException(status_code=404, detail="Upload floor plan first")
+    image_pts=[p.image for p in req.points]; floor_pts=[p.floor for p in req.points]
+    try:
+        h, rms = estimate_homography(image_pts, floor_pts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    lut=build_lut(h, shot[0], shot[1], plan[0], plan[1], plan[2])
+    with db.transaction() as conn:
+        c=conn.cursor()
+        c.execute("""INSERT INTO camera_calibrations
+                     (store_id,camera_id,homography_json,points_json,img_width,img_height,rms_error,lut,lut_rows,lut_cols)
+                     VALUES (?,?,?,?,?,?,?,?,?,?)
+                     ON CONFLICT(store_id,camera_id) DO UPDATE SET homography_json=excluded.homography_json,
+                     points_json=excluded.points_json,img_width=excluded.img_width,img_height=excluded.img_height,
+                     rms_error=excluded.rms_error,lut=excluded.lut,lut_rows=excluded.lut_rows,lut_cols=excluded.lut_cols,
+                     created_at=CURRENT_TIMESTAMP""",
+                  (sid,camera_id,json.dumps(h.tolist()),json.dumps([p.dict() for p in req.points]),shot[0],shot[1],
+                   rms,encode_lut(lut),lut.shape[0],lut.shape[1]))
+        conn.commit()
+    proj,_=project(h, image_pts)
+    return {"camera_id":camera_id,"homography":h.tolist(),"rms_error":rms,
+            "residuals":[float(d) for d in np.hypot(*(proj-np.asarray(floor_pts)).T)],
+            "lut":{"rows":int(lut.shape[0]),"cols":int(lut.shape[1]),"floor_coverage":float((lut>=0).mean())},
+            "note":"running processors pick up the new table when they restart"}
+
+@app.get("/api/calibration/{camera_id}")
+async def get_calibration(camera_id:int):
+    sid=current_store_id()
+    with db.transaction() as conn:
+        c=conn.cursor()
+        c.execute("""SELECT homography_json,points_json,img_width,img_height,rms_error,lut_rows,lut_cols,created_at
+                     FROM camera_calibrations WHERE store_id=? AND camera_id=?""", (sid,camera_id))
+        r=c.fetchone()
+    if not r: raise HTTPException(status_code=404, detail="Camera not calibrated")
+    return {"camera_id":camera_id,"homography":json.loads(r[0]),"points":json.loads(r[1]),
+            "image":{"width":r[2],"height":r[3]},"rms_error":r[4],"lut":{"rows":r[5],"cols":r[6]},"created_at":r[7]}
+
+@app.get("/api/floorplan/heatmap")
+async def floor_heatmap(start:str, end:str):
+    """Person-seconds per floor-plan cell over [start, end] from all calibrated cameras"""
+    from ..analytics.heatmaps import floor_occupancy
+    out=floor_occupancy(start, end)
+    if out is None: raise HTTPException(status_code=404, detail="Upload floor plan first")
+    return out
+
+@app.get("/api/heatmap/{camera_id}")
+async def heatmap(camera_id:int, start:str, end:str):
+    """Dwell-weighted occupancy heatmap over [start, end] drawn on the zone screenshot"""
+    from ..analytics.heatmaps import render_heatmap
+    sid=current_store_id()
+    try:
+        out=render_heatmap(camera_id, start, end, ASSETS_DIR/"zones"/sid/str(camera_id)/"heatmaps")
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return FileResponse(str(out), media_type="image/png")
+
 # ---- Metrics read ----
 @app.get("/api/metrics/hourly")
 async def metrics_hourly(start:str, end:str):
@@ -145,10 +274,11 @@ async def metrics_daily(days:int=7):
     sid=current_store_id()
     with db.transaction() as conn:
         c=conn.cursor()
-        c.execute("""SELECT date,dwell_avg,queue_wait_avg,interactions,peak_hour
+        c.execute("""SELECT date,dwell_avg,queue_wait_avg,interactions,peak_hour,queue_wait_p95
                      FROM daily_store_metrics WHERE store_id=? ORDER BY date DESC LIMIT ?""",(sid,days))
         rows=c.fetchall()
-    return [{"date":r[0],"dwell_avg":r[1],"queue_wait_avg":r[2],"interactions":r[3],"peak_hour":r[4]} for r in rows]
+    return [{"date":r[0],"dwell_avg":r[1],"queue_wait_avg":r[2],"interactions":r[3],"peak_hour":r[4],
+             "queue_wait_p95":r[5]} for r in rows]
 
 @app.get("/api/metrics/daily_by_camera")
 async def metrics_daily_by_camera(days:int=7):
@@ -461,32 +591,30 @@ async def get_realtime_metrics():
         import redis
         redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
         
+        from ..camera.live_state import read_occupancy
+        
         sid = current_store_id()
         
-        # Get live camera counts
-        live_metrics = {}
         with db.transaction() as conn:
             c = conn.cursor()
             c.execute("SELECT id, name FROM cameras WHERE store_id=? AND enabled=1", (sid,))
             cameras = c.fetchall()
-            
-            for camera_id, camera_name in cameras:
-                try:
-                    live_count = redis_client.get(f"live_count:{camera_id}")
-                    if callable(getattr(live_count, "__await__", None)):
-                        live_count = await live_count
-                    count_value = int(live_count.decode() if live_count else 0) # type: ignore
-                    live_metrics[str(camera_id)] = {
-                        "camera_name": camera_name,
-                        "live_count": count_value,
-                        "last_updated": datetime.now(timezone.utc).isoformat()
-                    }
-                except:
-                    live_metrics[str(camera_id)] = {
-                        "camera_name": camera_name,
-                        "live_count": 0,
-                        "last_updated": datetime.now(timezone.utc).isoformat()
-                    }
+        
+        # Live occupancy of every camera in one round trip
+        try:
+            counts = read_occupancy(redis_client, [camera_id for camera_id, _ in cameras])
+        except redis.RedisError:
+            counts = {}
+        
+        updated = datetime.now(timezone.utc).isoformat()
+        live_metrics = {
+            str(camera_id): {
+                "camera_name": camera_name,
+                "live_count": counts.get(camera_id, 0),
+                "last_updated": updated
+            }
+            for camera_id, camera_name in cameras
+        }
         
         return {
             "timestamp": datetime.now(timezone.utc).isoformat(),
@@ -501,6 +629,50 @@ async def get_realtime_metrics():
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
+@app.get("/api/live/tracks")
+async def get_live_tracks():
+    """Live tracks of all cameras of the store"""
+    import redis
+    from ..camera.live_state import read_store_tracks
+    try:
+        redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        cameras = read_store_tracks(redis_client, current_store_id())
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Live tracking unavailable: {e}")
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "cameras": cameras,
+        "total_tracks": sum(len(t) for t in cameras.values())
+    }
+
+@app.get("/api/live/queues")
+async def get_live_queues():
+    """Length, arrival/departure rates and expected wait of every queue zone of the store"""
+    import redis
+    from ..camera.queue_state import read_store_queues
+    try:
+        redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        queues = read_store_queues(redis_client, current_store_id())
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Live queues unavailable: {e}")
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "queues": queues,
+        "total_in_queue": sum(q["length"] for q in queues)
+    }
+
+@app.get("/api/live/tracks/{camera_id}")
+async def get_live_camera_tracks(camera_id: int):
+    """Live tracks of one camera"""
+    import redis
+    from ..camera.live_state import read_camera_tracks
+    try:
+        redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        tracks = read_camera_tracks(redis_client, camera_id)
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Live tracking unavailable: {e}")
+    return {"timestamp": datetime.now(timezone.utc).isoformat(), "camera_id": camera_id, "tracks": tracks}
+
 @app.get("/api/analytics/alerts")
 async def get_active_alerts():
     """Get active alerts for the store"""
@@ -509,7 +681,7 @@ async def get_active_alerts():
     with db.transaction() as conn:
         c = conn.cursor()
         c.execute("""
-            SELECT id, alert_type, severity, message, created_at
+            SELECT id, alert_type, severity, message, created_at, camera_id, zone_id, value
             FROM alerts WHERE store_id=? AND resolved=0 
             ORDER BY created_at DESC LIMIT 50
         """, (sid,))
@@ -521,7 +693,10 @@ async def get_active_alerts():
                 "alert_type": row[1],
                 "severity": row[2],
                 "message": row[3],
-                "created_at": row[4]
+                "created_at": row[4],
+                "camera_id": row[5],
+                "zone": row[6],
+                "value": row[7]
             })
     
     return {"alerts": alerts, "alert_count": len(alerts)}
@@ -541,6 +716,60 @@ async def resolve_alert(alert_id: int):
     
     return {"status": "resolved"}
 
+class AlertRuleIn(BaseModel):
+    name: str
+    metric: str
+    threshold: float
+    op: str = ">"
+    camera_id: Optional[int] = None
+    zone: Optional[str] = None
+    clear_threshold: Optional[float] = None
+    for_secs: float = 0
+    clear_secs: Optional[float] = None
+    mode: str = "for"
+    severity: str = "warning"
+
+@app.get("/api/alerts/rules")
+async def list_alert_rules():
+    """Alert rules evaluated by the store's processors"""
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT id, name, metric, camera_id, zone_id, op, threshold, clear_threshold,
+                            for_secs, clear_secs, mode, severity, enabled
+                     FROM alert_rules WHERE store_id=? ORDER BY id""", (current_store_id(),))
+        keys = ["id", "name", "metric", "camera_id", "zone", "op", "threshold", "clear_threshold",
+                "for_secs", "clear_secs", "mode", "severity", "enabled"]
+        return {"rules": [dict(zip(keys, r)) for r in c.fetchall()]}
+
+@app.post("/api/alerts/rules")
+async def add_alert_rule(rule: AlertRuleIn):
+    """Add a rule, e.g. queue_length > 5 for 120 s; processors pick it up within ALERT_RULES_RELOAD_SECS"""
+    from ..camera.alert_rules import METRICS, ZONE_METRICS
+    if rule.metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRICS)}")
+    if rule.op not in (">", "<") or rule.mode not in ("for", "avg"):
+        raise HTTPException(status_code=400, detail="op must be '>' or '<' and mode 'for' or 'avg'")
+    if rule.zone and rule.metric not in ZONE_METRICS:
+        raise HTTPException(status_code=400, detail=f"{rule.metric} is a camera metric and takes no zone")
+    if rule.mode == "avg" and rule.for_secs < 1:
+        raise HTTPException(status_code=400, detail="avg rules need a window (for_secs) of at least 1 s")
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("""INSERT INTO alert_rules (store_id, name, metric, camera_id, zone_id, op, threshold,
+                                              clear_threshold, for_secs, clear_secs, mode, severity)
+                     VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""",
+                  (current_store_id(), rule.name, rule.metric, rule.camera_id, rule.zone or None, rule.op,
+                   rule.threshold, rule.clear_threshold, rule.for_secs, rule.clear_secs, rule.mode, rule.severity))
+        conn.commit()
+        return {"id": c.lastrowid}
+
+@app.delete("/api/alerts/rules/{rule_id}")
+async def delete_alert_rule(rule_id: int):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM alert_rules WHERE id=? AND store_id=?", (rule_id, current_store_id()))
+        conn.commit()
+    return {"ok": True}
+
 @app.get("/api/zones/{camera_id}/analytics")
 async def get_zone_analytics(camera_id: int, days: int = 7):
     """Get detailed zone analytics for a camera"""
@@ -574,6 +803,87 @@ async def get_zone_analytics(camera_id: int, days: int = 7):
         "performance_analysis": zone_analytics
     }
 
+@app.get("/api/zones/{camera_id}/occupancy")
+async def get_zone_occupancy(camera_id: int, start: str, end: str):
+    """Hourly average and peak occupancy per zone, from minute rollups or presence intervals"""
+    engine = EnhancedAnalyticsEngine()
+    occupancy = engine.get_zone_occupancy(camera_id, start, end)
+    occupancy["dwell"] = engine.get_zone_dwell_stats(camera_id, start, end)
+    return occupancy
+
+@app.get("/api/metrics/durations")
+async def get_duration_distribution(start: str, end: str, metric: str = "dwell",
+                                    camera_id: Optional[int] = None, zone: Optional[str] = None):
+    """Dwell or queue-wait percentiles for any range, merged from hourly histograms"""
+    if metric not in ("dwell", "queue_wait"):
+        raise HTTPException(status_code=400, detail="metric must be 'dwell' or 'queue_wait'")
+    return EnhancedAnalyticsEngine().get_duration_distribution(start, end, metric, camera_id, zone or "")
+
+@app.get("/api/zones/flows")
+async def get_zone_flows(start: str, end: str, camera_id: Optional[int] = None, top: int = Query(20, le=1000)):
+    """Zone-to-zone transitions and co-visits over a range of hours"""
+    return EnhancedAnalyticsEngine().get_zone_flows(start, end, camera_id, top)
+
+@app.get("/api/zones/funnel")
+async def get_zone_funnel(start: str, end: str, steps: str, camera_id: Optional[int] = None):
+    """Funnel over comma-separated zone names, e.g. steps=entrance,shelf,checkout"""
+    names = [z.strip() for z in steps.split(",") if z.strip()]
+    if len(names) < 2:
+        raise HTTPException(status_code=400, detail="steps needs at least two zone names")
+    return EnhancedAnalyticsEngine().get_zone_funnel(start, end, names, camera_id)
+
+@app.get("/api/occupancy/store")
+async def get_store_occupancy(date: Optional[str] = None):
+    """Store occupancy from tripwire counts: cumulative in minus out since midnight"""
+    return EnhancedAnalyticsEngine().get_store_occupancy(date)
+
+@app.get("/api/visitors/store")
+async def get_store_visitors(date: Optional[str] = None):
+    """Store-wide unique visitors from cross-camera re-identification (ENABLE_REID)"""
+    return EnhancedAnalyticsEngine().get_store_visitors(date)
+
+@app.get("/api/visitors/unique")
+async def get_unique_visitors(start: str, end: str, camera_ids: Optional[str] = None):
+    """Unique visitors over any window (hour resolution, UTC) from HyperLogLogs.
+    
+    camera_ids is a comma-separated list; omitted means the whole store, which uses the
+    re-identified store-wide registers when ENABLE_REID is on.
+    """
+    import redis
+    from ..camera.unique_hll import count_unique, STORE_CAMERA
+    sid = current_store_id()
+    if camera_ids:
+        try:
+            cameras = [int(c) for c in camera_ids.split(",") if c.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="camera_ids must be comma-separated integers")
+    elif ENABLE_REID:
+        cameras = [STORE_CAMERA]
+    else:
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id FROM cameras WHERE store_id=?", (sid,))
+            cameras = [r[0] for r in c.fetchall()]
+    try:
+        redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        result = count_unique(redis_client, sid, start, end, cameras)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates or datetimes")
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Unique counts unavailable: {e}")
+    result["store_wide"] = cameras == [STORE_CAMERA]
+    return result
+
+@app.get("/api/tracks/paths")
+async def get_track_paths(start: str, end: str, camera_id: Optional[int] = None, limit: int = Query(1000, le=10000)):
+    """Simplified trajectories (seconds from entry, x, y in frame pixels) of visits in a window"""
+    return EnhancedAnalyticsEngine().get_track_paths(start, end, camera_id, limit)
+
+@app.get("/api/metrics/minutes")
+async def get_minute_metrics(start: str, end: str, camera_id: Optional[int] = None, zone: Optional[str] = None):
+    """Per-minute counters from processor rollups (EDGE_ROLLUPS); zone omitted = whole camera"""
+    return EnhancedAnalyticsEngine().get_minute_series(start, end, camera_id, zone or "")
+
 @app.post("/api/insights/combined")
 async def insights_combined(req: CombinedRequest):
     base = await insights_weekly(InsightsRequest(period_weeks=req.period_weeks))
@@ -0,0 +1,314 @@
+"""
+Write-behind queue for processor inserts.
+
+Rows are queued in submit order, as runs of consecutive rows of the same SQL
+statement, and a background thread writes each run with executemany, one transaction
+per flush. Keeping the order lets a row depend on an earlier row of another
+statement, e.g. an UPDATE of a row inserted just before it. A flush happens when WRITER_BATCH_SIZE rows
+are pending or WRITER_FLUSH_INTERVAL seconds have passed, whichever is first, and the
+queue is drained on interpreter exit. Queue depth and flush latency go to core.metrics.
+
+With WRITER_SPOOL_DIR set, the queue is a SegmentedSpool on local disk instead of
+memory: rows survive database outages and process restarts, and are replayed in
+batches of up to WRITER_REPLAY_BATCH rows once the database is reachable. The replay
+position is stored in spool_cursor in the same transaction as the rows, so a crash
+between commit and truncation does not apply anything twice.
+
+With INGEST_URL set, batches go to the central backend's ingestion API (see
+ingest.py) instead of a local database connection, tagged with an epoch: the spool's,
+or without a spool a new one per process. Without a spool every batch is numbered
+from 1 in the new epoch, and a batch whose ack was lost is resent unchanged under the
+same number, so the backend applies it once.
+"""
+
+import os
+import re
+import time
+import atexit
+import logging
+import sqlite3
+import socket
+import secrets
+import threading
+from typing import List, Optional, Tuple
+
+import msgpack
+
+from .db_manager import db as default_db
+from .spool import SegmentedSpool
+from .ingest import IngestSink, encode_default
+from ..core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_TABLE_RE = re.compile(r"\bINTO\s+(\w+)|\bUPDATE\s+(\w+)", re.IGNORECASE)
+
+Batch = List[Tuple[str, List[tuple]]]  # (sql, rows) runs in submit order
+
+def _table_of(sql: str) -> str:
+    m = _TABLE_RE.search(sql)
+    return (m.group(1) or m.group(2)) if m else "unknown"
+
+def append_run(batch: Batch, sql: str, rows: List[tuple]):
+    """Add rows to the batch, extending the last run when it has the same statement"""
+    if batch and batch[-1][0] == sql:
+        batch[-1][1].extend(rows)
+    else:
+        batch.append((sql, list(rows)))
+
+def apply_rows(conn, batch: Batch, extra: Optional[tuple] = None) -> int:
+    """Execute runs of rows in order (plus an optional trailing statement) in one transaction.
+
+    One bad row must not poison the batch: on an integrity error the rows are retried
+    one by one and rejects are skipped. Returns the number of rejected rows.
+    """
+    c = conn.cursor()
+    rejected = 0
+    try:
+        for sql, rows in batch:
+            c.executemany(sql, rows)
+        if extra:
+            c.execute(*extra)
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        for sql, rows in batch:
+            for row in rows:
+                try:
+                    c.execute(sql, row)
+                except sqlite3.IntegrityError as e:
+                    rejected += 1
+                    registry.inc("writer_rejected_rows_total", table=_table_of(sql))
+                    logger.warning(f"Batched writer rejected row for {_table_of(sql)}: {e}")
+        if extra:
+            c.execute(*extra)
+        conn.commit()
+    return rejected
+
+class BatchedWriter:
+    def __init__(self, db, batch_size: int = 500, flush_interval: float = 1.0, retry_delay: float = 5.0,
+                 spool: Optional[SegmentedSpool] = None, replay_batch: int = 5000, sink=None):
+        self.db = db
+        self.sink = sink  # remote sink with load_cursor()/send(); None writes to db
+        self.spool = spool
+        self.spool_name = f"{socket.gethostname()}:{os.path.abspath(spool.directory)}" if spool else None
+        self.epoch = spool.epoch if spool else secrets.token_hex(8)  # names the seq numbering sent to the sink
+        self.replay_batch = replay_batch
+        self._spool_synced = False
+        self._seq: Optional[tuple] = None  # last batch number sent to the sink without a spool
+        self._resend: Optional[tuple] = None  # (batch, seq) the sink has not acknowledged
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._pending: Batch = []
+        self._depth = 0
+        self._inflight = 0
+        self._flush_now = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit = False
+        if spool is not None:
+            self._depth = spool.pending  # rows left over from a previous run
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, daemon=True, name="batched-writer")
+            self._thread.start()
+            if not self._atexit:
+                atexit.register(self.stop)
+                self._atexit = True
+
+    def submit(self, sql: str, params: tuple):
+        """Queue one row; never blocks on the database"""
+        if self._thread is None:
+            self.start()
+        if self.spool is not None:
+            self.spool.append(msgpack.packb([sql, list(params)], default=encode_default))
+        with self._cond:
+            if self.spool is None:
+                append_run(self._pending, sql, [params])
+            self._depth += 1
+            if self._depth >= self.batch_size:
+                self._cond.notify_all()
+        registry.set("writer_queue_depth", self._depth)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Block until everything queued so far is written; False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_now = True
+            self._cond.notify_all()
+            while self._depth or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 30.0):
+        """Drain the queue and stop the background thread"""
+        if not self._thread:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while self._depth < self.batch_size and not (self._flush_now or self._stopping):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping and not self._depth and self._resend is None:
+                    return
+                seq = None
+                if self.spool is not None:
+                    self._flush_now = False
+                elif self._resend is not None:
+                    batch, seq = self._resend
+                    self._flush_now = False
+                else:
+                    batch, self._pending = self._pending, []
+                    self._inflight, self._depth = self._depth, 0
+                    self._flush_now = False
+
+            if self.spool is not None:
+                ok = self._replay()
+                with self._cond:
+                    self._depth = self.spool.pending
+                    registry.set("writer_queue_depth", self._depth)
+                    self._cond.notify_all()
+                if not ok:
+                    time.sleep(self.retry_delay)
+                continue
+
+            if not batch:
+                ok = True
+            elif self.sink is not None:
+                seq = seq or self._next_seq()
+                ok = self._send(batch, seq)
+            else:
+                ok = self._write(batch)
+
+            with self._cond:
+                if not ok and seq is not None:
+                    # The backend may have applied it; resend it as is under the same seq
+                    self._resend = (batch, seq)
+                else:
+                    if not ok:
+                        # Put the batch back in front of anything queued meanwhile
+                        for sql, rows in self._pending:
+                            append_run(batch, sql, rows)
+                        self._pending = batch
+                        self._depth += self._inflight
+                    self._resend = None
+                    self._inflight = 0
+                registry.set("writer_queue_depth", self._depth)
+                self._cond.notify_all()
+            if not ok:
+                time.sleep(self.retry_delay)
+
+    def _replay(self) -> bool:
+        """Apply the next spooled batch; True when the spool is drained or progress was made"""
+        spool = self.spool
+        spool.report()
+        try:
+            if not self._spool_synced:
+                # Resume after whatever an earlier run already committed
+                if self.sink is not None:
+                    row = self.sink.load_cursor(self.epoch)
+                else:
+                    with self.db.transaction() as conn:
+                        c = conn.cursor()
+                        c.execute("SELECT segment, offset FROM spool_cursor WHERE name=?", (self.spool_name,))
+                        row = c.fetchone()
+                if row:
+                    spool.seek((row[0], row[1]))
+                self._spool_synced = True
+        except Exception as e:
+            registry.inc("writer_flush_errors_total")
+            logger.error(f"Batched writer spool cursor error: {e}")
+            return False
+
+        records, end = spool.read(self.replay_batch)
+        if not records:
+            spool.sync()
+            return True
+
+        batch: Batch = []
+        for payload in records:
+            sql, params = msgpack.unpackb(payload)
+            append_run(batch, sql, [tuple(params)])
+        if self.sink is not None:
+            if not self._send(batch, end):
+                return False
+            spool.commit(end, len(records))
+            return True
+
+        cursor_row = ("""INSERT INTO spool_cursor (name, segment, offset) VALUES (?,?,?)
+                         ON CONFLICT(name) DO UPDATE SET segment=excluded.segment, offset=excluded.offset,
+                         updated_at=CURRENT_TIMESTAMP""", (self.spool_name, end[0], end[1]))
+        if not self._write(batch, cursor_row):
+            return False
+        spool.commit(end, len(records))
+        return True
+
+    def _next_seq(self) -> tuple:
+        """Number of the next batch sent without a spool; each writer's epoch counts from 1"""
+        self._seq = (0, self._seq[1] + 1 if self._seq else 1)
+        return self._seq
+
+    def _send(self, batch: Batch, seq) -> bool:
+        t0 = time.perf_counter()
+        try:
+            self.sink.send(batch, seq, self.epoch)
+        except Exception as e:
+            registry.inc("writer_flush_errors_total")
+            logger.error(f"Batched writer ingest error: {e}")
+            return False
+
+        registry.observe("writer_flush_seconds", time.perf_counter() - t0)
+        for sql, rows in batch:
+            registry.inc("writer_rows_written_total", len(rows), table=_table_of(sql))
+        return True
+
+    def _write(self, batch: Batch, cursor_row: Optional[tuple] = None) -> bool:
+        t0 = time.perf_counter()
+        try:
+            with self.db.transaction() as conn:
+                apply_rows(conn, batch, cursor_row)
+        except Exception as e:
+            registry.inc("writer_flush_errors_total")
+            logger.error(f"Batched writer flush error: {e}")
+            return False
+
+        registry.observe("writer_flush_seconds", time.perf_counter() - t0)
+        for sql, rows in batch:
+            registry.inc("writer_rows_written_total", len(rows), table=_table_of(sql))
+        return True
+
+_spool_dir = os.getenv("WRITER_SPOOL_DIR", "")
+_ingest_url = os.getenv("INGEST_URL", "")
+
+writer = BatchedWriter(
+    default_db,
+    batch_size=int(os.getenv("WRITER_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("WRITER_FLUSH_INTERVAL", "1.0")),
+    spool=SegmentedSpool(_spool_dir, int(os.getenv("WRITER_SPOOL_SEGMENT_MB", "16")) << 20) if _spool_dir else None,
+    replay_batch=int(os.getenv("WRITER_REPLAY_BATCH", "5000")),
+    sink=IngestSink(_ingest_url, int(os.getenv("CAMERA_ID", "0")), os.getenv("INGEST_TOKEN", "")) if _ingest_url else None,
+)
@@ -1,5 +1,7 @@
 
 import sqlite3, threading, os
+from ..core.histogram import merge_blobs
+from ..core import heatmap, zone_flows
 
 DB_PATH = os.getenv("DB_PATH", "wink_store.db")
 
@@ -11,6 +13,9 @@ class _Conn:
     def __enter__(self):
         self.lock.acquire()
         self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.conn.create_function("hist_merge", 2, merge_blobs, deterministic=True)
+        self.conn.create_function("heatmap_merge", 2, heatmap.merge_blobs, deterministic=True)
+        self.conn.create_function("zone_flow_merge", 2, zone_flows.merge_blobs, deterministic=True)
         return self.conn
     def __exit__(self, *args):
         try: self.conn.close()
@@ -47,30 +52,66 @@ def migrate_all():
             created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
         c.execute("CREATE INDEX IF NOT EXISTS idx_zones_store_cam ON zones(store_id, camera_id)")
         
+        # Store floor plan and per-camera homographies with their pixel -> floor cell tables
+        c.execute("""CREATE TABLE IF NOT EXISTS floor_plans (
+            store_id TEXT PRIMARY KEY, file_path TEXT, width REAL NOT NULL, height REAL NOT NULL,
+            cell_size REAL NOT NULL, created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS camera_calibrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            homography_json TEXT NOT NULL, points_json TEXT NOT NULL, img_width INTEGER NOT NULL,
+            img_height INTEGER NOT NULL, rms_error REAL, lut BLOB, lut_rows INTEGER, lut_cols INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP, UNIQUE(store_id, camera_id))""")
+        
         # Enhanced tracking tables
         c.execute("""CREATE TABLE IF NOT EXISTS track_sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
             track_id INTEGER NOT NULL, entry_time TEXT NOT NULL, exit_time TEXT,
             total_dwell REAL DEFAULT 0, zones_visited TEXT, queue_events TEXT,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        # Simplified trajectory (core/trajectory.py) and its point count
+        _ensure_columns(c, "track_sessions", {"path": "BLOB", "path_points": "INTEGER DEFAULT 0"})
+        # Store-level identity across cameras, assigned by re-identification (core/reid.py)
+        _ensure_columns(c, "track_sessions", {"person_uuid": "TEXT"})
         c.execute("CREATE INDEX IF NOT EXISTS idx_track_sessions_store_time ON track_sessions(store_id, entry_time)")
+        c.execute("""CREATE TABLE IF NOT EXISTS track_embeddings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            track_id INTEGER NOT NULL, entry_time TEXT NOT NULL, entry_ts REAL NOT NULL, exit_ts REAL NOT NULL,
+            samples INTEGER DEFAULT 1, embedding BLOB NOT NULL, person_uuid TEXT)""")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_track_embeddings_store_exit ON track_embeddings(store_id, exit_ts)")
         
         # Zone events with enhanced metadata
         c.execute("""CREATE TABLE IF NOT EXISTS zone_events (
             id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
-            zone_id TEXT, event_type TEXT NOT NULL, value REAL, person_id TEXT, 
+            zone_id TEXT, event_type TEXT NOT NULL, value REAL, person_id INTEGER,
             ts TEXT NOT NULL, metadata TEXT,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
         c.execute("CREATE INDEX IF NOT EXISTS idx_zone_events_store_ts ON zone_events(store_id, ts)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_zone_events_person ON zone_events(person_id)")
+        _ensure_columns(c, "zone_events", {"person_uuid": "TEXT"})  # set by the re-ID matcher
+        
+        # Zone presence as run-length intervals: one row per (track, zone) stay,
+        # opened on enter, checkpointed during long stays and closed on exit
+        c.execute("""CREATE TABLE IF NOT EXISTS zone_presence (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            zone_id TEXT NOT NULL, person_id INTEGER NOT NULL, start_ts TEXT NOT NULL, end_ts TEXT NOT NULL,
+            samples INTEGER DEFAULT 1, closed INTEGER DEFAULT 0,
+            UNIQUE(store_id, camera_id, zone_id, person_id, start_ts))""")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_zone_presence_store_cam_start ON zone_presence(store_id, camera_id, start_ts)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_zone_presence_person ON zone_presence(person_id)")
+        _ensure_columns(c, "zone_presence", {"person_uuid": "TEXT"})
         
         # Daily unique visitors tracking
         c.execute("""CREATE TABLE IF NOT EXISTS unique_daily (
             id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
-            ymd TEXT NOT NULL, person_id TEXT NOT NULL, first_seen TEXT, last_seen TEXT,
+            ymd TEXT NOT NULL, person_id INTEGER NOT NULL, first_seen TEXT, last_seen TEXT,
             total_visits INTEGER DEFAULT 1, total_dwell REAL DEFAULT 0,
             UNIQUE(store_id,camera_id,ymd,person_id))""")
         c.execute("CREATE INDEX IF NOT EXISTS idx_unique_daily_store_date ON unique_daily(store_id, ymd)")
+        # Daily HyperLogLog registers copied from Redis (camera/unique_hll.py); camera 0 = store-wide
+        c.execute("""CREATE TABLE IF NOT EXISTS unique_hll (
+            store_id TEXT NOT NULL, camera_id INTEGER NOT NULL, ymd TEXT NOT NULL,
+            registers BLOB NOT NULL, approx_count INTEGER DEFAULT 0, updated_at TEXT,
+            PRIMARY KEY(store_id, camera_id, ymd))""")
         
         # Enhanced hourly metrics
         c.execute("""CREATE TABLE IF NOT EXISTS hourly_metrics (
@@ -80,8 +121,50 @@ def migrate_all():
             interactions INTEGER DEFAULT 0, entrance_count INTEGER DEFAULT 0, exit_count INTEGER DEFAULT 0,
             zones_json TEXT, metadata_json TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             UNIQUE(store_id, camera_id, hour_start))""")
+        # Sums behind the averages so partial-hour upserts can be merged additively
+        _ensure_columns(c, "hourly_metrics", {
+            "dwell_sum": "REAL DEFAULT 0", "dwell_count": "INTEGER DEFAULT 0",
+            "queue_wait_sum": "REAL DEFAULT 0", "queue_wait_count": "INTEGER DEFAULT 0"})
         c.execute("CREATE INDEX IF NOT EXISTS idx_hourly_store_hour ON hourly_metrics(store_id, hour_start)")
         
+        # Mergeable dwell / queue-wait histograms per hour, camera and zone ('' = whole camera)
+        c.execute("""CREATE TABLE IF NOT EXISTS duration_histograms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            hour_start TEXT NOT NULL, zone_id TEXT NOT NULL DEFAULT '', metric TEXT NOT NULL,
+            samples INTEGER DEFAULT 0, hist BLOB,
+            UNIQUE(store_id, camera_id, hour_start, zone_id, metric))""")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_duration_hist_metric_hour ON duration_histograms(store_id, metric, hour_start)")
+        
+        # Hourly occupancy grids (person-seconds per cell, see core/heatmap.py)
+        c.execute("""CREATE TABLE IF NOT EXISTS heatmap_grids (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            hour_start TEXT NOT NULL, seconds REAL DEFAULT 0, grid BLOB,
+            UNIQUE(store_id, camera_id, hour_start))""")
+        
+        # Hourly person-seconds per floor-plan cell per calibrated camera (core/floor_plan.py)
+        c.execute("""CREATE TABLE IF NOT EXISTS floor_heatmap_grids (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            hour_start TEXT NOT NULL, seconds REAL DEFAULT 0, grid BLOB,
+            UNIQUE(store_id, camera_id, hour_start))""")
+        
+        # Hourly zone transition and co-visit counts per camera (core/zone_flows.py)
+        c.execute("""CREATE TABLE IF NOT EXISTS zone_flows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            hour_start TEXT NOT NULL, tracks INTEGER DEFAULT 0, flows BLOB,
+            UNIQUE(store_id, camera_id, hour_start))""")
+        
+        # Per-minute rollups per camera and zone ('' = whole camera) shipped by edge processors
+        c.execute("""CREATE TABLE IF NOT EXISTS minute_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, camera_id INTEGER NOT NULL,
+            minute_start TEXT NOT NULL, zone_id TEXT NOT NULL DEFAULT '',
+            entries INTEGER DEFAULT 0, exits INTEGER DEFAULT 0,
+            occupancy_samples INTEGER DEFAULT 0, occupancy_sum INTEGER DEFAULT 0, occupancy_max INTEGER DEFAULT 0,
+            interactions INTEGER DEFAULT 0, queue_joins INTEGER DEFAULT 0, queue_leaves INTEGER DEFAULT 0,
+            queue_wait_sum REAL DEFAULT 0, queue_wait_count INTEGER DEFAULT 0,
+            dwell_count INTEGER DEFAULT 0, dwell_sum REAL DEFAULT 0, dwell_hist BLOB,
+            UNIQUE(store_id, camera_id, minute_start, zone_id))""")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_minute_metrics_store_minute ON minute_metrics(store_id, minute_start)")
+        
         # Enhanced daily metrics
         c.execute("""CREATE TABLE IF NOT EXISTS daily_store_metrics (
             id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, date TEXT NOT NULL,
@@ -91,6 +174,8 @@ def migrate_all():
             conversion_rate REAL DEFAULT 0, avg_visit_duration REAL DEFAULT 0,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP, UNIQUE(store_id,date))""")
         c.execute("CREATE INDEX IF NOT EXISTS idx_daily_store_date ON daily_store_metrics(store_id, date)")
+        # Queue-wait percentile from the day's merged histograms
+        _ensure_columns(c, "daily_store_metrics", {"queue_wait_p95": "REAL DEFAULT 0"})
         
         # Promotion and festival tracking
         c.execute("""CREATE TABLE IF NOT EXISTS events (
@@ -108,6 +193,10 @@ def migrate_all():
             description TEXT, metadata_json TEXT,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
         c.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_store_time ON anomalies(store_id, detected_at)")
+        # Seasonal baselines of the processors' streaming detectors (msgpack of per-series arrays)
+        c.execute("""CREATE TABLE IF NOT EXISTS anomaly_state (
+            store_id TEXT NOT NULL, camera_id INTEGER NOT NULL, state BLOB NOT NULL, updated_at TEXT,
+            PRIMARY KEY (store_id, camera_id))""")
         
         # Real-time alerts
         c.execute("""CREATE TABLE IF NOT EXISTS alerts (
@@ -116,7 +205,120 @@ def migrate_all():
             message TEXT NOT NULL, resolved INTEGER DEFAULT 0,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP, resolved_at TEXT)""")
         c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_store_resolved ON alerts(store_id, resolved)")
+        # Alerts fired by processor rules: source and dedup key (rule, camera, zone and firing time)
+        _ensure_columns(c, "alerts", {"camera_id": "INTEGER", "zone_id": "TEXT", "rule_id": "INTEGER",
+                                      "value": "REAL", "dedup_key": "TEXT"})
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_dedup ON alerts(store_id, dedup_key)")
+        c.execute("""CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, store_id TEXT NOT NULL, name TEXT NOT NULL,
+            metric TEXT NOT NULL, camera_id INTEGER, zone_id TEXT, op TEXT NOT NULL DEFAULT '>',
+            threshold REAL NOT NULL, clear_threshold REAL, for_secs REAL DEFAULT 0, clear_secs REAL,
+            mode TEXT DEFAULT 'for', severity TEXT DEFAULT 'warning', enabled INTEGER DEFAULT 1,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
         
+        # Replay position of each processor's local write spool
+        c.execute("""CREATE TABLE IF NOT EXISTS spool_cursor (
+            name TEXT PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        
+        # Edge ingestion: per-camera credentials and last applied batch
+        c.execute("""CREATE TABLE IF NOT EXISTS camera_tokens (
+            camera_id INTEGER PRIMARY KEY, store_id TEXT NOT NULL, token_hash TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS ingest_cursor (
+            camera_id INTEGER PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        _ensure_columns(c, "ingest_cursor", {"epoch": "TEXT"})  # writer epoch the cursor belongs to
+        
+        # One-off data migrations applied to this database
+        c.execute("""CREATE TABLE IF NOT EXISTS legacy_migrations (
+            name TEXT PRIMARY KEY, applied_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        
+        conn.commit()
+    
+    _run_once("compact_presence_events", compact_presence_events)
+    _run_once("integer_person_ids", integer_person_ids)
+
+def _ensure_columns(c, table, columns):
+    """Add columns missing from an existing table"""
+    c.execute(f"PRAGMA table_info({table})")
+    existing = {r[1] for r in c.fetchall()}
+    for name, decl in columns.items():
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+def _run_once(name, fn):
+    """Run a data migration unless it is already recorded in legacy_migrations"""
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM legacy_migrations WHERE name=?", (name,))
+        if c.fetchone():
+            return
+    fn()
+    with db.transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO legacy_migrations (name) VALUES (?)", (name,))
+        conn.commit()
+
+def compact_presence_events(max_gap=10.0):
+    """Fold per-frame 'presence' rows of zone_events into zone_presence intervals.
+
+    Consecutive samples of the same (camera, zone, person) less than max_gap seconds
+    apart form one closed interval; the original rows are deleted afterwards.
+    """
+    from datetime import datetime
+    
+    sql = """INSERT OR IGNORE INTO zone_presence
+             (store_id,camera_id,zone_id,person_id,start_ts,end_ts,samples,closed) VALUES (?,?,?,?,?,?,?,1)"""
+    with db.transaction() as conn:
+        read = conn.cursor()
+        write = conn.cursor()
+        read.execute("""SELECT store_id, camera_id, zone_id, person_id, ts FROM zone_events
+                        WHERE event_type='presence' ORDER BY store_id, camera_id, zone_id, person_id, ts""")
+        run = None  # [key, start_ts, end_ts, end_dt, samples]
+        batch = []
+        for store_id, camera_id, zone_id, person_id, ts in read:
+            key = (store_id, camera_id, zone_id or "", person_id or "")
+            dt = datetime.fromisoformat(ts)
+            if run and run[0] == key and (dt - run[3]).total_seconds() <= max_gap:
+                run[2], run[3] = ts, dt
+                run[4] += 1
+                continue
+            if run:
+                batch.append((*run[0], run[1], run[2], run[4]))
+            run = [key, ts, ts, dt, 1]
+            if len(batch) >= 5000:
+                write.executemany(sql, batch)
+                batch = []
+        if run:
+            batch.append((*run[0], run[1], run[2], run[4]))
+        write.executemany(sql, batch)
+        write.execute("DELETE FROM zone_events WHERE event_type='presence'")
+        conn.commit()
+
+def integer_person_ids():
+    """Rebuild the tables keyed by person with an INTEGER person_id (64-bit track ids).
+
+    SQLite cannot change a column's type, so each table is copied into a new one with
+    the same definition and indexes; existing ids are numeric strings and cast over.
+    """
+    with db.transaction() as conn:
+        c = conn.cursor()
+        for table in ("zone_events", "zone_presence", "unique_daily"):
+            c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            create = c.fetchone()[0]
+            if "person_id TEXT" not in create:
+                continue
+            c.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,))
+            indexes = [r[0] for r in c.fetchall()]
+            c.execute(f"PRAGMA table_info({table})")
+            cols = [r[1] for r in c.fetchall()]
+            select = ",".join("CAST(person_id AS INTEGER)" if col == "person_id" else col for col in cols)
+            c.execute(create.replace(table, f"{table}_rebuild", 1).replace("person_id TEXT", "person_id INTEGER"))
+            c.execute(f"INSERT INTO {table}_rebuild ({','.join(cols)}) SELECT {select} FROM {table}")
+            c.execute(f"DROP TABLE {table}")
+            c.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+            for sql in indexes:
+                c.execute(sql)
         conn.commit()
 
 def set_local_store(store_id, store_name):
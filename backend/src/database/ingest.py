@@ -0,0 +1,114 @@
+"""
+Wire format and client for the edge ingestion API.
+
+A batch is a msgpack map {"epoch": str | None, "seq": [segment, offset] | None,
+"rows": [[kind, [params, ...]], ...]} compressed with zstd (when the zstandard
+package is installed) or gzip. Kinds are the statements in statements.INGEST_KINDS;
+runs are applied in order, as the processor submitted them. seq is the spool position
+after the last row of the batch, or without a spool a batch counter continuing after
+the camera's cursor. epoch names the sequence seq belongs to: it is stored with the
+spool, and is new for every process without one. The server records the last applied
+(epoch, seq) per camera and acknowledges repeats without applying them, so retries
+after a lost ack are applied once; a new epoch (a wiped spool, a restarted in-memory
+writer) resets the cursor instead of having its batches acknowledged as repeats.
+"""
+
+import gzip
+import zlib
+import logging
+from typing import List, Optional
+
+import msgpack
+
+from .statements import KIND_OF
+from ..core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # gzip only
+    zstandard = None
+
+def encode_default(obj):
+    """msgpack fallback for numpy scalars and anything else sqlite3 would have adapted"""
+    return obj.item() if hasattr(obj, "item") else str(obj)
+
+def encode_batch(rows: List[list], seq=None, encoding: str = "zstd", epoch: Optional[str] = None) -> bytes:
+    raw = msgpack.packb({"epoch": epoch, "seq": list(seq) if seq else None, "rows": rows}, default=encode_default)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    return gzip.compress(raw, compresslevel=6)
+
+def decode_batch(body: bytes, encoding: str, max_size: int) -> dict:
+    """Decompress (bounded by max_size) and unpack a batch"""
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd batches are not supported by this server")
+        raw = zstandard.ZstdDecompressor().decompress(body, max_output_size=max_size)
+    elif encoding == "gzip":
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        raw = d.decompress(body, max_size)
+        if d.unconsumed_tail:
+            raise ValueError("batch too large")
+    elif encoding in ("", "identity"):
+        raw = body
+    else:
+        raise ValueError(f"unsupported content encoding {encoding}")
+    if len(raw) > max_size:
+        raise ValueError("batch too large")
+    return msgpack.unpackb(raw)
+
+def cursor_status(cursor: Optional[tuple], epoch: Optional[str], seq) -> str:
+    """How the server treats a batch given the camera's (segment, offset, epoch) cursor:
+    "apply" it, "reset" the cursor to a new epoch and apply it, or acknowledge it without
+    applying as a "repeat" of the last batch or a "regressed" older one"""
+    if not cursor:
+        return "apply"
+    if cursor[2] != epoch:
+        return "reset"
+    if tuple(seq) == tuple(cursor[:2]):
+        return "repeat"
+    return "regressed" if tuple(seq) < tuple(cursor[:2]) else "apply"
+
+class IngestSink:
+    """Sends the batched writer's rows to the backend instead of a local database"""
+
+    def __init__(self, base_url: str, camera_id: int, token: str, timeout: float = 10.0):
+        import requests  # only needed on processors that upload
+        self.base_url = base_url.rstrip("/")
+        self.camera_id = camera_id
+        self.timeout = timeout
+        self.encoding = "zstd" if zstandard is not None else "gzip"
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}", "X-Camera-Id": str(camera_id)})
+
+    def load_cursor(self, epoch: Optional[str] = None) -> Optional[tuple]:
+        """Last position of this epoch the backend has applied for the camera"""
+        r = self.session.get(f"{self.base_url}/api/ingest/cursor", timeout=self.timeout)
+        r.raise_for_status()
+        cursor = r.json()
+        if not cursor.get("seq") or cursor.get("epoch") != epoch:
+            return None
+        return tuple(cursor["seq"])
+
+    def send(self, batch: List[tuple], seq=None, epoch: Optional[str] = None):
+        """POST one batch of (sql, rows) runs; raises unless the backend acknowledged it"""
+        rows: List[list] = []
+        for sql, params in batch:
+            kind = KIND_OF.get(sql)
+            if kind is None:
+                registry.inc("ingest_unsupported_rows_total", len(params))
+                logger.error(f"Ingest: no ingest kind for statement, dropping {len(params)} rows: {sql[:60]}")
+                continue
+            rows.append([kind, [list(p) for p in params]])
+
+        body = encode_batch(rows, seq, self.encoding, epoch)
+        r = self.session.post(f"{self.base_url}/api/ingest/batch", data=body, timeout=self.timeout,
+                              headers={"Content-Type": "application/x-msgpack", "Content-Encoding": self.encoding})
+        r.raise_for_status()
+        ack = r.json()
+        if seq and list(ack.get("ack") or []) != list(seq):
+            raise RuntimeError(f"unexpected ack {ack.get('ack')} for batch {list(seq)}")
+        registry.inc("ingest_batches_sent_total")
+        registry.inc("ingest_bytes_sent_total", len(body))
@@ -0,0 +1,217 @@
+"""
+Segmented, memory-mapped append log backing the batched writer during database outages.
+
+Each record is (payload length, crc32, wall-clock time) followed by the payload.
+Segments are preallocated, zero-filled files mapped with mmap, so an append is a
+memcpy and a zero length marks the end of a segment. On open, segments are scanned
+and a torn or corrupt tail (failed checksum) is discarded. Readers consume records
+from a cursor (segment, offset); commit() deletes segments that lie entirely before
+the cursor. Positions only grow while the spool's files exist; a spool created from
+scratch gets a new random epoch (kept in the directory's "epoch" file), so a consumer
+can tell its positions apart from an earlier spool's. Spool size, pending records and
+oldest pending record age go to core.metrics.
+"""
+
+import os
+import mmap
+import time
+import secrets
+import zlib
+import struct
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from ..core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RECORD = struct.Struct("<IId")  # payload length, crc32, timestamp
+Position = Tuple[int, int]  # (segment index, byte offset)
+
+class _Segment:
+    def __init__(self, path: str, index: int, size: int):
+        self.path = path
+        self.index = index
+        self.write_pos = 0
+        self.records = 0
+        create = not os.path.exists(path)
+        self.file = open(path, "r+b" if not create else "w+b")
+        if create or os.path.getsize(path) < size:
+            self.file.truncate(size)
+        self.size = os.path.getsize(path)
+        self.mm = mmap.mmap(self.file.fileno(), self.size)
+
+    def scan(self) -> int:
+        """Find the end of valid data; returns the number of discarded bytes"""
+        pos = 0
+        while pos + RECORD.size <= self.size:
+            length, crc, ts = RECORD.unpack_from(self.mm, pos)
+            end = pos + RECORD.size + length
+            if length == 0 or end > self.size:
+                break
+            if zlib.crc32(self.mm[pos + 8:end]) != crc:
+                break
+            pos = end
+            self.records += 1
+        self.write_pos = pos
+        tail = self.mm[pos:pos + RECORD.size]
+        return 0 if not any(tail) else self.size - pos
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+class SegmentedSpool:
+    def __init__(self, directory: str, segment_size: int = 16 << 20):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self.segments: List[_Segment] = []
+        self.cursor: Position = (0, 0)
+        self.pending = 0
+        os.makedirs(directory, exist_ok=True)
+
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".spool"):
+                continue
+            seg = _Segment(os.path.join(directory, name), int(name.split(".")[0]), segment_size)
+            discarded = seg.scan()
+            if discarded:
+                logger.warning(f"Spool segment {name}: discarded corrupt tail after byte {seg.write_pos}")
+                seg.mm[seg.write_pos:seg.size] = bytes(seg.size - seg.write_pos)
+            self.segments.append(seg)
+            self.pending += seg.records
+        if self.segments:
+            self.cursor = (self.segments[0].index, 0)
+        else:
+            self._roll(0)
+        self.epoch = self._load_epoch(fresh=self.segments[0].index == 0 and not self.segments[0].write_pos)
+        self.report()
+
+    def _load_epoch(self, fresh: bool) -> str:
+        """The epoch of this spool's positions; a new one when they restart from (0, 0)"""
+        path = os.path.join(self.directory, "epoch")
+        if not fresh and os.path.exists(path):
+            with open(path) as f:
+                epoch = f.read().strip()
+            if epoch:
+                return epoch
+        epoch = secrets.token_hex(8)
+        with open(path + ".tmp", "w") as f:
+            f.write(epoch)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return epoch
+
+    def _roll(self, index: int, min_size: int = 0):
+        path = os.path.join(self.directory, f"{index:010d}.spool")
+        seg = _Segment(path, index, max(self.segment_size, min_size))
+        self.segments.append(seg)
+        return seg
+
+    def append(self, payload: bytes, ts: Optional[float] = None):
+        """Append one record; only touches memory (the OS writes the pages back)"""
+        ts = time.time() if ts is None else ts
+        header = RECORD.pack(len(payload), 0, ts)
+        crc = zlib.crc32(header[8:] + payload)
+        need = RECORD.size + len(payload)
+        with self._lock:
+            seg = self.segments[-1]
+            if seg.write_pos + need > seg.size:
+                seg.mm.flush()
+                seg = self._roll(seg.index + 1, need)
+            pos = seg.write_pos
+            seg.mm[pos:pos + RECORD.size] = RECORD.pack(len(payload), crc, ts)
+            seg.mm[pos + RECORD.size:pos + need] = payload
+            seg.write_pos += need
+            seg.records += 1
+            self.pending += 1
+
+    def _records_from(self, pos: Position):
+        """Yield (next position, ts, payload) from pos to the current end"""
+        for seg in self.segments:
+            if seg.index < pos[0]:
+                continue
+            offset = pos[1] if seg.index == pos[0] else 0
+            while offset < seg.write_pos:
+                length, crc, ts = RECORD.unpack_from(seg.mm, offset)
+                end = offset + RECORD.size + length
+                yield (seg.index, end), ts, bytes(seg.mm[offset + RECORD.size:end])
+                offset = end
+
+    def read(self, max_records: int) -> Tuple[List[bytes], Position]:
+        """Up to max_records payloads after the cursor and the position after the last one"""
+        out = []
+        end = self.cursor
+        with self._lock:
+            for end, ts, payload in self._records_from(self.cursor):
+                out.append(payload)
+                if len(out) >= max_records:
+                    break
+        return out, end
+
+    def seek(self, pos: Position):
+        """Move the cursor forward to a position committed elsewhere (e.g. recorded in the database)"""
+        with self._lock:
+            if pos <= self.cursor:
+                return
+            skipped = 0
+            for nxt, ts, payload in self._records_from(self.cursor):
+                if nxt > pos:
+                    break
+                skipped += 1
+            self.pending -= skipped
+        self.commit(pos, 0)
+
+    def commit(self, pos: Position, records: Optional[int] = None):
+        """Advance the cursor past replayed records and delete fully replayed segments"""
+        with self._lock:
+            if records is None:
+                records = sum(1 for nxt, ts, payload in self._records_from(self.cursor) if nxt <= pos)
+            self.cursor = max(self.cursor, pos)
+            self.pending -= records
+            while len(self.segments) > 1:
+                seg = self.segments[0]
+                if seg.index > self.cursor[0] or (seg.index == self.cursor[0] and self.cursor[1] < seg.write_pos):
+                    break
+                self.segments.pop(0)
+                seg.close()
+                os.remove(seg.path)
+                if self.cursor[0] <= seg.index:
+                    self.cursor = (self.segments[0].index, 0)
+        self.report()
+
+    def sync(self):
+        """Flush mapped pages to disk"""
+        with self._lock:
+            for seg in self.segments:
+                seg.mm.flush()
+
+    def oldest_age(self, now: Optional[float] = None) -> float:
+        with self._lock:
+            for nxt, ts, payload in self._records_from(self.cursor):
+                return max(0.0, (time.time() if now is None else now) - ts)
+        return 0.0
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            used = sum(seg.write_pos for seg in self.segments)
+            if self.segments and self.segments[0].index == self.cursor[0]:
+                used -= self.cursor[1]
+            return used
+
+    def report(self):
+        """Publish spool gauges"""
+        registry.set("spool_pending_records", self.pending)
+        registry.set("spool_bytes", self.size_bytes())
+        registry.set("spool_segments", len(self.segments))
+        registry.set("spool_oldest_record_age_seconds", self.oldest_age())
+
+    def close(self):
+        with self._lock:
+            for seg in self.segments:
+                seg.mm.flush()
+                seg.close()
+            self.segments = []
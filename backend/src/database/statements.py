@@ -0,0 +1,124 @@
+"""
+Write statements used by camera processors.
+
+Shared by the processor (local writes) and the ingestion API, which only executes
+statements listed in INGEST_KINDS and always substitutes the authenticated store
+and camera into the parameter positions recorded there.
+"""
+
+TRACK_SESSION_INSERT = """INSERT INTO track_sessions
+    (store_id, camera_id, track_id, entry_time, exit_time, total_dwell,
+     zones_visited, queue_events, created_at, path, path_points)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?)"""
+
+# Appearance embedding of a finished track (ENABLE_REID); person_uuid is filled in by the backend
+TRACK_EMBEDDING_INSERT = """INSERT INTO track_embeddings
+    (store_id, camera_id, track_id, entry_time, entry_ts, exit_ts, samples, embedding)
+    VALUES (?,?,?,?,?,?,?,?)"""
+
+ZONE_EVENT_INSERT = """INSERT INTO zone_events (store_id,camera_id,zone_id,event_type,value,person_id,ts)
+    VALUES (?,?,?,?,?,?,?)"""
+
+ZONE_PRESENCE_UPSERT = """INSERT INTO zone_presence (store_id,camera_id,zone_id,person_id,start_ts,end_ts,samples,closed)
+    VALUES (?,?,?,?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,zone_id,person_id,start_ts) DO UPDATE SET
+    end_ts=excluded.end_ts, samples=excluded.samples, closed=excluded.closed"""
+
+# Counters and sums are deltas, so repeated partial-hour flushes accumulate
+HOURLY_METRICS_UPSERT = """INSERT INTO hourly_metrics (store_id,camera_id,hour_start,footfall,unique_visitors,dwell_avg,dwell_p95,queue_wait_avg,
+                                interactions,entrance_count,exit_count,zones_json,dwell_sum,dwell_count,queue_wait_sum,queue_wait_count)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,hour_start) DO UPDATE SET
+    footfall=footfall+excluded.footfall, unique_visitors=unique_visitors+excluded.unique_visitors,
+    interactions=interactions+excluded.interactions, entrance_count=entrance_count+excluded.entrance_count,
+    exit_count=exit_count+excluded.exit_count,
+    dwell_sum=dwell_sum+excluded.dwell_sum, dwell_count=dwell_count+excluded.dwell_count,
+    dwell_avg=CASE WHEN dwell_count+excluded.dwell_count>0
+                   THEN (dwell_sum+excluded.dwell_sum)/(dwell_count+excluded.dwell_count) ELSE 0 END,
+    dwell_p95=CASE WHEN excluded.dwell_count>0 THEN excluded.dwell_p95 ELSE dwell_p95 END,
+    queue_wait_sum=queue_wait_sum+excluded.queue_wait_sum, queue_wait_count=queue_wait_count+excluded.queue_wait_count,
+    queue_wait_avg=CASE WHEN queue_wait_count+excluded.queue_wait_count>0
+                        THEN (queue_wait_sum+excluded.queue_wait_sum)/(queue_wait_count+excluded.queue_wait_count) ELSE 0 END,
+    zones_json=(SELECT json_group_object(key, n) FROM
+                  (SELECT key, SUM(value) n FROM
+                     (SELECT key, value FROM json_each(COALESCE(hourly_metrics.zones_json,'{}'))
+                      UNION ALL SELECT key, value FROM json_each(excluded.zones_json))
+                   GROUP BY key))"""
+
+DURATION_HISTOGRAM_UPSERT = """INSERT INTO duration_histograms (store_id,camera_id,hour_start,zone_id,metric,samples,hist)
+    VALUES (?,?,?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,hour_start,zone_id,metric) DO UPDATE SET
+    samples=samples+excluded.samples, hist=hist_merge(hist,excluded.hist)"""
+
+HEATMAP_GRID_UPSERT = """INSERT INTO heatmap_grids (store_id,camera_id,hour_start,seconds,grid)
+    VALUES (?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,hour_start) DO UPDATE SET
+    seconds=seconds+excluded.seconds, grid=heatmap_merge(grid,excluded.grid)"""
+
+# Same columns and merge as heatmap_grids, with one cell per floor-plan cell
+FLOOR_HEATMAP_UPSERT = """INSERT INTO floor_heatmap_grids (store_id,camera_id,hour_start,seconds,grid)
+    VALUES (?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,hour_start) DO UPDATE SET
+    seconds=seconds+excluded.seconds, grid=heatmap_merge(grid,excluded.grid)"""
+
+ZONE_FLOW_UPSERT = """INSERT INTO zone_flows (store_id,camera_id,hour_start,tracks,flows)
+    VALUES (?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,hour_start) DO UPDATE SET
+    tracks=tracks+excluded.tracks, flows=zone_flow_merge(flows,excluded.flows)"""
+
+MINUTE_METRICS_UPSERT = """INSERT INTO minute_metrics (store_id,camera_id,minute_start,zone_id,entries,exits,
+                                occupancy_samples,occupancy_sum,occupancy_max,interactions,queue_joins,queue_leaves,
+                                queue_wait_sum,queue_wait_count,dwell_count,dwell_sum,dwell_hist)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(store_id,camera_id,minute_start,zone_id) DO UPDATE SET
+    entries=entries+excluded.entries, exits=exits+excluded.exits,
+    occupancy_samples=occupancy_samples+excluded.occupancy_samples, occupancy_sum=occupancy_sum+excluded.occupancy_sum,
+    occupancy_max=MAX(occupancy_max,excluded.occupancy_max), interactions=interactions+excluded.interactions,
+    queue_joins=queue_joins+excluded.queue_joins, queue_leaves=queue_leaves+excluded.queue_leaves,
+    queue_wait_sum=queue_wait_sum+excluded.queue_wait_sum, queue_wait_count=queue_wait_count+excluded.queue_wait_count,
+    dwell_count=dwell_count+excluded.dwell_count, dwell_sum=dwell_sum+excluded.dwell_sum,
+    dwell_hist=CASE WHEN excluded.dwell_hist IS NULL THEN dwell_hist ELSE hist_merge(dwell_hist,excluded.dwell_hist) END"""
+
+UNIQUE_DAILY_INSERT = """INSERT OR IGNORE INTO unique_daily (store_id,camera_id,ymd,person_id,first_seen,last_seen,total_dwell)
+    VALUES (?,?,?,?,?,?,?)"""
+
+UNIQUE_DAILY_UPDATE = """UPDATE unique_daily SET last_seen=?, total_dwell=?
+    WHERE store_id=? AND camera_id=? AND ymd=? AND person_id=?"""
+
+# Alert rules (camera/alert_rules.py): one row per firing, keyed by its dedup key. Firing
+# and resolving share one statement, so the result does not depend on which of the two
+# lands first.
+ALERT_UPSERT = """INSERT INTO alerts (store_id,camera_id,rule_id,zone_id,alert_type,severity,message,value,
+    dedup_key,created_at,resolved,resolved_at)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(store_id,dedup_key) DO UPDATE SET
+    resolved=MAX(resolved, excluded.resolved), resolved_at=COALESCE(resolved_at, excluded.resolved_at)"""
+
+# Streaming anomaly detection (camera/anomaly_stream.py): same columns as SpikeDetector.log_anomaly
+ANOMALY_INSERT = """INSERT INTO anomalies (store_id,camera_id,anomaly_type,detected_at,severity,value,
+    baseline_value,threshold,description,metadata_json)
+    VALUES (?,?,?,?,?,?,?,?,?,?)"""
+
+ANOMALY_STATE_UPSERT = """INSERT INTO anomaly_state (store_id,camera_id,state,updated_at) VALUES (?,?,?,?)
+    ON CONFLICT(store_id,camera_id) DO UPDATE SET state=excluded.state, updated_at=excluded.updated_at"""
+
+# kind -> (statement, index of the store_id parameter, index of the camera_id parameter)
+INGEST_KINDS = {
+    "track_sessions": (TRACK_SESSION_INSERT, 0, 1),
+    "track_embeddings": (TRACK_EMBEDDING_INSERT, 0, 1),
+    "zone_events": (ZONE_EVENT_INSERT, 0, 1),
+    "zone_presence": (ZONE_PRESENCE_UPSERT, 0, 1),
+    "hourly_metrics": (HOURLY_METRICS_UPSERT, 0, 1),
+    "duration_histograms": (DURATION_HISTOGRAM_UPSERT, 0, 1),
+    "minute_metrics": (MINUTE_METRICS_UPSERT, 0, 1),
+    "heatmap_grids": (HEATMAP_GRID_UPSERT, 0, 1),
+    "floor_heatmap_grids": (FLOOR_HEATMAP_UPSERT, 0, 1),
+    "zone_flows": (ZONE_FLOW_UPSERT, 0, 1),
+    "unique_daily_insert": (UNIQUE_DAILY_INSERT, 0, 1),
+    "unique_daily_update": (UNIQUE_DAILY_UPDATE, 2, 3),
+    "alerts": (ALERT_UPSERT, 0, 1),
+    "anomalies": (ANOMALY_INSERT, 0, 1),
+    "anomaly_state": (ANOMALY_STATE_UPSERT, 0, 1),
+}
+
+KIND_OF = {sql: kind for kind, (sql, _, _) in INGEST_KINDS.items()}
@@ -12,6 +12,7 @@ import logging
 import os
 from typing import Optional
 from src.camera.processor import run_camera
+from src.core.structured_log import configure_processor_logging
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +37,8 @@ class ProcessorWorker:
             
             camera_id = int(os.getenv("CAMERA_ID", "1"))
             rtsp_url = os.getenv("RTSP_URL", "")
+            # JSON lines through a background queue from here on (see core/structured_log.py)
+            configure_processor_logging(camera_id)
             
             if rtsp_url:
                 logger.info(f"Processing camera {camera_id} with URL: {rtsp_url}")
@@ -132,12 +132,14 @@ class CameraProcessorManager:
                 "--camera-id", camera_id
             ]
             
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=config_path.parent
-            )
+            # Output goes to a file: a PIPE nobody reads blocks the worker once it fills up
+            with open(config_path.parent / f"processor-{camera_id}.log", "ab") as log_file:
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    cwd=config_path.parent
+                )
             
             # Give it a moment to start
             await asyncio.sleep(1)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+# Tests import the backend as the `src` package, like `python -m src...` run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def store_db(tmp_path, monkeypatch):
+    """The shared db handle pointed at a fresh, migrated sqlite file"""
+    from src.database.db_manager import db, migrate_all
+    monkeypatch.setattr(db, "path", str(tmp_path / "store.db"))
+    monkeypatch.setenv("STORE_ID", "test_store")
+    migrate_all()
+    return db
@@ -0,0 +1,96 @@
+import pytest
+
+from src.camera.alert_rules import RuleEngine, WindowMean, dedup_key, parse_dedup_key
+from src.database.statements import ALERT_UPSERT
+
+def _add_rule(db, **kw):
+    row = {"store_id": "test_store", "name": "Long queue", "metric": "queue_length", "camera_id": 1,
+           "zone_id": "checkout", "op": ">", "threshold": 5, "clear_threshold": None,
+           "for_secs": 10, "clear_secs": None, "mode": "for"}
+    row.update(kw)
+    with db.transaction() as conn:
+        conn.execute(f"INSERT INTO alert_rules ({','.join(row)}) VALUES ({','.join('?' * len(row))})",
+                     tuple(row.values()))
+        conn.commit()
+
+class Rows:
+    """writer.submit stand-in that applies alert rows to the test database"""
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+    def __call__(self, sql, params):
+        assert sql == ALERT_UPSERT
+        self.rows.append(params)
+        with self.db.transaction() as conn:
+            conn.execute(sql, params)
+            conn.commit()
+    def alerts(self):
+        with self.db.transaction() as conn:
+            return conn.execute("SELECT dedup_key, resolved FROM alerts WHERE dedup_key IS NOT NULL").fetchall()
+
+def _feed(engine, values):
+    """One frame per second starting at t=1000"""
+    for i, v in enumerate(values):
+        engine.evaluate(1000.0 + i, {("queue_length", "checkout"): v})
+
+def test_fires_once_after_for_secs(store_db):
+    _add_rule(store_db)
+    rows = Rows(store_db)
+    engine = RuleEngine(1, rows)
+    _feed(engine, [6] * 9)
+    assert rows.rows == []
+    _feed(engine, [6] * 30)
+    assert [r[10] for r in rows.rows] == [0]
+    assert rows.alerts() == [(rows.rows[0][8], 0)]
+
+def test_a_dip_restarts_the_for_window(store_db):
+    _add_rule(store_db)
+    rows = Rows(store_db)
+    engine = RuleEngine(1, rows)
+    _feed(engine, [6] * 8 + [4] + [6] * 8)
+    assert rows.rows == []
+
+def test_hysteresis_and_clear_secs(store_db):
+    _add_rule(store_db, clear_threshold=3, for_secs=0, clear_secs=5)
+    rows = Rows(store_db)
+    engine = RuleEngine(1, rows)
+    _feed(engine, [6, 4, 4, 4, 4, 4, 4, 4])       # back under the threshold but above clear
+    assert [r[10] for r in rows.rows] == [0]
+    engine.evaluate(2000.0, {("queue_length", "checkout"): 2})
+    engine.evaluate(2004.0, {("queue_length", "checkout"): 2})
+    assert len(rows.rows) == 1
+    engine.evaluate(2005.0, {("queue_length", "checkout"): 2})
+    assert [r[10] for r in rows.rows] == [0, 1]
+    # Firing and resolving are one row under the same dedup key
+    assert rows.rows[0][8] == rows.rows[1][8]
+    assert rows.alerts() == [(rows.rows[0][8], 1)]
+
+def test_open_alert_is_picked_up_after_restart(store_db):
+    _add_rule(store_db, for_secs=0, clear_secs=0)
+    rows = Rows(store_db)
+    _feed(RuleEngine(1, rows), [6])
+    restarted = RuleEngine(1, rows)
+    _feed(restarted, [6, 6, 6])
+    assert len(rows.rows) == 1
+    _feed(restarted, [1])
+    assert [r[10] for r in rows.rows] == [0, 1]
+    assert rows.alerts() == [(rows.rows[0][8], 1)]
+
+def test_unzoned_rule_applies_per_zone(store_db):
+    _add_rule(store_db, zone_id=None, for_secs=0)
+    rows = Rows(store_db)
+    engine = RuleEngine(1, rows)
+    engine.evaluate(1000.0, {("queue_length", "a"): 9, ("queue_length", "b"): 1, ("occupancy", ""): 50})
+    assert [(r[3], r[10]) for r in rows.rows] == [("a", 0)]
+
+def test_window_mean_drops_old_buckets():
+    w = WindowMean(3)
+    assert w.add(10.2, 3) == 3
+    assert w.add(10.7, 5) == 4
+    assert w.add(12.0, 7) == 5
+    assert w.add(13.0, 1) == pytest.approx(4)   # second 10 left the window
+    assert w.add(20.0, 2) == 2                  # whole window stale
+
+def test_dedup_key_round_trip():
+    assert parse_dedup_key(dedup_key(7, 3, "queue:1", 1700000000.5)) == (7, "queue:1")
+    assert parse_dedup_key(dedup_key(7, 3, "", 1.0)) == (7, "")
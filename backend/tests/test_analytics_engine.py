@@ -0,0 +1,23 @@
+from src.analytics.analytics_engine import EnhancedAnalyticsEngine
+from src.core.histogram import LogHistogram
+from src.database.statements import DURATION_HISTOGRAM_UPSERT, HOURLY_METRICS_UPSERT
+
+def _hour(conn, cam, hour, waits):
+    conn.execute(HOURLY_METRICS_UPSERT, ("test_store", cam, hour, 10, 8, 0.0, 0.0, 0.0, 2, 10, 9, "{}",
+                                         0.0, 0, float(sum(waits)), len(waits)))
+    hist = LogHistogram()
+    for w in waits:
+        hist.add(w)
+    conn.execute(DURATION_HISTOGRAM_UPSERT, ("test_store", cam, hour, "", "queue_wait", hist.count, hist.to_bytes()))
+
+def test_daily_rollup_stores_queue_wait_p95_from_merged_histograms(store_db):
+    with store_db.transaction() as conn:
+        _hour(conn, 1, "2025-09-01T10:00:00", [10.0] * 90)
+        _hour(conn, 2, "2025-09-01T11:00:00", [300.0] * 10)
+        conn.commit()
+    out = EnhancedAnalyticsEngine().recompute_daily_store_metrics("2025-09-01")
+    assert out["queue_wait_avg"] == 39.0
+    assert 280 <= out["queue_wait_p95"] <= 320
+    with store_db.transaction() as conn:
+        (stored,) = conn.execute("SELECT queue_wait_p95 FROM daily_store_metrics WHERE date='2025-09-01'").fetchone()
+    assert stored == out["queue_wait_p95"]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from src.camera.anomaly_stream import SeasonalEwma, StreamingAnomalyDetector, hour_of_week
+from src.database.statements import ANOMALY_INSERT, ANOMALY_STATE_UPSERT
+
+START = datetime(2025, 9, 1, 10, 0, tzinfo=timezone.utc)  # a Monday
+
+class Submitted(list):
+    def __call__(self, sql, params):
+        self.append((sql, params))
+    def of(self, sql):
+        return [p for s, p in self if s == sql]
+
+def _run(det, entries_per_minute, start=START):
+    """Feed one camera-level footfall count per minute, then close the last minute"""
+    for i, n in enumerate(entries_per_minute):
+        det.roll(start + timedelta(minutes=i))
+        det.sample_occupancy("", 0)  # the pipeline samples every frame, so empty minutes are checked too
+        for _ in range(n):
+            det.add_entry("")
+    det.roll(start + timedelta(minutes=len(entries_per_minute)))
+
+def test_ewma_is_a_plain_average_until_one_over_alpha_samples():
+    s = SeasonalEwma()
+    values = [3.0, 5.0, 10.0, 2.0]
+    for v in values:
+        s.update(7, v, alpha=0.1)
+    assert s.mean[7] == pytest.approx(np.mean(values))
+    assert s.var[7] == pytest.approx(np.var(values))
+    assert s.n[7] == 4 and s.n[8] == 0
+    back = SeasonalEwma.from_bytes(s.to_bytes())
+    assert np.array_equal(back.mean, s.mean) and np.array_equal(back.var, s.var)
+
+def test_ewma_weights_recent_samples():
+    s = SeasonalEwma()
+    for _ in range(200):
+        s.update(0, 10.0, alpha=0.1)
+    for _ in range(30):
+        s.update(0, 20.0, alpha=0.1)
+    assert 19 < s.mean[0] < 20
+
+def test_spike_is_flagged_once_per_cooldown_and_clipped(store_db):
+    sub = Submitted()
+    det = StreamingAnomalyDetector(1, sub)
+    _run(det, [9, 11] * 20 + [60, 60])
+    rows = sub.of(ANOMALY_INSERT)
+    assert len(rows) == 1
+    assert rows[0][2] == "footfall_spike"
+    assert rows[0][3] == (START + timedelta(minutes=41)).isoformat()
+    # The spikes were folded in clipped to the threshold, so the baseline barely moved
+    assert det.series[("", "footfall")].mean[hour_of_week(START)] < 12
+
+def test_drop_is_flagged(store_db):
+    sub = Submitted()
+    det = StreamingAnomalyDetector(1, sub)
+    _run(det, [30, 32] * 20 + [0])
+    assert [p[2] for p in sub.of(ANOMALY_INSERT)] == ["footfall_drop"]
+
+def test_no_flags_before_min_samples(store_db):
+    sub = Submitted()
+    det = StreamingAnomalyDetector(1, sub)
+    _run(det, [10] * 5 + [100])
+    assert sub.of(ANOMALY_INSERT) == []
+
+def test_state_persists_and_loads(store_db):
+    sub = Submitted()
+    det = StreamingAnomalyDetector(1, sub)
+    _run(det, [10] * 10)
+    det.persist(START + timedelta(minutes=11))
+    params = sub.of(ANOMALY_STATE_UPSERT)[-1]  # rolls also persist every ANOMALY_PERSIST_SECS
+    with store_db.transaction() as conn:
+        conn.execute(ANOMALY_STATE_UPSERT, params)
+        conn.commit()
+    loaded = StreamingAnomalyDetector(1, Submitted())
+    slot = hour_of_week(START)
+    assert loaded.series[("", "footfall")].mean[slot] == pytest.approx(10.0)
+    assert loaded.series[("", "footfall")].n[slot] == 10
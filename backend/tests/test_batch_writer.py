@@ -0,0 +1,52 @@
+from src.database.batch_writer import BatchedWriter, append_run
+from src.database.statements import UNIQUE_DAILY_INSERT, UNIQUE_DAILY_UPDATE, ZONE_EVENT_INSERT
+
+def _writer(db, **kw):
+    return BatchedWriter(db, batch_size=1000, flush_interval=0.05, retry_delay=0.05, **kw)
+
+def _unique_daily(db):
+    with db.transaction() as conn:
+        return conn.execute("SELECT person_id, last_seen, total_dwell FROM unique_daily ORDER BY person_id").fetchall()
+
+def test_runs_merge_consecutive_rows_of_one_statement():
+    batch = []
+    append_run(batch, "A", [(1,)])
+    append_run(batch, "A", [(2,)])
+    append_run(batch, "B", [(3,)])
+    append_run(batch, "A", [(4,), (5,)])
+    assert batch == [("A", [(1,), (2,)]), ("B", [(3,)]), ("A", [(4,), (5,)])]
+
+def test_update_after_insert_in_the_same_batch_is_applied(store_db):
+    w = _writer(store_db)
+    w.submit(UNIQUE_DAILY_INSERT, ("test_store", 1, "2025-09-01", 9, "t0", "t0", 0.0))
+    assert w.flush(5)
+    # Grouped per statement, the UPDATE of 10 would run before its INSERT
+    w.submit(UNIQUE_DAILY_UPDATE, ("t1", 3.0, "test_store", 1, "2025-09-01", 9))
+    w.submit(UNIQUE_DAILY_INSERT, ("test_store", 1, "2025-09-01", 10, "t0", "t0", 0.0))
+    w.submit(UNIQUE_DAILY_UPDATE, ("t2", 5.0, "test_store", 1, "2025-09-01", 10))
+    assert w.flush(5)
+    w.stop()
+    assert _unique_daily(store_db) == [(9, "t1", 3.0), (10, "t2", 5.0)]
+
+def test_bad_rows_are_skipped_without_losing_the_batch(store_db):
+    w = _writer(store_db)
+    w.submit(ZONE_EVENT_INSERT, ("test_store", 1, "a", "enter", 1, 1, "2025-09-01T00:00:00"))
+    w.submit(ZONE_EVENT_INSERT, ("test_store", 1, "a", None, 1, 2, "2025-09-01T00:00:01"))  # NOT NULL
+    w.submit(ZONE_EVENT_INSERT, ("test_store", 1, "a", "exit", 1, 1, "2025-09-01T00:00:02"))
+    assert w.flush(5)
+    w.stop()
+    with store_db.transaction() as conn:
+        rows = conn.execute("SELECT event_type FROM zone_events ORDER BY ts").fetchall()
+    assert rows == [("enter",), ("exit",)]
+
+def test_spooled_rows_replay_in_order_once(store_db, tmp_path):
+    from src.database.spool import SegmentedSpool
+    w = _writer(store_db, spool=SegmentedSpool(str(tmp_path / "spool"), 1 << 16))
+    w.submit(UNIQUE_DAILY_UPDATE, ("t1", 3.0, "test_store", 1, "2025-09-01", 9))
+    w.submit(UNIQUE_DAILY_INSERT, ("test_store", 1, "2025-09-01", 10, "t0", "t0", 0.0))
+    w.submit(UNIQUE_DAILY_UPDATE, ("t2", 5.0, "test_store", 1, "2025-09-01", 10))
+    assert w.flush(5)
+    w.stop()
+    assert _unique_daily(store_db) == [(10, "t2", 5.0)]
+    with store_db.transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM spool_cursor").fetchone()[0] == 1
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from src.camera.detection_log import (DetectionLogWriter, iter_frames, list_days, log_path, read_log,
+                                      HEADER, RECORD, MAGIC, VERSION)
+
+DAY = 1756684800.0  # 2025-09-01T00:00:00Z
+BIG_ID = (1 << 62) + 5
+
+def test_frames_round_trip_including_empty_frames(tmp_path):
+    w = DetectionLogWriter(str(tmp_path), 7)
+    w.write_frame(DAY + 1.0, 640, 480, [(BIG_ID, 10.0, 20.0, 30.0, 60.0), (2, 1.0, 2.0, 3.0, 4.0)], [0.9, 0.8])
+    w.write_frame(DAY + 1.5, 640, 480, [], [])
+    w.write_frame(DAY + 2.0, 640, 480, [(2, 5.0, 6.0, 3.0, 4.0)], [0.7])
+    w.close()
+    frames = list(iter_frames(str(tmp_path), 7, "2025-09-01"))
+    assert [f[0] for f in frames] == [DAY + 1.0, DAY + 1.5, DAY + 2.0]
+    assert frames[0][3] == [(BIG_ID, 10.0, 20.0, 30.0, 60.0), (2, 1.0, 2.0, 3.0, 4.0)]
+    assert frames[1][1:] == (640, 480, [])
+    assert frames[2][3] == [(2, 5.0, 6.0, 3.0, 4.0)]
+
+def test_files_roll_on_day_and_frame_size(tmp_path):
+    w = DetectionLogWriter(str(tmp_path), 7)
+    w.write_frame(DAY - 1.0, 640, 480, [(1, 1.0, 1.0, 1.0, 1.0)], [1.0])
+    w.write_frame(DAY + 1.0, 640, 480, [(1, 1.0, 1.0, 1.0, 1.0)], [1.0])
+    w.write_frame(DAY + 2.0, 1280, 720, [(1, 2.0, 2.0, 1.0, 1.0)], [1.0])
+    w.write_frame(DAY + 3.0, 640, 480, [(1, 3.0, 3.0, 1.0, 1.0)], [1.0])
+    w.close()
+    assert list_days(str(tmp_path), 7) == ["2025-08-31", "2025-09-01"]
+    frames = list(iter_frames(str(tmp_path), 7, "2025-09-01"))
+    assert [(f[0] - DAY, f[1]) for f in frames] == [(1.0, 640), (2.0, 1280), (3.0, 640)]
+
+def test_partial_trailing_record_is_dropped_on_reopen(tmp_path):
+    w = DetectionLogWriter(str(tmp_path), 7)
+    w.write_frame(DAY + 1.0, 640, 480, [(1, 1.0, 1.0, 1.0, 1.0)], [1.0])
+    w.close()
+    path = log_path(str(tmp_path), 7, "2025-09-01", 640, 480)
+    with open(path, "ab") as fh:
+        fh.write(b"\x01\x02\x03")  # crash mid-record
+    w = DetectionLogWriter(str(tmp_path), 7)
+    w.write_frame(DAY + 2.0, 640, 480, [(1, 2.0, 2.0, 1.0, 1.0)], [1.0])
+    w.close()
+    assert os.path.getsize(path) == HEADER.size + 2 * RECORD.size
+    assert len(read_log(path)[3]) == 2
+
+def test_header_and_record_layout(tmp_path):
+    w = DetectionLogWriter(str(tmp_path), 7)
+    w.write_frame(DAY + 1.0, 640, 480, [(BIG_ID, 1.0, 2.0, 3.0, 4.0)], [0.5])
+    w.close()
+    path = log_path(str(tmp_path), 7, "2025-09-01", 640, 480)
+    with open(path, "rb") as fh:
+        assert HEADER.unpack(fh.read(HEADER.size)) == (MAGIC, VERSION, 640, 480, 7)
+        assert RECORD.unpack(fh.read())[:2] == (DAY + 1.0, BIG_ID)
+
+def test_unknown_files_are_rejected(tmp_path):
+    path = tmp_path / "bad.wdl"
+    path.write_bytes(HEADER.pack(MAGIC, VERSION + 1, 640, 480, 7))
+    with pytest.raises(ValueError):
+        read_log(str(path))
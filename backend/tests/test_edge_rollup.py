@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from src.camera.edge_rollup import MinuteRollup, LocalEventStore, minute_key
+from src.core.histogram import LogHistogram
+from src.database.statements import MINUTE_METRICS_UPSERT, ZONE_EVENT_INSERT
+
+T0 = datetime(2025, 9, 1, 10, 0, 30, tzinfo=timezone.utc)
+
+def _minute_rows(db):
+    with db.transaction() as conn:
+        return conn.execute("""SELECT minute_start, zone_id, entries, occupancy_samples, occupancy_sum,
+                                      occupancy_max, dwell_count, dwell_hist
+                               FROM minute_metrics ORDER BY minute_start, zone_id""").fetchall()
+
+def test_one_row_per_zone_and_minute(store_db):
+    rows = []
+    r = MinuteRollup(1, lambda sql, p: rows.append(p))
+    assert r.roll(T0)
+    r.add("", "entries")
+    r.add("shelf", "entries", 2)
+    for n in (0, 3, 1):
+        r.sample_occupancy("", n)
+    r.add_dwell("shelf", 12.0)
+    assert not r.roll(T0 + timedelta(seconds=20))
+    assert rows == []
+    assert r.roll(T0 + timedelta(seconds=40))
+    assert [(p[2], p[3]) for p in rows] == [("2025-09-01T10:00:00", ""), ("2025-09-01T10:00:00", "shelf")]
+    with store_db.transaction() as conn:
+        for p in rows + rows:  # a replayed minute adds up
+            conn.execute(MINUTE_METRICS_UPSERT, p)
+        conn.commit()
+    (cam, shelf) = _minute_rows(store_db)
+    assert cam[2:6] == (2, 6, 8, 3)
+    assert shelf[2] == 4 and shelf[6] == 2
+    assert LogHistogram.from_bytes(shelf[7]).count == 2
+
+def test_minute_key():
+    assert minute_key(T0) == "2025-09-01T10:00:00"
+
+def test_local_store_samples_whole_tracks_and_prunes(tmp_path):
+    upstream = []
+    store = LocalEventStore(1, path=str(tmp_path / "edge.db"), retention_hours=1, sample=0.5,
+                            upstream=lambda sql, p: upstream.append(p))
+    sampled = [pid for pid in range(200) if store.sampled(pid)]
+    assert 60 < len(sampled) < 140
+    assert sampled == [pid for pid in range(200) if store.sampled(pid)]
+    for pid in range(200):
+        for ev in ("enter", "exit"):
+            store.submit(ZONE_EVENT_INSERT, ("s", 1, "a", ev, 1, pid, T0.isoformat()), pid)
+    assert sorted({p[5] for p in upstream}) == sampled
+    assert len(upstream) == 2 * len(sampled)
+    store.flush(T0)
+    with store.db.transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM zone_events").fetchone()[0] == 400
+    store.flush(T0 + timedelta(hours=2))
+    with store.db.transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM zone_events").fetchone()[0] == 0
@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.analytics.heatmaps import floor_occupancy
+from src.core.floor_plan import (MAX_FLOOR_ZONES, FloorProjector, build_lut, decode_lut, encode_lut,
+                                 estimate_homography, project)
+from src.core.heatmap import HeatmapGrid
+from src.database.statements import FLOOR_HEATMAP_UPSERT
+
+# 640x480 screenshot of a 10 x 5 m floor, 1 px = 1/64 m, with a perspective tilt
+H_TRUE = np.array([[1 / 64, 0.002, 0.0], [0.0, 1 / 64, 0.0], [0.0, 0.0004, 1.0]])
+
+def _pairs(h):
+    img = np.array([[0, 0], [600, 10], [620, 460], [20, 470], [300, 240], [100, 300]], dtype=float)
+    floor, _ = project(h, img)
+    return img, floor
+
+def test_homography_recovers_projection():
+    img, floor = _pairs(H_TRUE)
+    h, rms = estimate_homography(img, floor)
+    assert rms < 1e-6
+    assert np.allclose(h, H_TRUE / H_TRUE[2, 2], atol=1e-8)
+
+def test_degenerate_calibration_is_rejected():
+    with pytest.raises(ValueError):
+        estimate_homography([[0, 0], [1, 1], [2, 2]], [[0, 0], [1, 1], [2, 2]])
+    with pytest.raises(ValueError):
+        estimate_homography([[0, 0], [1, 1], [2, 2], [3, 3]], [[0, 0], [1, 0], [0, 1], [1, 1]])
+
+def test_lut_and_blob_round_trip():
+    scale = np.diag([1 / 64, 1 / 64, 1.0])
+    lut = build_lut(scale, 640, 480, floor_w=10, floor_h=5, cell_size=1, step=32)
+    assert lut.shape == (15, 20)
+    assert lut[0, 0] == 0 and lut[0, 19] == 9
+    assert lut[9, 0] == 40
+    assert (lut[10:] == -1).all()  # below y = 320 px the floor ends
+    assert np.array_equal(decode_lut(encode_lut(lut), *lut.shape), lut)
+
+def test_floor_zones_fold_into_pixel_table(store_db):
+    scale = np.diag([1 / 64, 1 / 64, 1.0])
+    lut = build_lut(scale, 640, 320, floor_w=10, floor_h=5, cell_size=0.5, step=16)
+    with store_db.transaction() as conn:
+        conn.execute("INSERT INTO floor_plans (store_id, width, height, cell_size) VALUES (?,?,?,?)",
+                     ("test_store", 10, 5, 0.5))
+        conn.execute("""INSERT INTO camera_calibrations (store_id, camera_id, homography_json, points_json,
+                        lut, lut_rows, lut_cols, img_width, img_height) VALUES (?,?,?,?,?,?,?,?,?)""",
+                     ("test_store", 3, "[]", "[]", encode_lut(lut), *lut.shape, 640, 320))
+        conn.execute("INSERT INTO zones (store_id, camera_id, name, ztype, polygon_json) VALUES (?,?,?,?,?)",
+                     ("test_store", 0, "left", "shelf", json.dumps([[0, 0], [5, 0], [5, 5], [0, 5]])))
+        conn.execute("INSERT INTO zones (store_id, camera_id, name, ztype, polygon_json) VALUES (?,?,?,?,?)",
+                     ("test_store", 0, "front", "queue", json.dumps([[0, 0], [10, 0], [10, 1], [0, 1]])))
+        conn.commit()
+    fp = FloorProjector.load(3)
+    assert FloorProjector.load(4) is None
+    names = lambda x, y: [z["name"] for z in fp.zones_at(1280, 640, x, y)]
+    assert names(100, 20) == ["left", "front"]
+    assert names(100, 600) == ["left"]
+    assert names(1200, 20) == ["front"]
+    assert names(1200, 600) == []
+
+def test_cell_lookup_uses_the_table():
+    scale = np.diag([1 / 64, 1 / 64, 1.0])
+    lut = build_lut(scale, 640, 320, floor_w=10, floor_h=5, cell_size=1, step=16)
+    fp = FloorProjector(1, lut, 640, 320, cell_cols=10, cell_rows=5)
+    # Frame at twice the screenshot size: pixel (1280, 640) is floor (10, 5)
+    assert fp.cell(1280, 640, 10, 10) == 0
+    assert fp.cell(1280, 640, 1270, 630) == 49
+    assert fp.cells(1280, 640, [10, 300, 1270], [10, 300, 630]).tolist() == [0, 22, 49]
+
+def test_floor_zones_past_the_mask_width_are_logged(store_db, caplog):
+    scale = np.diag([1 / 64, 1 / 64, 1.0])
+    lut = build_lut(scale, 640, 320, floor_w=10, floor_h=5, cell_size=1, step=16)
+    square = json.dumps([[0, 0], [1, 0], [1, 1], [0, 1]])
+    with store_db.transaction() as conn:
+        conn.execute("INSERT INTO floor_plans (store_id, width, height, cell_size) VALUES (?,?,?,?)",
+                     ("test_store", 10, 5, 1))
+        conn.execute("""INSERT INTO camera_calibrations (store_id, camera_id, homography_json, points_json,
+                        lut, lut_rows, lut_cols, img_width, img_height) VALUES (?,?,?,?,?,?,?,?,?)""",
+                     ("test_store", 3, "[]", "[]", encode_lut(lut), *lut.shape, 640, 320))
+        conn.executemany("INSERT INTO zones (store_id, camera_id, name, ztype, polygon_json) VALUES (?,?,?,?,?)",
+                         [("test_store", 0, f"z{i}", "shelf", square) for i in range(MAX_FLOOR_ZONES + 2)])
+        conn.commit()
+    fp = FloorProjector.load(3)
+    assert len(fp.zones) == MAX_FLOOR_ZONES
+    assert (fp.cell_rows, fp.cell_cols) == (5, 10)
+    assert "65 floor zones" in caplog.text
+
+def test_overlapping_cameras_merge_by_cell(store_db):
+    a, b = HeatmapGrid(5, 10), HeatmapGrid(5, 10)
+    a.add_cells([0, 0, 1], 2.0)
+    b.add_cells([0, 49, -1], 3.0)  # camera 2 overlaps camera 1 on cell 0
+    with store_db.transaction() as conn:
+        conn.execute("INSERT INTO floor_plans (store_id, width, height, cell_size) VALUES (?,?,?,?)",
+                     ("test_store", 10, 5, 1))
+        for cam, grid in ((1, a), (2, b)):
+            conn.execute(FLOOR_HEATMAP_UPSERT, ("test_store", cam, "2025-09-01T10:00:00", grid.total, grid.to_bytes()))
+        conn.execute(FLOOR_HEATMAP_UPSERT, ("test_store", 1, "2025-09-01T11:00:00", a.total, a.to_bytes()))
+        conn.commit()
+    out = floor_occupancy("2025-09-01", "2025-09-01")
+    assert (out["rows"], out["cols"], out["cameras"]) == (5, 10, [1, 2])
+    assert out["seconds"][0][:2] == [8.0, 4.0]
+    assert out["seconds"][4][9] == 3.0
+    assert out["cameras_per_cell"][0][:2] == [2, 1]
@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.core.heatmap import HeatmapGrid, merge_blobs, sum_blobs
+from src.database.statements import HEATMAP_GRID_UPSERT
+
+def test_points_land_in_their_cells():
+    h = HeatmapGrid(rows=4, cols=8)
+    h.add_points([0, 639, 639, 320, 2000], [0, 479, 479, 240, -5], 640, 480, 0.5)
+    assert h.grid[0, 0] == 0.5
+    assert h.grid[3, 7] == 1.0
+    assert h.grid[2, 4] == 0.5
+    assert h.grid[0, 7] == 0.5      # off-frame points are clamped to the edge
+    assert h.total == 2.5
+    h.add_points([10], [10], 640, 480, 0)
+    assert h.total == 2.5
+
+def test_blobs_round_trip_and_add_up():
+    a, b = HeatmapGrid(), HeatmapGrid()
+    a.add_points([100, 200], [100, 100], 1280, 720, 1.0)
+    b.add_points([100], [100], 1280, 720, 2.0)
+    assert np.array_equal(HeatmapGrid.from_bytes(a.to_bytes()).grid, a.grid)
+    merged = HeatmapGrid.from_bytes(merge_blobs(a.to_bytes(), b.to_bytes()))
+    assert np.array_equal(merged.grid, a.grid + b.grid)
+    assert merge_blobs(None, a.to_bytes()) == a.to_bytes()
+    assert sum_blobs([a.to_bytes(), None, b.to_bytes()]).total == 4.0
+
+def test_hourly_upsert_merges_grids(store_db):
+    h = HeatmapGrid()
+    h.add_points([640], [360], 1280, 720, 1.5)
+    with store_db.transaction() as conn:
+        for _ in range(2):
+            conn.execute(HEATMAP_GRID_UPSERT, ("test_store", 1, "2025-09-01T10:00:00", h.total, h.to_bytes()))
+        conn.commit()
+        seconds, blob = conn.execute("SELECT seconds, grid FROM heatmap_grids").fetchone()
+    assert seconds == 3.0
+    assert HeatmapGrid.from_bytes(blob).total == 3.0
+
+def test_floor_cells_and_regridded_merges():
+    h = HeatmapGrid(rows=2, cols=3)
+    h.add_cells(np.array([0, 5, 5, -1, 6]), 0.5)
+    assert h.grid.tolist() == [[0.5, 0, 0], [0, 0, 1.0]]
+    regridded = HeatmapGrid(rows=4, cols=6)
+    regridded.add_cells([1], 1.0)
+    assert merge_blobs(h.to_bytes(), regridded.to_bytes()) == regridded.to_bytes()
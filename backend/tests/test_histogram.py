@@ -0,0 +1,51 @@
+import random
+
+from src.core.histogram import LogHistogram, GAMMA, merge_blobs, merge_all
+
+def _exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+def test_quantiles_within_relative_error():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    h = LogHistogram()
+    for v in values:
+        h.add(v)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = _exact_quantile(values, q)
+        assert abs(h.quantile(q) - exact) / exact <= GAMMA - 1
+    assert abs(h.mean - sum(values) / len(values)) < 1e-6
+
+def test_merge_equals_single_histogram():
+    rng = random.Random(2)
+    parts = [[rng.expovariate(1 / 60) for _ in range(300)] for _ in range(4)]
+    whole = LogHistogram()
+    for v in sum(parts, []):
+        whole.add(v)
+    merged = LogHistogram()
+    for part in parts:
+        h = LogHistogram()
+        for v in part:
+            h.add(v)
+        merged.merge(h)
+    assert merged.counts == whole.counts
+    assert merged.count == whole.count
+    assert merged.quantile(0.95) == whole.quantile(0.95)
+
+def test_bytes_round_trip_and_blob_merges():
+    a, b = LogHistogram(), LogHistogram()
+    for v in (0.01, 0.5, 3, 3, 120):
+        a.add(v)
+    b.add(7200, n=3)
+    back = LogHistogram.from_bytes(a.to_bytes())
+    assert back.counts == a.counts and back.count == a.count and back.sum == a.sum
+    merged = LogHistogram.from_bytes(merge_blobs(a.to_bytes(), b.to_bytes()))
+    assert merged.count == 8
+    assert merged.counts == merge_all([a.to_bytes(), None, b.to_bytes()]).counts
+    assert LogHistogram.from_bytes(merge_blobs(None, None)).count == 0
+
+def test_empty_histogram():
+    h = LogHistogram()
+    assert h.quantile(0.5) == 0.0 and h.mean == 0.0
+    assert h.summary()["count"] == 0
@@ -0,0 +1,88 @@
+import os
+import gzip
+
+import msgpack
+import pytest
+
+from src.database import ingest
+from src.database.batch_writer import BatchedWriter
+from src.database.spool import SegmentedSpool
+from src.database.statements import ZONE_EVENT_INSERT, HOURLY_METRICS_UPSERT
+
+ROWS = [["zone_events", [["s", 1, "a", "enter", 1, 2 ** 62, "2025-09-01T00:00:00"]]],
+        ["hourly_metrics", [["s", 1, "2025-09-01T00:00:00", 3, 2, 1.5, 2.0, 0.0, 0, 3, 0, "{}", 3.0, 2, 0.0, 0]]],
+        ["zone_events", [["s", 1, "a", "exit", 1, 2 ** 62, "2025-09-01T00:00:05"]]]]
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_batches_round_trip_in_order(encoding):
+    if encoding == "zstd" and ingest.zstandard is None:
+        pytest.skip("zstandard not installed")
+    body = ingest.encode_batch(ROWS, (3, 4096), encoding, "e1")
+    batch = ingest.decode_batch(body, encoding, 1 << 20)
+    assert batch == {"epoch": "e1", "seq": [3, 4096], "rows": ROWS}
+
+def test_oversized_batches_are_refused():
+    body = gzip.compress(msgpack.packb({"seq": None, "rows": [["zone_events", [["x" * 5000]]]]}))
+    with pytest.raises(ValueError):
+        ingest.decode_batch(body, "gzip", 1000)
+    with pytest.raises(ValueError):
+        ingest.decode_batch(body, "br", 1 << 20)
+
+def test_cursor_status_resets_on_a_new_epoch_and_flags_regressions():
+    assert ingest.cursor_status(None, "a", [0, 1]) == "apply"
+    assert ingest.cursor_status((0, 5, "a"), "a", [0, 6]) == "apply"
+    assert ingest.cursor_status((0, 5, "a"), "a", [0, 5]) == "repeat"
+    assert ingest.cursor_status((0, 5, "a"), "a", [0, 2]) == "regressed"
+    # A restarted in-memory writer or a wiped spool counts again from the start
+    assert ingest.cursor_status((0, 5, "a"), "b", [0, 1]) == "reset"
+    assert ingest.cursor_status((0, 5, None), "b", [0, 1]) == "reset"
+
+class FlakySink:
+    """Applies every batch it receives but loses the ack of the first one"""
+
+    def __init__(self, cursor=None, epoch=None):
+        self.cursor = cursor
+        self.epoch = epoch
+        self.received = []
+        self.lost = 1
+
+    def load_cursor(self, epoch=None):
+        return self.cursor if epoch == self.epoch else None
+
+    def send(self, batch, seq, epoch=None):
+        self.received.append(([(sql, list(rows)) for sql, rows in batch], seq, epoch))
+        if self.lost:
+            self.lost -= 1
+            raise ConnectionError("ack lost")
+
+def _row(n):
+    return ("s", 1, "a", "enter", 1, n, f"2025-09-01T00:00:{n:02d}")
+
+def test_memory_mode_batches_are_numbered_and_resent_unchanged():
+    sink = FlakySink(cursor=(0, 100), epoch="previous process")
+    w = BatchedWriter(None, batch_size=1000, flush_interval=0.02, retry_delay=0.05, sink=sink)
+    w.submit(ZONE_EVENT_INSERT, _row(1))
+    w.submit(HOURLY_METRICS_UPSERT, tuple(ROWS[1][1][0]))
+    assert w.flush(5)
+    w.submit(ZONE_EVENT_INSERT, _row(2))
+    assert w.flush(5)
+    w.stop()
+    (first, s1, e1), (retry, s2, e2), (second, s3, e3) = sink.received
+    assert retry == first and s1 == s2 == (0, 1)  # same rows, same seq: the backend applies it once
+    assert [sql for sql, _ in first] == [ZONE_EVENT_INSERT, HOURLY_METRICS_UPSERT]
+    assert second == [(ZONE_EVENT_INSERT, [_row(2)])] and s3 == (0, 2)
+    # A new process is a new epoch, so the backend resets the cursor instead of acking (0, 1) as a repeat
+    assert e1 == e2 == e3 == w.epoch != "previous process"
+    assert BatchedWriter(None, sink=sink).epoch != w.epoch
+
+def test_spool_epoch_survives_restarts_until_the_spool_is_recreated(tmp_path):
+    spool = SegmentedSpool(str(tmp_path / "spool"), 1 << 16)
+    spool.append(b"row")
+    spool.close()
+    reopened = SegmentedSpool(str(tmp_path / "spool"), 1 << 16)
+    assert reopened.epoch == spool.epoch
+    reopened.close()
+    for name in os.listdir(tmp_path / "spool"):
+        if name.endswith(".spool"):
+            os.remove(tmp_path / "spool" / name)
+    assert SegmentedSpool(str(tmp_path / "spool"), 1 << 16).epoch != spool.epoch
@@ -0,0 +1,129 @@
+import msgpack
+import redis
+
+from src.camera.live_state import (LiveStatePublisher, pack_track, read_camera_tracks, read_store_tracks,
+                                   _unpack_tracks, cameras_key, tracks_key)
+from src.core.metrics import registry
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def __getattr__(self, method):
+        return lambda *args: self.ops.append((method, *args))
+
+    def execute(self):
+        if self.client.fail:
+            self.client.fail -= 1
+            raise redis.TimeoutError("Timeout reading from socket")
+        self.client.sent.append(self.ops)
+        return [self.client.hashes.get(op[1], {}) if op[0] == "hgetall" else None for op in self.ops]
+
+class FakeRedis:
+    def __init__(self, fail=0):
+        self.fail = fail  # number of pipelines to fail before succeeding
+        self.sent = []
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hgetall(self, key):
+        return self.hashes.get(key, {})
+
+    def smembers(self, key):
+        return self.hashes.get(key, set())
+
+def _publisher(camera_id, client, max_frames=50):
+    pub = LiveStatePublisher(camera_id, max_frames=max_frames, retry_delay=0)
+    pub.client = client
+    pub._thread = object()  # driven with flush_once instead of the background thread
+    return pub
+
+def test_tracks_are_sorted_by_id_and_carry_string_ids():
+    big = (1 << 62) + 1  # beyond 2**53, where JSON numbers lose precision
+    fields = {str(big).encode(): pack_track(10.0, 20.0, 5.0, 8.0, 1.5, ["a"]),
+              b"7": pack_track(1.0, 2.0, 3.0, 4.0, 1.0, [])}
+    tracks = _unpack_tracks(3, fields, now=2.0)
+    assert [t["track_id"] for t in tracks] == ["7", str(big)]
+    assert tracks[1]["camera_id"] == 3
+    assert tracks[1]["zones"] == ["a"]
+
+def test_readers_skip_records_past_the_track_timeout():
+    client = FakeRedis()
+    client.hashes[tracks_key(1)] = {b"1": pack_track(0, 0, 1, 1, 100.0, []), b"2": pack_track(0, 0, 1, 1, 85.0, [])}
+    client.hashes[tracks_key(2)] = {b"3": pack_track(0, 0, 1, 1, 80.0, [])}
+    client.hashes[cameras_key("s1")] = {b"1", b"2"}
+    assert [t["track_id"] for t in read_camera_tracks(client, 1, now=101.0)] == ["1"]
+    assert list(read_store_tracks(client, "s1", now=101.0)) == ["1"]
+
+def test_deletions_survive_a_full_buffer():
+    client = FakeRedis()
+    pub = _publisher(11, client, max_frames=2)
+    pub.publish([("hset", tracks_key(11), 5, b"x"), ("hdel", tracks_key(11), 4), ("zrem", "occupancy:11", 4)])
+    pub.publish([("hset", tracks_key(11), 5, b"y")])
+    pub.publish([("hset", tracks_key(11), 5, b"z")])
+    assert registry.get("live_updates_dropped_total", camera=11, reason="buffer_full") == 1
+    assert pub.flush_once()
+    (ops,) = client.sent
+    assert ops[:2] == [("hset", tracks_key(11), 5, b"y"), ("hset", tracks_key(11), 5, b"z")]
+    assert sorted(ops[2:]) == [("hdel", tracks_key(11), 4), ("zrem", "occupancy:11", 4)]
+    assert registry.get("live_deletes_pending", camera=11) == 0
+
+def test_deletions_are_resent_after_a_redis_error():
+    client = FakeRedis(fail=1)
+    pub = _publisher(12, client)
+    pub.publish([("hset", tracks_key(12), 1, b"x"), ("hdel", tracks_key(12), 7)])
+    assert not pub.flush_once()
+    assert registry.get("live_updates_dropped_total", camera=12, reason="redis_error") == 1
+    assert registry.get("live_deletes_pending", camera=12) == 1
+    pub.publish([("hdel", tracks_key(12), 8)])
+    assert pub.flush_once()
+    assert client.sent == [[("hdel", tracks_key(12), 7, 8)]] or \
+        client.sent == [[("hdel", tracks_key(12), 8, 7)]]
+    assert not pub._deletes
+
+def test_send_timeout_is_bounded():
+    pub = LiveStatePublisher(13, url="redis://localhost:6379", socket_timeout=0.25)
+    kwargs = pub.client.connection_pool.connection_kwargs
+    assert kwargs["socket_timeout"] == 0.25 and kwargs["socket_connect_timeout"] == 0.25
+
+def test_failed_send_drops_frames_but_keeps_retained_ops():
+    client = FakeRedis(fail=2)
+    pub = _publisher(14, client)
+    pfadd = [("pfadd", "uv:s1:14:2025-09-01", "1"), ("expire", "uv:s1:14:2025-09-01", 60)]
+    pub.publish([("hset", tracks_key(14), 1, b"a")])
+    pub.publish(pfadd, retain=True)
+    pub.publish([("hset", tracks_key(14), 1, b"b")])
+    assert not pub.flush_once()
+    assert registry.get("live_updates_dropped_total", camera=14, reason="redis_error") == 2
+    pub.publish([("publish", "alerts:s1", "{}")], retain=True)
+    assert not pub.flush_once()
+    assert registry.get("live_updates_dropped_total", camera=14, reason="redis_error") == 2
+    assert registry.get("live_retained_ops", camera=14) == 3
+    pub.publish([("hset", tracks_key(14), 1, b"c")])
+    assert pub.flush_once()
+    assert client.sent == [pfadd + [("publish", "alerts:s1", "{}"), ("hset", tracks_key(14), 1, b"c")]]
+    assert registry.get("live_retained_ops", camera=14) == 0
+
+def test_retained_ops_published_during_a_send_are_kept():
+    client = FakeRedis()
+    pub = _publisher(15, client)
+    pub.publish([("pfadd", "k", "1")], retain=True)
+    ops, retained, deletes = pub._take()
+    pub.publish([("pfadd", "k", "2")], retain=True)  # arrives while the pipeline is in flight
+    pub._sent(retained, deletes)
+    assert pub._retained == [("pfadd", "k", "2")]
+
+def test_retained_ops_are_capped():
+    pub = _publisher(16, FakeRedis(), max_frames=1)
+    pub.max_retained = 3
+    pub.publish([("pfadd", "k", str(i)) for i in range(2)], retain=True)
+    pub.publish([("pfadd", "k", str(i)) for i in range(2, 4)], retain=True)
+    assert [op[2] for op in pub._retained] == ["0", "1", "2"]
+    assert registry.get("live_updates_dropped_total", camera=16, reason="retain_full") == 1
+    # Retained commands do not take up frame slots
+    pub.publish([("hset", tracks_key(16), 1, b"x")])
+    pub.publish([("hset", tracks_key(16), 1, b"y")])
+    assert registry.get("live_updates_dropped_total", camera=16, reason="buffer_full") == 1
@@ -0,0 +1,78 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.analytics.analytics_engine import EnhancedAnalyticsEngine
+from src.camera import processor, unique_visitors
+from src.camera.processor import EnhancedCentroidTracker, ZoneEventPipeline
+from src.database.statements import ZONE_EVENT_INSERT, ZONE_PRESENCE_UPSERT
+
+T0 = datetime(2025, 9, 1, 10, 0, tzinfo=timezone.utc)
+IN, OUT = (300.0, 100.0, 40.0, 120.0), (340.0, 100.0, 40.0, 120.0)  # OUT is the same person, past the zone edge
+
+@pytest.fixture
+def rows(store_db, monkeypatch):
+    submitted = []
+    fake = SimpleNamespace(submit=lambda sql, p: submitted.append((sql, p)))
+    monkeypatch.setattr(processor, "writer", fake)
+    monkeypatch.setattr(unique_visitors, "writer", fake)
+    with store_db.transaction() as conn:
+        conn.execute("""INSERT INTO zone_screenshots (store_id, camera_id, file_path, img_width, img_height)
+                        VALUES ('test_store', 1, 'shot.png', 640, 480)""")
+        conn.execute("""INSERT INTO zones (store_id, camera_id, name, ztype, polygon_json)
+                        VALUES ('test_store', 1, 'shelf', 'shelf', ?)""",
+                     (json.dumps([[0, 0], [320, 0], [320, 480], [0, 480]]),))
+        conn.commit()
+    return submitted
+
+def _pipeline():
+    clock = SimpleNamespace(now=T0)
+    tracker = EnhancedCentroidTracker(1, clock=lambda: clock.now.timestamp())
+    tracker.live = None
+    pipeline = ZoneEventPipeline(1, tracker=tracker, edge=False, anomalies=False, rules=False)
+
+    def step(seconds, dets):
+        clock.now = T0 + timedelta(seconds=seconds)
+        return pipeline.process(clock.now, 640, 480, dets)
+    return pipeline, step
+
+def _presence(rows):
+    return [p[4:] for sql, p in rows if sql == ZONE_PRESENCE_UPSERT]
+
+def test_interval_opens_checkpoints_and_closes(rows):
+    pipeline, step = _pipeline()
+    for t in range(0, 131):
+        step(t, [IN])
+    step(131, [OUT])
+    ts = lambda s: (T0 + timedelta(seconds=s)).isoformat()
+    assert _presence(rows) == [(ts(0), ts(0), 1, 0), (ts(0), ts(60), 61, 0), (ts(0), ts(120), 121, 0),
+                               (ts(0), ts(130), 131, 1)]
+    assert [p[3] for sql, p in rows if sql == ZONE_EVENT_INSERT] == ["enter", "exit"]
+    assert pipeline.hists[("shelf", "dwell")].count == 1
+
+def test_expired_track_closes_at_its_last_sighting(rows):
+    pipeline, step = _pipeline()
+    for t in range(0, 5):
+        step(t, [IN])
+    for t in range(5, 17):
+        step(t, [])
+    assert not pipeline.presence
+    assert _presence(rows)[-1][1:] == ((T0 + timedelta(seconds=4)).isoformat(), 5, 1)
+
+def test_presence_queries_accept_offset_bounds(rows, store_db):
+    _, step = _pipeline()
+    for t in range(0, 131):
+        step(t, [IN])
+    step(131, [OUT])
+    with store_db.transaction() as conn:
+        conn.executemany(ZONE_PRESENCE_UPSERT, [p for sql, p in rows if sql == ZONE_PRESENCE_UPSERT])
+        conn.commit()
+    engine = EnhancedAnalyticsEngine()
+    # 12:00+02:00 is 10:00 UTC, when the stay started
+    stats = engine.get_zone_dwell_stats(1, "2025-09-01T12:00:00+02:00", "2025-09-01T12:05:00+02:00")
+    assert stats["shelf"]["visits"] == 1 and stats["shelf"]["total_dwell"] == 130.0
+    occupancy = engine.get_zone_occupancy(1, "2025-09-01T12:00:00+02:00", "2025-09-01T12:05:00+02:00")
+    assert occupancy["zones"]["shelf"]["peak_occupancy"] == 1
+    assert engine.get_zone_dwell_stats(1, "2025-09-01T10:00:00+02:00", "2025-09-01T11:00:00+02:00") == {}
@@ -0,0 +1,48 @@
+import msgpack
+
+from src.camera.queue_state import QueueEstimator, QueueMonitor, read_store_queues
+
+def test_service_time_before_enough_departures():
+    q = QueueEstimator(window=300, alpha=0.5)
+    q.arrive(1, 0)
+    q.arrive(2, 5)
+    q.length = 2
+    q.depart(1, 30)
+    snap = q.snapshot(30)
+    assert snap["service_secs"] == 30
+    assert snap["wait_littles_secs"] is None
+    assert snap["expected_wait_secs"] == 60
+    # The second person waited behind the first: service runs from the previous leave
+    q.depart(2, 40)
+    assert q.service == 0.5 * 10 + 0.5 * 30
+
+def test_littles_law_once_window_has_departures():
+    q = QueueEstimator(window=60)
+    for i in range(6):
+        q.arrive(i, i * 10)
+    for i in range(3):
+        q.depart(i, 20 + i * 10)
+    q.length = 3
+    snap = q.snapshot(60)
+    assert snap["departures_per_min"] == 3.0
+    assert snap["wait_littles_secs"] == 60.0
+    assert snap["expected_wait_secs"] == 60.0
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def hgetall(self, key):
+        return self.hashes.get(key, {})
+
+def test_records_round_trip_and_go_stale():
+    m = QueueMonitor(3, publish_every=1)
+    m.set_lengths({"checkout": 2}, ["checkout", "returns"])
+    assert m.due(100)
+    (hset, key, _, _, mapping), _ = m.ops("s1", 100)
+    assert not m.due(100.5) and m.due(101)
+    r = FakeRedis()
+    r.hashes[key] = {f.encode(): v for f, v in mapping.items()}
+    r.hashes[key][b"4:old"] = msgpack.packb({"length": 1, "ts": 10})
+    rows = read_store_queues(r, "s1", now=105)
+    assert [(x["camera_id"], x["zone"], x["length"]) for x in rows] == [(3, "checkout", 2), (3, "returns", 0)]
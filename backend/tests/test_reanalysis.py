@@ -0,0 +1,46 @@
+import json
+from types import SimpleNamespace
+
+from src.analytics import reanalysis
+from src.camera import processor, unique_visitors
+from src.camera.detection_log import DetectionLogWriter
+
+DAY = 1756713600.0  # 2025-09-01T08:00:00Z
+
+def _refuse(sql, params):
+    raise AssertionError("replay used the process-wide writer")
+
+def test_replay_writes_directly_and_refreshes_daily_tables(store_db, tmp_path, monkeypatch):
+    # A spooling or ingesting processor host: the module writer must not be used
+    shared = SimpleNamespace(submit=_refuse)
+    monkeypatch.setattr(processor, "writer", shared)
+    monkeypatch.setattr(unique_visitors, "writer", shared)
+
+    zones = tmp_path / "zones.json"
+    zones.write_text(json.dumps({"img_width": 640, "img_height": 480, "zones": [
+        {"name": "shelf", "ztype": "shelf", "polygon": [[0, 0], [320, 0], [320, 480], [0, 480]]}]}))
+    log = DetectionLogWriter(str(tmp_path / "log"), 1)
+    for t in range(0, 30):
+        log.write_frame(DAY + t, 640, 480, [(11, 300.0, 100.0, 40.0, 120.0)], [0.9])
+    log.write_frame(DAY + 30, 640, 480, [(11, 340.0, 100.0, 40.0, 120.0)], [0.9])
+    log.close()
+
+    with store_db.transaction() as conn:
+        conn.execute("""INSERT INTO unique_daily (store_id, camera_id, ymd, person_id, first_seen, last_seen, total_dwell)
+                        VALUES ('test_store', 1, '2025-09-01', 999, '2025-09-01T07:00:00', '2025-09-01T07:00:00', 0)""")
+        conn.execute("""INSERT INTO daily_store_metrics (store_id, date, total_footfall, unique_visitors)
+                        VALUES ('test_store', '2025-09-01', 500, 500)""")
+        conn.commit()
+
+    result = reanalysis.reanalyze_day(1, "2025-09-01", str(tmp_path / "log"), str(zones))
+    assert result["frames"] == 31
+    assert processor.writer is shared and unique_visitors.writer is shared
+
+    with store_db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT person_id FROM unique_daily WHERE camera_id=1 AND ymd='2025-09-01'")
+        assert [r[0] for r in c.fetchall()] == [11]
+        c.execute("SELECT event_type FROM zone_events WHERE camera_id=1 ORDER BY id")
+        assert [r[0] for r in c.fetchall()] == ["enter", "exit"]
+        c.execute("SELECT total_footfall, unique_visitors FROM daily_store_metrics WHERE store_id='test_store' AND date='2025-09-01'")
+        assert c.fetchone() == (0, 1)  # recomputed from the replayed hour
@@ -0,0 +1,66 @@
+import numpy as np
+
+from src.analytics import reid_matcher
+from src.core.reid import EmbeddingIndex, color_embedding, from_bytes, to_bytes
+from src.database.statements import ZONE_EVENT_INSERT, ZONE_PRESENCE_UPSERT, TRACK_EMBEDDING_INSERT
+
+def _person(top, bottom):
+    """A 64x32 BGR crop with a shirt and trousers colour"""
+    crop = np.zeros((64, 32, 3), dtype=np.uint8)
+    crop[:32] = top
+    crop[32:] = bottom
+    return crop
+
+RED, BLUE, GREY = (0, 0, 200), (200, 0, 0), (120, 120, 120)
+
+def test_colour_embedding_separates_outfits():
+    a = color_embedding(_person(RED, BLUE))
+    assert np.isclose(np.linalg.norm(a), 1.0)
+    assert np.isclose(a @ color_embedding(_person(RED, BLUE)), 1.0)
+    assert a @ color_embedding(_person(BLUE, RED)) < 0.1
+    assert a @ color_embedding(_person(RED, GREY)) < 0.8
+    assert color_embedding(np.zeros((4, 32, 3), dtype=np.uint8)) is None
+    assert np.allclose(from_bytes(to_bytes(a)), a, atol=1e-3)
+
+def test_index_reuses_person_across_cameras():
+    idx = EmbeddingIndex(window=100, threshold=0.9, capacity=2)
+    red, blue = color_embedding(_person(RED, BLUE)), color_embedding(_person(BLUE, RED))
+    first, matched = idx.match(red, 1, 0, 10)
+    assert not matched
+    assert idx.match(red, 2, 20, 30) == (first, True)
+    other, matched = idx.match(blue, 2, 25, 40)
+    assert not matched and other != first
+    assert len(idx) == 3  # grew past its capacity
+
+def test_index_skips_concurrent_tracks_and_evicts():
+    idx = EmbeddingIndex(window=100, threshold=0.9)
+    vec = color_embedding(_person(RED, BLUE))
+    first, _ = idx.match(vec, 1, 0, 50)
+    # Same camera, appeared while the first was still visible: someone else
+    second, matched = idx.match(vec, 1, 40, 60)
+    assert not matched and second != first
+    idx.match(color_embedding(_person(GREY, GREY)), 3, 300, 310)
+    assert len(idx) == 1
+    assert idx.search(vec, 2, 400)[0] is None
+
+def test_matcher_backfills_zone_rows_of_matched_tracks(store_db, monkeypatch):
+    monkeypatch.setattr(reid_matcher, "REDIS_URL", "")
+    vec = to_bytes(color_embedding(_person(RED, BLUE)))
+    with store_db.transaction() as conn:
+        for cam, tid, entry in ((1, 101, 1000.0), (2, 202, 1100.0)):
+            conn.execute(TRACK_EMBEDDING_INSERT, ("test_store", cam, tid, f"t{tid}", entry, entry + 30, 3, vec))
+            conn.execute(ZONE_EVENT_INSERT, ("test_store", cam, "shelf", "enter", 1, tid, f"t{tid}"))
+            conn.execute(ZONE_PRESENCE_UPSERT, ("test_store", cam, "shelf", tid, f"t{tid}", f"t{tid}", 1, 1))
+        conn.execute(ZONE_EVENT_INSERT, ("test_store", 1, "shelf", "enter", 1, 303, "t303"))  # never matched
+        conn.commit()
+
+    assert reid_matcher.ReidMatcher(window=3600).run_once() == 2
+    with store_db.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT person_id, person_uuid FROM zone_events ORDER BY person_id")
+        events = dict(c.fetchall())
+        c.execute("SELECT person_id, person_uuid FROM zone_presence ORDER BY person_id")
+        presence = dict(c.fetchall())
+    # The same outfit on the next camera a minute later is the same person
+    assert events[101] and events[101] == events[202] and events[303] is None
+    assert presence == {101: events[101], 202: events[101]}
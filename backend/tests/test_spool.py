@@ -0,0 +1,68 @@
+from src.database.spool import SegmentedSpool, RECORD
+
+def _payloads(n, size=40):
+    return [bytes([i % 251]) * size for i in range(n)]
+
+def test_append_read_commit_across_segments(tmp_path):
+    spool = SegmentedSpool(str(tmp_path), segment_size=256)
+    data = _payloads(20)
+    for p in data:
+        spool.append(p, ts=1.0)
+    assert spool.pending == 20
+    assert len(spool.segments) > 1
+
+    first, end = spool.read(7)
+    assert first == data[:7]
+    spool.commit(end, len(first))
+    rest, end = spool.read(100)
+    assert rest == data[7:]
+    spool.commit(end, len(rest))
+    assert spool.pending == 0
+    assert spool.read(10)[0] == []
+    # Fully replayed segments are deleted, the last one is kept for appends
+    assert len(spool.segments) == 1
+    assert len(list(tmp_path.glob("*.spool"))) == 1
+
+def test_reopen_keeps_unreplayed_records(tmp_path):
+    spool = SegmentedSpool(str(tmp_path), segment_size=256)
+    data = _payloads(10)
+    for p in data:
+        spool.append(p)
+    spool.close()
+    reopened = SegmentedSpool(str(tmp_path), segment_size=256)
+    assert reopened.pending == 10
+    assert reopened.read(100)[0] == data
+
+def test_torn_tail_is_discarded(tmp_path):
+    spool = SegmentedSpool(str(tmp_path), segment_size=4096)
+    for p in _payloads(3):
+        spool.append(p)
+    seg = spool.segments[-1]
+    last = seg.write_pos - 40
+    seg.mm[last:last + 5] = b"\xff" * 5  # damage the payload of the last record
+    spool.close()
+    reopened = SegmentedSpool(str(tmp_path), segment_size=4096)
+    assert reopened.pending == 2
+    assert reopened.read(10)[0] == _payloads(2)
+    reopened.append(b"new")
+    assert reopened.read(10)[0] == _payloads(2) + [b"new"]
+
+def test_seek_skips_records_committed_elsewhere(tmp_path):
+    spool = SegmentedSpool(str(tmp_path), segment_size=256)
+    data = _payloads(12)
+    for p in data:
+        spool.append(p)
+    _, pos = spool.read(5)
+    spool.seek(pos)
+    assert spool.pending == 7
+    assert spool.read(100)[0] == data[5:]
+    spool.seek((0, 0))  # never moves backwards
+    assert spool.pending == 7
+
+def test_oldest_age_and_size(tmp_path):
+    spool = SegmentedSpool(str(tmp_path), segment_size=4096)
+    assert spool.oldest_age(now=100.0) == 0.0
+    spool.append(b"abc", ts=40.0)
+    spool.append(b"de", ts=90.0)
+    assert spool.oldest_age(now=100.0) == 60.0
+    assert spool.size_bytes() == 2 * RECORD.size + 5
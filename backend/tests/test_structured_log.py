@@ -0,0 +1,61 @@
+import json
+import logging
+import queue
+
+from src.core.structured_log import RateLimitFilter, ContextFilter, JsonFormatter, DroppingQueueHandler
+
+class Clock:
+    def __init__(self):
+        self.t = 0.0
+    def __call__(self):
+        return self.t
+
+def _record(msg="x", lineno=10, **extra):
+    record = logging.LogRecord("proc", logging.WARNING, "proc.py", lineno, msg, None, None)
+    for k, v in extra.items():
+        setattr(record, k, v)
+    return record
+
+def test_burst_then_one_in_n():
+    f = RateLimitFilter(burst=3, window=60, sample=5, clock=Clock())
+    passed = [i for i in range(1, 21) if f.filter(_record())]
+    assert passed == [1, 2, 3, 8, 13, 18]
+
+def test_next_passing_record_reports_suppressed_count():
+    f = RateLimitFilter(burst=1, window=60, sample=3, clock=Clock())
+    records = [_record() for _ in range(4)]
+    results = [f.filter(r) for r in records]
+    assert results == [True, False, False, True]
+    assert not hasattr(records[0], "suppressed")
+    assert records[3].suppressed == 2
+
+def test_new_window_resets_the_burst_and_carries_suppressed():
+    clock = Clock()
+    f = RateLimitFilter(burst=1, window=10, sample=100, clock=clock)
+    assert f.filter(_record()) and not f.filter(_record()) and not f.filter(_record())
+    clock.t = 10.0
+    r = _record()
+    assert f.filter(r)
+    assert r.suppressed == 2
+
+def test_keys_are_call_sites_unless_named():
+    f = RateLimitFilter(burst=1, window=60, sample=100, clock=Clock())
+    assert f.filter(_record(lineno=1)) and f.filter(_record(lineno=2))
+    assert not f.filter(_record(lineno=1))
+    assert f.filter(_record(lineno=1, key="redis")) and not f.filter(_record(lineno=2, key="redis"))
+
+def test_json_lines_carry_context_and_extra_fields():
+    record = _record("queue %s", key="q")
+    record.args = ("full",)
+    ContextFilter(camera_id=4, store_id="s1").filter(record)
+    record.frame = 100
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["msg"] == "queue full"
+    assert (entry["camera_id"], entry["store_id"], entry["frame"], entry["key"]) == (4, "s1", 100, "q")
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(_record("a"))
+    handler.handle(_record("b"))
+    assert handler.queue.qsize() == 1
+    assert handler.queue.get_nowait().getMessage() == "a"
@@ -0,0 +1,38 @@
+from src.core.track_ids import TrackIdGenerator, split, SEQ_MASK
+
+class Clock:
+    def __init__(self, t):
+        self.t = t
+    def __call__(self):
+        return self.t
+
+def test_layout_round_trips_time_slot_and_sequence():
+    clock = Clock(1700000000.123)
+    gen = TrackIdGenerator(1027, clock)
+    first, second = gen.next(), gen.next()
+    ts, slot, seq = split(first)
+    assert abs(ts - 1700000000.123) < 1e-3
+    assert slot == 1027 % 1024
+    assert seq == 0
+    assert split(second)[2] == 1
+    assert 0 < first < second < 2 ** 63
+
+def test_ids_of_different_cameras_differ_at_the_same_instant():
+    clock = Clock(1700000000.0)
+    assert TrackIdGenerator(1, clock).next() != TrackIdGenerator(2, clock).next()
+
+def test_sequence_exhaustion_borrows_the_next_millisecond():
+    clock = Clock(1700000000.0)
+    gen = TrackIdGenerator(3, clock)
+    ids = [gen.next() for _ in range(SEQ_MASK + 2)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert split(ids[-1])[0] > split(ids[0])[0]
+
+def test_clock_going_backwards_never_reuses_ids():
+    clock = Clock(1700000000.5)
+    gen = TrackIdGenerator(4, clock)
+    a = gen.next()
+    clock.t -= 10
+    b = gen.next()
+    assert b > a
@@ -0,0 +1,23 @@
+import numpy as np
+
+from src.camera import processor
+from src.camera.processor import EnhancedCentroidTracker, TRAJECTORY_MAX_POINTS
+
+def test_noisy_stationary_track_stays_bounded(monkeypatch):
+    calls = []
+    compact = processor.trajectory.compact
+    monkeypatch.setattr(processor.trajectory, "compact", lambda *a, **k: calls.append(1) or compact(*a, **k))
+    now = [0.0]
+    tracker = EnhancedCentroidTracker(1, clock=lambda: now[0])
+    tracker.live = None
+    rng = np.random.default_rng(3)
+    frames = 3 * TRAJECTORY_MAX_POINTS
+    for i in range(frames):
+        now[0] = i * 0.1
+        x, y = 300 + rng.normal(0, 3, 2)
+        (tid, *_), = tracker.update([(x, y, 40, 120)])
+    path = tracker.tracks[tid]["path"]
+    assert len(path) < 2 * TRAJECTORY_MAX_POINTS
+    # Compaction runs about once per TRAJECTORY_MAX_POINTS frames, not on every frame
+    assert 1 <= len(calls) <= frames // TRAJECTORY_MAX_POINTS
+    assert path[-1][0] == now[0]
@@ -0,0 +1,76 @@
+import numpy as np
+
+from src.core import trajectory
+
+def _walk():
+    # Walk right, pause for 5 s, walk down: the pause must survive simplification
+    t = np.arange(0, 20, 0.25)
+    x = np.where(t < 5, 100 + 20 * t, 200.0)
+    y = np.where(t < 10, 50.0, 50 + 15 * (t - 10))
+    return np.column_stack([t, x, y])
+
+def test_simplify_keeps_endpoints_and_stays_within_tolerance():
+    path = _walk()
+    simple = trajectory.simplify(path, 1.0)
+    assert len(simple) < len(path)
+    assert np.array_equal(simple[0], path[0]) and np.array_equal(simple[-1], path[-1])
+    # Synchronized distance: where the simplified path puts the person at each instant
+    x = np.interp(path[:, 0], simple[:, 0], simple[:, 1])
+    y = np.interp(path[:, 0], simple[:, 0], simple[:, 2])
+    assert np.hypot(x - path[:, 1], y - path[:, 2]).max() <= 1.0 + 1e-9
+
+def test_simplify_keeps_pauses():
+    simple = trajectory.simplify(_walk(), 1.0)
+    # The start and end of the pause are both kept although they share a position
+    at_pause = simple[(simple[:, 1] == 200.0) & (simple[:, 2] == 50.0)]
+    assert at_pause[0, 0] == 5.0 and at_pause[-1, 0] == 10.0
+
+def test_short_paths_and_zero_tolerance_are_unchanged():
+    path = _walk()
+    assert len(trajectory.simplify(path[:2], 5.0)) == 2
+    assert len(trajectory.simplify(path, 0)) == len(path)
+
+def test_encode_decode_round_trip_at_quantization():
+    path = np.array([[0.0, 10.4, 20.6], [1.26, 9.0, 400.0], [3.0, 1280.0, 0.0], [3.1, 0.0, 719.5]])
+    blob = trajectory.encode(path, (1280, 720))
+    assert trajectory.frame_size(blob) == (1280, 720)
+    out = trajectory.decode(blob)
+    assert out.shape == path.shape
+    assert np.allclose(out[:, 0], np.round(path[:, 0] * 10) / 10)
+    assert np.allclose(out[:, 1:], np.round(path[:, 1:]))
+
+def test_varints_round_trip_large_deltas():
+    values = np.array([0, 1, 127, 128, 300, 2 ** 35, 2 ** 62], dtype=np.uint64)
+    raw = np.frombuffer(trajectory._varints(values), dtype=np.uint8)
+    assert trajectory._unvarints(raw).tolist() == values.tolist()
+    signed = np.array([0, -1, 1, -(2 ** 40), 2 ** 40], dtype=np.int64)
+    assert trajectory._unzigzag(trajectory._zigzag(signed)).tolist() == signed.tolist()
+
+def test_decode_many_matches_decode():
+    paths = [_walk(), np.zeros((0, 3)), np.array([[0.0, 5.0, 5.0]]), _walk()[::3]]
+    blobs = [trajectory.encode(p) if len(p) else None for p in paths]
+    points, offsets = trajectory.decode_many(blobs)
+    assert offsets.tolist() == [0, len(paths[0]), len(paths[0]), len(paths[0]) + 1,
+                                len(paths[0]) + 1 + len(paths[3])]
+    for k, blob in enumerate(blobs):
+        assert np.array_equal(points[offsets[k]:offsets[k + 1]], trajectory.decode(blob))
+
+def test_compact_caps_a_noisy_stationary_path():
+    # Someone standing still for 20 min at 10 fps with ~3 px detection jitter
+    rng = np.random.default_rng(7)
+    t = np.arange(0, 1200, 0.1)
+    path = np.column_stack([t, 300 + rng.normal(0, 3, len(t)), 200 + rng.normal(0, 3, len(t))])
+    assert len(trajectory.simplify(path, 3.0)) > 2000
+    out = trajectory.compact(path, 3.0, 2000)
+    assert len(out) <= 2000
+    assert np.array_equal(out[0], path[0]) and np.array_equal(out[-1], path[-1])
+    assert np.all(np.diff(out[:, 0]) > 0)
+    # Paths already under the cap only get the normal simplification
+    assert np.array_equal(trajectory.compact(_walk(), 1.0, 2000), trajectory.simplify(_walk(), 1.0))
+
+def test_compact_decimates_when_tolerance_is_not_enough():
+    t = np.arange(0, 100, 0.1)
+    zigzag = np.column_stack([t, np.where(np.arange(len(t)) % 2, 0.0, 500.0), np.zeros(len(t))])
+    out = trajectory.compact(zigzag, 3.0, 50)
+    assert len(out) == 50
+    assert out[0, 0] == 0 and out[-1, 0] == zigzag[-1, 0]
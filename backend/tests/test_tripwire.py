@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.core.zone_manager import tripwire_crossings
+
+# One horizontal wire drawn left to right; "in" is downwards on screen
+A = np.array([[0.0, 100.0]])
+B = np.array([[200.0, 100.0]])
+
+def _run(path, margin=5.0):
+    """Crossings of one track along path, anchors updated as the processor does"""
+    anchors = np.full((1, 1, 2), np.nan)
+    events = []
+    for x, y in path:
+        points = np.array([[x, y]])
+        crossed, settled = tripwire_crossings(anchors, points, A, B, margin)
+        anchors[settled] = np.broadcast_to(points[:, None, :], anchors.shape)[settled]
+        events.extend(int(c) for c in crossed.ravel() if c)
+    return events
+
+def test_directed_crossings():
+    assert _run([(50, 60), (50, 90), (50, 120)]) == [1]
+    assert _run([(50, 140), (50, 80)]) == [-1]
+    assert _run([(50, 60), (50, 140), (60, 60), (70, 140)]) == [1, -1, 1]
+
+def test_jitter_inside_the_margin_is_not_counted():
+    path = [(50, 80)] + [(50, 100 + (3 if i % 2 else -3)) for i in range(20)] + [(50, 80)]
+    assert _run(path) == []
+
+def test_crossing_the_line_beyond_the_wire_is_not_counted():
+    assert _run([(300, 60), (300, 140)]) == []
+
+def test_first_position_only_anchors():
+    assert _run([(50, 140)]) == []
+
+def test_many_tracks_and_wires_in_one_pass():
+    a = np.array([[0.0, 100.0], [100.0, 0.0]])
+    b = np.array([[200.0, 100.0], [100.0, 200.0]])   # second wire drawn downwards: its right is -x
+    anchors = np.array([[[50, 60], [50, 60]], [[150, 150], [150, 150]]], dtype=np.float64)
+    points = np.array([[50.0, 150.0], [50.0, 150.0]])
+    crossed, settled = tripwire_crossings(anchors, points, a, b, 5.0)
+    assert crossed.tolist() == [[1, 0], [0, 1]]
+    crossed, _ = tripwire_crossings(points[:, None, :].repeat(2, axis=1), anchors[:, 0], a, b, 5.0)
+    assert crossed.tolist() == [[-1, 0], [0, -1]]
+    assert settled.all()
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+from src.camera.unique_hll import count_unique, day_key, expired_hours, hll_ops, window_keys
+
+def test_whole_days_and_partial_hours():
+    days, hours = window_keys("2025-09-01T22:00:00", "2025-09-03T01:30:00")
+    assert days == ["2025-09-02"]
+    assert hours == ["2025-09-01T22", "2025-09-01T23", "2025-09-03T00", "2025-09-03T01"]
+    assert window_keys("2025-09-01", "2025-09-02") == (["2025-09-01", "2025-09-02"], [])
+
+def test_aware_timestamps_are_utc_hours():
+    assert window_keys("2025-09-01T12:15:00+02:00", "2025-09-01T13:00:00Z") == \
+        ([], ["2025-09-01T10", "2025-09-01T11", "2025-09-01T12", "2025-09-01T13"])
+    # A local midnight-to-midnight day is 24 UTC hours across two dates
+    days, hours = window_keys("2025-09-01T00:00:00-05:00", "2025-09-01T23:00:00-05:00")
+    assert days == [] and hours[0] == "2025-09-01T05" and hours[-1] == "2025-09-02T04"
+    assert len(hours) == 24
+
+def test_hll_ops_target_day_and_hour():
+    ops = hll_ops("s1", 2, "t42", "2025-09-01T10")
+    assert [op[:2] for op in ops[::2]] == [("pfadd", day_key("s1", 2, "2025-09-01")), ("pfadd", "uv:s1:2:2025-09-01T10")]
+
+class FakeRedis:
+    def __init__(self):
+        self.counted = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def exists(self, key):
+        pass
+
+    def execute(self):
+        return [True] * 64
+
+    def pfcount(self, *keys):
+        self.counted.append(keys)
+        return len(keys)
+
+def test_windows_past_the_hour_key_ttl_are_flagged():
+    now = datetime(2025, 9, 20, 12, tzinfo=timezone.utc)
+    client = FakeRedis()
+    old = count_unique(client, "s1", "2025-09-01T20:00:00", "2025-09-02", [1], now=now)
+    assert old["complete"] is False and old["expired_hours"] == 4
+    assert client.counted[-1] == ("uv:s1:1:2025-09-02",)
+    recent = count_unique(client, "s1", "2025-09-18T20:00:00", "2025-09-19", [1], now=now)
+    assert recent["complete"] is True and recent["expired_hours"] == 0
+    assert len(client.counted[-1]) == 5
+    assert expired_hours(["2025-09-12T11", "2025-09-12T12"], now) == ["2025-09-12T11"]
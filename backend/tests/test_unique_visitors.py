@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.camera import unique_visitors
+from src.camera.unique_visitors import BloomFilter, DailyUniqueCache
+from src.database.statements import UNIQUE_DAILY_INSERT, UNIQUE_DAILY_UPDATE
+
+T0 = datetime(2025, 9, 1, 23, 59, tzinfo=timezone.utc)
+
+@pytest.fixture
+def rows(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(unique_visitors, "writer", SimpleNamespace(submit=lambda sql, p: submitted.append((sql, p))))
+    return submitted
+
+def test_first_sighting_inserts_and_later_ones_batch_into_updates(rows):
+    cache = DailyUniqueCache(1, update_interval=60)
+    assert cache.observe(5, T0) is True
+    assert cache.observe(5, T0 + timedelta(seconds=1), 1.0) is False
+    assert cache.observe(5, T0 + timedelta(seconds=2), 2.0) is False
+    assert [sql for sql, _ in rows] == [UNIQUE_DAILY_INSERT]
+    cache.flush()
+    assert [(sql, p[:2]) for sql, p in rows[1:]] == [(UNIQUE_DAILY_UPDATE, ((T0 + timedelta(seconds=2)).isoformat(), 2.0))]
+    cache.flush()
+    assert len(rows) == 2
+
+def test_rollover_flushes_and_counts_people_again(rows):
+    cache = DailyUniqueCache(1)
+    cache.observe(5, T0)
+    cache.observe(5, T0 + timedelta(seconds=30))
+    assert cache.observe(5, T0 + timedelta(minutes=2)) is True  # next UTC day
+    assert [sql for sql, _ in rows] == [UNIQUE_DAILY_INSERT, UNIQUE_DAILY_UPDATE, UNIQUE_DAILY_INSERT]
+    assert rows[1][1][4] == "2025-09-01" and rows[2][1][2] == "2025-09-02"
+    assert len(cache) == 1
+
+def test_switches_to_a_bloom_filter_without_forgetting_anyone(rows):
+    cache = DailyUniqueCache(1, bloom_threshold=50)
+    for pid in range(60):
+        cache.observe(pid, T0)
+    assert cache._bloom is not None
+    assert not any(cache.observe(pid, T0) for pid in range(60))
+    assert len(cache) == 60
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(i)
+    assert all(i in bloom for i in range(10000))
+    false_positives = sum(i in bloom for i in range(10000, 30000))
+    assert false_positives / 20000 < 0.02
@@ -0,0 +1,54 @@
+import numpy as np
+
+from src.core.zone_flows import ZoneFlows, merge_blobs, sum_blobs
+from src.database.statements import ZONE_FLOW_UPSERT
+
+def _flows():
+    f = ZoneFlows()
+    for zone in ("entrance", "shelf", "checkout"):
+        f.enter(1, zone)
+    for zone in ("entrance", "checkout", "entrance"):
+        f.enter(2, zone)
+    f.enter(3, "shelf")
+    f.finish_all()
+    return f
+
+def test_transitions_and_first_visit_covisits():
+    f = _flows()
+    e, s, c = (f.index[z] for z in ("entrance", "shelf", "checkout"))
+    assert f.transitions[e, s] == 1 and f.transitions[s, c] == 1
+    assert f.transitions[e, c] == 1 and f.transitions[c, e] == 1
+    assert np.diagonal(f.covisits).tolist() == [2, 2, 2]
+    assert f.covisits[e, c] == 2 and f.covisits[c, e] == 0  # track 2 returned, but not a first visit
+    assert f.symmetric_covisits()[s, c] == 1
+    assert f.tracks == 3
+
+def test_funnel():
+    steps = _flows().funnel(["entrance", "shelf", "checkout"])
+    assert [s["tracks"] for s in steps] == [2.0, 1.0, 0.5]
+    assert steps[1]["conversion_from_previous"] == 0.5
+    assert steps[2]["conversion_from_first"] == 0.25
+    assert _flows().funnel(["nowhere", "shelf"])[1]["tracks"] == 0.0
+
+def test_blobs_merge_by_zone_name():
+    a = _flows()
+    b = ZoneFlows(["checkout", "exit"])
+    b.enter(9, "checkout")
+    b.enter(9, "exit")
+    b.finish(9)
+    merged = ZoneFlows.from_bytes(merge_blobs(a.to_bytes(), b.to_bytes()))
+    assert merged.zones == ["entrance", "shelf", "checkout", "exit"]
+    assert merged.transitions[merged.index["checkout"], merged.index["exit"]] == 1
+    assert merged.covisits[merged.index["checkout"], merged.index["checkout"]] == 3
+    assert np.array_equal(sum_blobs([None, a.to_bytes()]).covisits, a.covisits)
+    assert ZoneFlows.from_bytes(None).empty
+
+def test_hourly_upsert_merges_blobs(store_db):
+    f = _flows()
+    with store_db.transaction() as conn:
+        for _ in range(2):
+            conn.execute(ZONE_FLOW_UPSERT, ("test_store", 1, "2025-09-01T10:00:00", f.tracks, f.to_bytes()))
+        conn.commit()
+        tracks, stored = conn.execute("SELECT tracks, flows FROM zone_flows").fetchone()
+    assert tracks == 6
+    assert np.array_equal(ZoneFlows.from_bytes(stored).covisits, 2 * _flows().covisits)